@@ -0,0 +1,306 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .config import settings
+from .metrics import metrics
+from .png_card import image_digest
+
+logger = logging.getLogger(__name__)
+
+# Bounding-box edge lengths (pixels) of the generated thumbnails.
+AVATAR_SIZES = (64, 128, 256, 512)
+AVATAR_FORMATS = ("png", "webp")
+PLACEHOLDER_SIZE = (512, 768)
+PLACEHOLDER_COLOR = (73, 109, 137)
+PLACEHOLDER_FONT = "arial.ttf"
+
+_DIGESTS_NAME = "digests.json"
+
+
+def default_cache_dir() -> str:
+    if settings.AVATAR_CACHE_DIR:
+        return settings.AVATAR_CACHE_DIR
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "memchat", "avatars")
+
+
+def _write_atomic(path: str, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(prefix=".avatar-", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)  # mkstemp's 0600 would hide thumbnails from a separate static file server
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def render_thumbnails(source_path: str, outputs: Sequence[Tuple[int, str, str]], webp_quality: int = 80) -> int:
+    """
+    Decodes `source_path` once and writes a thumbnail for every
+    (size, format, output path). Returns the number of files written.
+    """
+    import io
+    from PIL import Image
+
+    with Image.open(source_path) as img:
+        img.load()
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA")
+        written = 0
+        # Largest first, each resized from the previous one: cheaper than resizing the original every time.
+        current = img
+        for size, fmt, path in sorted(outputs, key=lambda o: -o[0]):
+            if max(current.size) > size:
+                current = current.copy()
+                current.thumbnail((size, size), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            if fmt == "webp":
+                current.save(buffer, "WEBP", quality=webp_quality, method=4)
+            else:
+                current.save(buffer, "PNG", optimize=False)
+            _write_atomic(path, buffer.getvalue())
+            written += 1
+    return written
+
+
+def render_placeholder(name: str, font: Optional[str] = PLACEHOLDER_FONT,
+                       size: Tuple[int, int] = PLACEHOLDER_SIZE) -> bytes:
+    """Draws the default card image (the name centered on a flat background) as PNG bytes."""
+    import io
+    from PIL import Image, ImageDraw, ImageFont
+
+    img = Image.new('RGB', size, color=PLACEHOLDER_COLOR)
+    d = ImageDraw.Draw(img)
+    try:
+        loaded = ImageFont.truetype(font, 30) if font else ImageFont.load_default()
+    except IOError:
+        loaded = ImageFont.load_default()
+    text_bbox = d.textbbox((0, 0), name, font=loaded)
+    text_width = text_bbox[2] - text_bbox[0]
+    text_height = text_bbox[3] - text_bbox[1]
+    d.text(((img.width - text_width) / 2, (img.height - text_height) / 2), name, fill=(255, 255, 255), font=loaded)
+    buffer = io.BytesIO()
+    img.convert('RGBA').save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class AvatarCache:
+    """
+    Content-addressed store of avatar derivatives. Thumbnails are keyed by
+    the image digest (see `png_card.image_digest`), so an avatar shared by
+    several cards is resized once, and live in
+    `<directory>/<dd>/<digest>/<size>.<format>`.
+
+    Lookups (`lookup`, `gallery`) only stat files and consult a persisted
+    (path, mtime, size) -> digest table, so serving cached thumbnails never
+    imports Pillow. Missing derivatives are rendered by a thread pool; Pillow
+    releases the GIL while decoding, resizing and encoding.
+
+    Args:
+        directory (str, optional): Cache root; defaults to AVATAR_CACHE_DIR.
+        sizes (tuple): Thumbnail bounding-box sizes rendered per image.
+        formats (tuple): Output formats ("png", "webp").
+        max_workers (int, optional): Rendering threads.
+    """
+
+    def __init__(self, directory: Optional[str] = None, sizes: Sequence[int] = AVATAR_SIZES,
+                 formats: Sequence[str] = AVATAR_FORMATS, max_workers: Optional[int] = None,
+                 webp_quality: int = 80):
+        self._directory = directory
+        self.sizes = tuple(sizes)
+        self.formats = tuple(formats)
+        self.max_workers = max_workers
+        self.webp_quality = webp_quality
+        self.rendered = 0
+        self.hits = 0
+        self.misses = 0
+        self._digests: Optional[Dict[str, List]] = None
+        self._digests_dirty = False
+        self._inflight: Dict[str, Future] = {}
+        self._placeholders: Dict[Tuple[str, Optional[str], Tuple[int, int]], str] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self) -> str:
+        if self._directory is None:
+            self._directory = default_cache_dir()
+        return self._directory
+
+    # --- digests ---
+
+    def _load_digests(self) -> Dict[str, List]:
+        if self._digests is None:
+            try:
+                with open(os.path.join(self.directory, _DIGESTS_NAME), 'r', encoding='utf-8') as f:
+                    self._digests = json.load(f)
+            except FileNotFoundError:
+                self._digests = {}
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Ignoring unreadable avatar digest table: {e}")
+                self._digests = {}
+        return self._digests
+
+    def digest(self, avatar_path: str) -> Optional[str]:
+        """Digest of the avatar image, recomputed only when the file changed."""
+        key = os.path.realpath(avatar_path)
+        try:
+            st = os.stat(key)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._load_digests().get(key)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry[2]
+        try:
+            digest = image_digest(key)
+        except OSError as e:
+            logger.warning(f"Could not read avatar '{avatar_path}': {e}")
+            return None
+        with self._lock:
+            self._digests[key] = [st.st_mtime_ns, st.st_size, digest]
+            self._digests_dirty = True
+        return digest
+
+    def flush(self):
+        """Persists the digest table."""
+        with self._lock:
+            if not self._digests_dirty:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            data = json.dumps(self._digests, separators=(",", ":")).encode("utf-8")
+            self._digests_dirty = False
+        _write_atomic(os.path.join(self.directory, _DIGESTS_NAME), data)
+
+    # --- derivatives ---
+
+    def path_for(self, digest: str, size: int, fmt: str = "webp") -> str:
+        return os.path.join(self.directory, digest[:2], digest, f"{size}.{fmt}")
+
+    def _missing(self, digest: str) -> List[Tuple[int, str, str]]:
+        outputs = []
+        for size in self.sizes:
+            for fmt in self.formats:
+                path = self.path_for(digest, size, fmt)
+                if not os.path.exists(path):
+                    outputs.append((size, fmt, path))
+        return outputs
+
+    def lookup(self, avatar_path: str, size: int, fmt: str = "webp") -> Optional[str]:
+        """Path of a cached thumbnail, or None if it has not been rendered yet. Never decodes images."""
+        digest = self.digest(avatar_path)
+        if digest is None:
+            return None
+        path = self.path_for(digest, size, fmt)
+        if os.path.exists(path):
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def submit(self, avatar_path: str) -> Optional[Future]:
+        """
+        Schedules rendering of every missing derivative of an avatar.
+        Returns None when all are cached; concurrent requests for the same
+        image share one job.
+        """
+        digest = self.digest(avatar_path)
+        if digest is None:
+            return None
+        with self._lock:
+            future = self._inflight.get(digest)
+            if future is not None:
+                return future
+            outputs = self._missing(digest)
+            if not outputs:
+                return None
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers or min(8, os.cpu_count() or 1),
+                                                thread_name_prefix="memchat-avatars")
+            os.makedirs(os.path.dirname(outputs[0][2]), exist_ok=True)
+            future = self._pool.submit(self._render, avatar_path, outputs)
+            self._inflight[digest] = future
+        future.add_done_callback(lambda _: self._done(digest))
+        return future
+
+    def _render(self, avatar_path: str, outputs: List[Tuple[int, str, str]]) -> int:
+        with metrics.span("avatar_render_seconds"):
+            written = render_thumbnails(avatar_path, outputs, self.webp_quality)
+        with self._lock:
+            self.rendered += written
+        return written
+
+    def _done(self, digest: str):
+        with self._lock:
+            self._inflight.pop(digest, None)
+
+    def warm(self, avatar_paths: Iterable[str], wait: bool = True) -> int:
+        """
+        Renders the missing derivatives of many avatars (deduplicated by
+        content). Returns the number of images scheduled.
+        """
+        futures = [f for f in (self.submit(p) for p in avatar_paths) if f is not None]
+        unique = {id(f): f for f in futures}
+        if wait:
+            for future in unique.values():
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning(f"Avatar rendering failed: {e}")
+        self.flush()
+        return len(unique)
+
+    def gallery(self, avatar_paths: Sequence[Optional[str]], size: int, fmt: str = "webp",
+                schedule: bool = True) -> List[Optional[str]]:
+        """
+        Thumbnail paths for a page of avatars, in order. Entries not cached
+        yet are None and (with `schedule`) rendered in the background.
+        """
+        result = []
+        for avatar_path in avatar_paths:
+            path = self.lookup(avatar_path, size, fmt) if avatar_path else None
+            if path is None and avatar_path and schedule:
+                self.submit(avatar_path)
+            result.append(path)
+        return result
+
+    # --- placeholders ---
+
+    def placeholder(self, name: str, font: Optional[str] = PLACEHOLDER_FONT,
+                    size: Tuple[int, int] = PLACEHOLDER_SIZE) -> str:
+        """Path of the placeholder card image for `name`, drawn once per (name, font, size)."""
+        key = (name, font, tuple(size))
+        path = self._placeholders.get(key)
+        if path is not None and os.path.exists(path):
+            return path
+        token = hashlib.sha256(json.dumps([name, font, list(size)]).encode("utf-8")).hexdigest()
+        path = os.path.join(self.directory, "placeholders", token[:2], f"{token}.png")
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_atomic(path, render_placeholder(name, font, size))
+        self._placeholders[key] = path
+        return path
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "rendered": self.rendered, "inflight": len(self._inflight)}
+
+    def close(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+        self.flush()
+
+
+# Shared by the card writer and the UI.
+avatar_cache = AvatarCache()
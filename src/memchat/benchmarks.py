@@ -0,0 +1,935 @@
+"""
+Benchmarks for memchat hot paths.
+
+Run with `python -m memchat.benchmarks <name>`; results are printed as JSON.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .character_system import AICharacter
+
+
+def make_synthetic_card(index: int, text_size: int = 2000, greetings: int = 0) -> Dict[str, Any]:
+    """
+    Builds a V2-style card dict. Top-level fields repeat the `data` fields,
+    as most exported cards do.
+    """
+    filler = ("{{char}} looks at {{user}} and says something about the weather. " * (text_size // 64 + 1))[:text_size]
+    name = f"Character {index}"
+    description = f"{name} description. {filler}"
+    first_mes = f"*{name} waves.* Hello {{{{user}}}}!"
+    personality = "curious, kind, talkative"
+    scenario = f"{name} meets {{{{user}}}} in a cafe."
+    mes_example = f"<START>\n{{{{user}}}}: Hi\n{{{{char}}}}: {filler[:text_size // 4]}"
+    return {
+        "name": name,
+        "description": description,
+        "first_mes": first_mes,
+        "personality": personality,
+        "scenario": scenario,
+        "mes_example": mes_example,
+        "spec": "chara_card_v2",
+        "spec_version": "2.0",
+        "data": {
+            "name": name,
+            "description": description,
+            "first_mes": first_mes,
+            "alternate_greetings": [f"Greeting {g} from {name}. {filler[:200]}" for g in range(greetings)],
+            "personality": personality,
+            "scenario": scenario,
+            "mes_example": mes_example,
+            "creator": "benchmark",
+            "extensions": {"talkativeness": "0.5", "depth_prompt": {"prompt": "", "depth": "4"}},
+            "system_prompt": "",
+            "post_history_instructions": "",
+            "creator_notes": "",
+            "character_version": "1.0",
+            "tags": ["female", "fantasy", "sfw"],
+        },
+        "metadata": {"version": 1, "tool": {"name": "airpwm", "version": "0.1", "url": ""}},
+    }
+
+
+class _LegacyCharacter:
+    """Stand-in for the pre-slots AICharacter layout: a per-instance __dict__ without string sharing."""
+
+
+def _build_legacy(card_json: str) -> _LegacyCharacter:
+    source = AICharacter()
+    source._populate_from_dict(json.loads(card_json), compact=False)
+    legacy = _LegacyCharacter()
+    legacy.__dict__.update({slot: getattr(source, slot) for slot in AICharacter.__slots__})
+    return legacy
+
+
+def _build_slotted(card_json: str) -> AICharacter:
+    return AICharacter.from_dict(json.loads(card_json))
+
+
+def _measure(builder, payloads) -> int:
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    keep = [builder(p) for p in payloads]
+    gc.collect()
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del keep
+    return end - start
+
+
+def bench_memory(count: int = 10000, text_size: int = 2000) -> Dict[str, Any]:
+    """
+    Reports resident bytes per character for the legacy dict-backed layout
+    and for the slotted, string-sharing AICharacter. Every character is built
+    from a freshly decoded JSON string, as it would be when loading a library.
+    """
+    payloads = [json.dumps(make_synthetic_card(i, text_size=text_size)) for i in range(count)]
+    legacy = _measure(_build_legacy, payloads)
+    slotted = _measure(_build_slotted, payloads)
+    return {
+        "benchmark": "memory",
+        "count": count,
+        "text_size": text_size,
+        "legacy_bytes_per_character": legacy // count,
+        "slotted_bytes_per_character": slotted // count,
+        "reduction": round(1 - slotted / legacy, 3) if legacy else None,
+    }
+
+
+def bench_embed(count: int = 20000, batch_size: int = 512, dim: int = 384) -> Dict[str, Any]:
+    """
+    Reports embedding throughput of the built-in HashingEmbedder, cold and
+    through a warm CachedEmbedder.
+    """
+    from .embeddings import CachedEmbedder, HashingEmbedder
+
+    texts = [f"Message {i}: {{{{user}}}} asks about topic {i % 97} while {{{{char}}}} answers at length."
+             for i in range(count)]
+    batches = [texts[i:i + batch_size] for i in range(0, count, batch_size)]
+
+    cached = CachedEmbedder(HashingEmbedder(dim=dim), max_entries=count)
+    start = time.perf_counter()
+    for batch in batches:
+        cached.embed(batch)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    for batch in batches:
+        cached.embed(batch)
+    warm = time.perf_counter() - start
+    return {
+        "benchmark": "embed",
+        "count": count,
+        "batch_size": batch_size,
+        "dim": dim,
+        "cold_texts_per_sec": round(count / cold, 1),
+        "cached_texts_per_sec": round(count / warm, 1),
+    }
+
+
+def bench_dedup(count: int = 20000, batch_size: int = 32, threshold: float = 0.8) -> Dict[str, Any]:
+    """
+    Feeds a repetitive synthetic memory stream through MemoryDeduper and
+    reports the dedup ratio and the per-insert overhead of the dedup layer
+    (embedding time excluded), then the batch mode on an undeduplicated copy.
+    """
+    import random
+    import shutil
+    import tempfile
+
+    from .embeddings import HashingEmbedder
+    from .memory_dedup import MemoryDeduper
+    from .memory_store import VectorMemoryStore
+
+    rng = random.Random(0)
+    facts = [f"{who} told {{{{user}}}} about the {what} near the {where}."
+             for who in ("Alice", "Bob", "Cara", "Dan", "Eve")
+             for what in ("dragon", "festival", "storm", "market", "ruins", "letter")
+             for where in ("river", "castle", "forest", "harbor")]
+    texts = []
+    for i in range(count):
+        fact = rng.choice(facts)
+        roll = rng.random()
+        if roll < 0.3:
+            texts.append(fact)
+        elif roll < 0.6:
+            texts.append(fact.replace("told", "said to") if rng.random() < 0.5 else fact + " Again.")
+        else:
+            texts.append(f"{fact} Detail {i}: " + " ".join(rng.choice(("red", "old", "tiny", "loud", "calm", "wet"))
+                                                           for _ in range(8)))
+    embedder = HashingEmbedder(dim=64)
+    vectors = embedder.embed(texts)
+
+    directory = tempfile.mkdtemp(prefix="memchat-bench-")
+    try:
+        deduper = MemoryDeduper(VectorMemoryStore(os.path.join(directory, "insert"), dim=64), threshold=threshold)
+        for i in range(0, count, batch_size):
+            deduper.add(vectors[i:i + batch_size], texts[i:i + batch_size])
+        stored = len(deduper)
+        stats = deduper.stats
+        deduper.close()
+
+        raw = VectorMemoryStore(os.path.join(directory, "batch"), dim=64)
+        raw.add(vectors, texts)
+        start = time.perf_counter()
+        batch = MemoryDeduper(raw, threshold=threshold)
+        merged = batch.dedup_existing()
+        batch_seconds = time.perf_counter() - start
+        batch.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {
+        "benchmark": "dedup",
+        "count": count,
+        "threshold": threshold,
+        "stored_rows": stored,
+        "dedup_ratio": round(stats.dedup_ratio, 3),
+        "overhead_per_insert_us": round(stats.overhead_per_insert * 1e6, 1),
+        "batch_merged": merged,
+        "batch_seconds": round(batch_seconds, 3),
+    }
+
+
+# Target serialized card sizes for the card benchmark: 1 KB up to 5 MB.
+CARD_SIZES = (1024, 64 * 1024, 1024 * 1024, 5 * 1024 * 1024)
+CARD_GREETINGS = (0, 8)
+
+
+def make_sized_card(target_bytes: int, greetings: int = 0) -> Dict[str, Any]:
+    """Synthetic card whose JSON encoding is roughly `target_bytes` long."""
+    card = make_synthetic_card(0, text_size=64, greetings=greetings)
+    overhead = len(json.dumps(card))
+    # description and mes_example (1 + 1/4 of text_size) appear at top level and in `data`
+    text_size = max(64, int((target_bytes - overhead) / 2.5))
+    return make_synthetic_card(0, text_size=text_size, greetings=greetings)
+
+
+def _time_op(fn: Callable[[], Any], min_runs: int = 3, max_runs: int = 200, min_time: float = 0.2) -> Dict[str, float]:
+    """
+    Runs `fn` once to warm up, then at least `min_runs` times and until
+    `min_time` has passed; reports per-call microseconds.
+    """
+    fn()
+    timings: List[float] = []
+    deadline = time.perf_counter() + min_time
+    while len(timings) < min_runs or (len(timings) < max_runs and time.perf_counter() < deadline):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "runs": len(timings),
+        "median_us": round(timings[len(timings) // 2] * 1e6, 1),
+        "min_us": round(timings[0] * 1e6, 1),
+    }
+
+
+def _card_cases(directory: str, target_bytes: int, greetings: int, base_png: str) -> Dict[str, Callable[[], Any]]:
+    import asyncio
+
+    from .character_system import _extract_json_from_png
+    from .main import chat_agent
+    from .providers import StubProvider
+
+    card = make_sized_card(target_bytes, greetings)
+    json_path = os.path.join(directory, f"card-{target_bytes}-{greetings}.json")
+    png_path = os.path.join(directory, f"card-{target_bytes}-{greetings}.png")
+    character = AICharacter.from_dict(card)
+    character.save_to_json(json_path)
+    character.save_to_png(png_path, base_image_path=base_png)
+    out_json = os.path.join(directory, "out.json")
+    out_png = os.path.join(directory, "out.png")
+
+    loop = asyncio.new_event_loop()
+    agent = chat_agent(character, provider=StubProvider(first_token_latency=0.0, token_latency=0.0))
+
+    def chat_turn():
+        loop.run_until_complete(agent.reply("Tell me about the weather today."))
+        # keep the history at a steady size so later turns measure the same work
+        del agent.messages[1:]
+
+    cases = {
+        "load_from_file_json": lambda: AICharacter.load_from_file(json_path),
+        "load_from_file_png": lambda: AICharacter.load_from_file(png_path),
+        "extract_json_from_png": lambda: _extract_json_from_png(png_path),
+        "save_to_json": lambda: character.save_to_json(out_json),
+        "save_to_png": lambda: character.save_to_png(out_png, base_image_path=base_png),
+        "to_dict": character.to_dict,
+        "get_initial_llm_message": lambda: character.get_initial_llm_message("User"),
+        "get_initial_llm_message_uncached": lambda: AICharacter.from_dict(card).get_initial_llm_message("User"),
+        "chat_turn": chat_turn,
+    }
+    cases["_close"] = loop.close
+    return cases
+
+
+def bench_cards(sizes: Sequence[int] = CARD_SIZES, greetings: Sequence[int] = CARD_GREETINGS,
+                min_time: float = 0.2, baseline: Optional[Dict[str, Any]] = None,
+                tolerance: float = 0.25, min_delta_us: float = 50.0) -> Dict[str, Any]:
+    """
+    Times card I/O, prompt building and a chat turn against the stub provider
+    on synthetic JSON and PNG cards of each size, with and without alternate
+    greetings. With a `baseline` (a previous result of this benchmark), cases
+    whose median got slower by more than `tolerance` (and by at least
+    `min_delta_us`) are reported as regressions.
+    """
+    import logging
+    import shutil
+    import tempfile
+
+    from PIL import Image
+
+    # Oversized cards overflow the context budget on every turn; keep the warnings out of the timings.
+    memchat_logger = logging.getLogger("memchat")
+    level = memchat_logger.level
+    memchat_logger.setLevel(logging.ERROR)
+    directory = tempfile.mkdtemp(prefix="memchat-bench-")
+    timings: Dict[str, Dict[str, Any]] = {}
+    try:
+        base_png = os.path.join(directory, "base.png")
+        Image.new("RGBA", (400, 600), (73, 109, 137, 255)).save(base_png)
+        for target_bytes in sizes:
+            for count in greetings:
+                cases = _card_cases(directory, target_bytes, count, base_png)
+                close = cases.pop("_close")
+                card_bytes = len(json.dumps(make_sized_card(target_bytes, count)).encode('utf-8'))
+                try:
+                    for op, fn in cases.items():
+                        result = _time_op(fn, min_time=min_time)
+                        result["card_bytes"] = card_bytes
+                        timings[f"{op}/{target_bytes}/greetings={count}"] = result
+                finally:
+                    close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+        memchat_logger.setLevel(level)
+
+    result: Dict[str, Any] = {"benchmark": "cards", "python": sys.version.split()[0], "timings": timings}
+    if baseline is not None:
+        result.update(compare_timings(timings, baseline.get("timings", {}), tolerance, min_delta_us))
+    return result
+
+
+def compare_timings(current: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+                    tolerance: float = 0.25, min_delta_us: float = 50.0) -> Dict[str, Any]:
+    """
+    Compares per-case median timings with a baseline.
+
+    Returns:
+        dict: `regressions` and `improvements` (case, baseline and current
+            medians, ratio), cases missing from the baseline, and `ok`.
+    """
+    regressions, improvements, new_cases = [], [], []
+    for case, timing in current.items():
+        before = baseline.get(case)
+        if before is None:
+            new_cases.append(case)
+            continue
+        old, new = before["median_us"], timing["median_us"]
+        entry = {"case": case, "baseline_us": old, "current_us": new, "ratio": round(new / old, 3) if old else None}
+        if new > old * (1 + tolerance) and new - old >= min_delta_us:
+            regressions.append(entry)
+        elif new < old / (1 + tolerance) and old - new >= min_delta_us:
+            improvements.append(entry)
+    return {
+        "tolerance": tolerance,
+        "regressions": regressions,
+        "improvements": improvements,
+        "new_cases": new_cases,
+        "ok": not regressions,
+    }
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _percentiles(values: List[float], points=(50, 95, 99), unit: str = "ms") -> Dict[str, float]:
+    if not values:
+        return {}
+    values = sorted(values)
+    scale = {"ms": 1e3, "us": 1e6}[unit]
+    return {f"p{p}_{unit}": round(values[min(len(values) - 1, len(values) * p // 100)] * scale, 1) for p in points}
+
+
+def bench_server(idle_sessions: int = 2000, active_sessions: int = 200, turns: int = 5,
+                 first_token_latency: float = 0.05, token_latency: float = 0.005) -> Dict[str, Any]:
+    """
+    Load-tests the chat server in-process against the stub provider: opens
+    `idle_sessions` sessions that stay idle, then `active_sessions` clients
+    that each stream `turns` replies over HTTP (server-sent events) on their
+    own keep-alive connection. Reports session memory, reply latency
+    percentiles, throughput and errors.
+    """
+    import asyncio
+    import shutil
+    import tempfile
+
+    from .providers import StubProvider
+    from .providers.http import HTTPConnectionPool
+    from .server import ChatServer
+
+    directory = tempfile.mkdtemp(prefix="memchat-bench-")
+    AICharacter.from_dict(make_synthetic_card(0)).save_to_json(os.path.join(directory, "character.json"))
+    create_body = json.dumps({"character": "character.json", "user_name": "Load"}).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+
+    async def create(pool: HTTPConnectionPool) -> str:
+        response = await pool.request("POST", "/sessions", headers, create_body)
+        body = await response.read()
+        if response.status != 201:
+            raise RuntimeError(f"session create failed: {response.status} {body[:200]!r}")
+        return json.loads(body)["session_id"]
+
+    async def client(url: str, index: int, ttft: List[float], latency: List[float], errors: List[str]):
+        pool = HTTPConnectionPool(url, max_idle=1)
+        try:
+            session_id = await create(pool)
+            for turn in range(turns):
+                body = json.dumps({"content": f"Client {index} turn {turn}: how was your day?", "stream": True})
+                start = time.perf_counter()
+                first = None
+                response = await pool.request("POST", f"/sessions/{session_id}/messages", headers, body.encode())
+                async for line in response.iter_lines():
+                    if first is None and line.startswith("data:"):
+                        first = time.perf_counter()
+                    elif line.startswith("event:") and line != "event: done":
+                        errors.append(line)
+                if response.status != 200 or first is None:
+                    errors.append(f"status {response.status}")
+                    continue
+                ttft.append(first - start)
+                latency.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+        finally:
+            await pool.aclose()
+
+    async def main() -> Dict[str, Any]:
+        provider = StubProvider(first_token_latency=first_token_latency, token_latency=token_latency,
+                                max_concurrency=max(16, active_sessions))
+        server = ChatServer(directory, provider=provider, max_sessions=idle_sessions + active_sessions + 16)
+        host, port = await server.start("127.0.0.1", 0)
+        url = f"http://{host}:{port}"
+
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        pools = [HTTPConnectionPool(url, max_idle=1) for _ in range(min(64, max(1, idle_sessions)))]
+        for offset in range(0, idle_sessions, len(pools)):
+            await asyncio.gather(*(create(pool) for pool in pools[:idle_sessions - offset]))
+        create_seconds = time.perf_counter() - start
+        for pool in pools:
+            await pool.aclose()
+        rss_idle = _rss_bytes()
+
+        ttft: List[float] = []
+        latency: List[float] = []
+        errors: List[str] = []
+        start = time.perf_counter()
+        await asyncio.gather(*(client(url, i, ttft, latency, errors) for i in range(active_sessions)))
+        active_seconds = time.perf_counter() - start
+
+        sessions = len(server.sessions)
+        await server.shutdown()
+        return {
+            "benchmark": "server",
+            "idle_sessions": idle_sessions,
+            "active_sessions": active_sessions,
+            "turns_per_session": turns,
+            "sessions_open": sessions,
+            "sessions_created_per_sec": round(idle_sessions / create_seconds, 1) if idle_sessions else None,
+            "rss_bytes_per_idle_session": ((rss_idle - rss_before) // idle_sessions
+                                           if idle_sessions and rss_before is not None else None),
+            "turns_completed": len(latency),
+            "turns_per_sec": round(len(latency) / active_seconds, 1),
+            "time_to_first_chunk": _percentiles(ttft),
+            "reply_latency": _percentiles(latency),
+            "errors": len(errors),
+            "error_samples": errors[:5],
+            "ok": not errors,
+        }
+
+    import logging
+    memchat_logger = logging.getLogger("memchat")
+    level = memchat_logger.level
+    memchat_logger.setLevel(logging.ERROR)
+    try:
+        return asyncio.run(main())
+    finally:
+        memchat_logger.setLevel(level)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+_GALLERY_PROBE = """
+import json, sys, time
+from memchat.avatars import AvatarCache
+paths = json.loads(sys.argv[1])
+cache = AvatarCache({directory!r})
+start = time.perf_counter()
+page = cache.gallery(paths, {size}, schedule=False)
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "served": sum(p is not None for p in page), "pil": "PIL" in sys.modules}}))
+"""
+
+
+def bench_avatars(cards: int = 1000, unique_images: int = 100, page: int = 200, size: int = 128) -> Dict[str, Any]:
+    """
+    Builds `cards` PNG cards sharing `unique_images` distinct avatars, renders
+    all thumbnails through AvatarCache, then serves a gallery page from the
+    cache in a fresh interpreter and checks that Pillow was not imported.
+    """
+    import random
+    import shutil
+    import subprocess
+    import tempfile
+
+    from PIL import Image
+
+    from .avatars import AvatarCache
+
+    rng = random.Random(0)
+    directory = tempfile.mkdtemp(prefix="memchat-bench-")
+    try:
+        bases = []
+        for i in range(unique_images):
+            base = os.path.join(directory, f"base-{i}.png")
+            Image.frombytes("RGB", (256, 384), rng.randbytes(256 * 384 * 3)).resize((512, 768)).save(base)
+            bases.append(base)
+        paths = []
+        for i in range(cards):
+            path = os.path.join(directory, f"card-{i}.png")
+            AICharacter.from_dict(make_synthetic_card(i)).save_to_png(path, base_image_path=bases[i % unique_images])
+            paths.append(path)
+
+        cache = AvatarCache(os.path.join(directory, "cache"))
+        start = time.perf_counter()
+        scheduled = cache.warm(paths)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        cache.warm(paths)
+        warm = time.perf_counter() - start
+        cache.close()
+
+        probe = _GALLERY_PROBE.format(directory=os.path.join(directory, "cache"), size=size)
+        out = subprocess.run([sys.executable, "-c", probe, json.dumps(paths[:page])],
+                             capture_output=True, text=True, check=True)
+        gallery = json.loads(out.stdout)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {
+        "benchmark": "avatars",
+        "cards": cards,
+        "unique_images": unique_images,
+        "images_rendered": scheduled,
+        "thumbnails_written": cache.rendered,
+        "cold_seconds": round(cold, 3),
+        "warm_seconds": round(warm, 4),
+        "gallery_page": page,
+        "gallery_served": gallery["served"],
+        "gallery_ms": round(gallery["seconds"] * 1000, 2),
+        "gallery_imported_pillow": gallery["pil"],
+        "ok": gallery["served"] == min(page, cards) and not gallery["pil"],
+    }
+
+
+def bench_llm_cache(conversations: int = 50, turns: int = 10, first_token_latency: float = 0.05,
+                    token_latency: float = 0.002) -> Dict[str, Any]:
+    """
+    Records `conversations` chat_agent conversations against the stub
+    provider through a CachingProvider, then replays them in offline mode.
+    Reports per-turn time for both passes, the cache lookup latency and
+    whether every replayed reply matched its recording chunk for chunk.
+    """
+    import asyncio
+    import shutil
+    import tempfile
+
+    from .main import chat_agent
+    from .providers import CacheMissError, CachingProvider, ResponseCache, StubProvider
+
+    character = AICharacter.from_dict(make_synthetic_card(0))
+    directory = tempfile.mkdtemp(prefix="memchat-bench-")
+
+    async def play(provider: CachingProvider) -> List[List[str]]:
+        replies = []
+        for c in range(conversations):
+            agent = chat_agent(character, provider=provider, session=f"c{c}")
+            for t in range(turns):
+                chunks = [chunk async for chunk in agent.send(f"Conversation {c}, turn {t}: what happens next?")]
+                replies.append(chunks)
+        return replies
+
+    try:
+        cache = ResponseCache(os.path.join(directory, "responses.sqlite3"))
+        stub = StubProvider(first_token_latency=first_token_latency, token_latency=token_latency)
+        start = time.perf_counter()
+        recorded = asyncio.run(play(CachingProvider(stub, cache)))
+        record_seconds = time.perf_counter() - start
+
+        offline = CachingProvider(StubProvider(), cache, mode="offline")
+        start = time.perf_counter()
+        replayed = asyncio.run(play(offline))
+        replay_seconds = time.perf_counter() - start
+        cache.flush()
+
+        lookups = []
+        for key in cache.keys():
+            t0 = time.perf_counter()
+            cache.get(key)
+            lookups.append(time.perf_counter() - t0)
+
+        try:
+            asyncio.run(offline.complete([{"role": "user", "content": "never recorded"}]))
+            strict = False
+        except CacheMissError:
+            strict = True
+        stats = cache.stats()
+        cache.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    total = conversations * turns
+    lookup_us = _percentiles(lookups, unit="us")
+    return {
+        "benchmark": "llm_cache",
+        "turns": total,
+        "entries": stats["entries"],
+        "bytes": stats["bytes"],
+        "record_ms_per_turn": round(record_seconds / total * 1000, 3),
+        "replay_ms_per_turn": round(replay_seconds / total * 1000, 3),
+        "lookup": lookup_us,
+        "replay_identical": recorded == replayed,
+        "offline_miss_raises": strict,
+        "ok": recorded == replayed and strict and lookup_us.get("p99_us", 0) < 1000,
+    }
+
+
+# Imported only by code paths that need them; `import memchat.main` must not pull them in.
+HEAVY_MODULES = ("PIL", "numpy", "dotenv")
+
+_IMPORT_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def bench_import(runs: int = 5, budget_ms: float = 300.0, module: str = "memchat.main") -> Dict[str, Any]:
+    """
+    Measures the cold import time of `memchat.main` in fresh interpreters
+    (without DEBUG_MODE or API keys set) and checks it against a budget.
+    Also fails if a heavy optional dependency was imported.
+    """
+    import subprocess
+
+    env = {k: v for k, v in os.environ.items() if k not in ("DEBUG_MODE", "PYTHONDONTWRITEBYTECODE")}
+    probe = _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+    timings = []
+    heavy = set()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", probe], env=env, capture_output=True, text=True, check=True)
+        elapsed, _, loaded = out.stdout.strip().partition(" ")
+        timings.append(float(elapsed) * 1000)
+        heavy.update(m for m in loaded.split(",") if m)
+    timings.sort()
+    best = timings[0]
+    return {
+        "benchmark": "import",
+        "module": module,
+        "runs": runs,
+        "best_ms": round(best, 1),
+        "median_ms": round(timings[len(timings) // 2], 1),
+        "budget_ms": budget_ms,
+        "heavy_modules_loaded": sorted(heavy),
+        "ok": best <= budget_ms and not heavy,
+    }
+
+
+def bench_vectors(count: int = 1_000_000, dim: int = 384, queries: int = 200, k: int = 8,
+                  budget_ms: float = 10.0, min_recall: float = 0.9, exact_queries: int = 50) -> Dict[str, Any]:
+    """
+    Builds a VectorMemoryStore of `count` clustered synthetic embeddings and
+    measures single-query search latency through the index, unfiltered and
+    with a broad and a selective session filter, against the exact scan.
+    Passes when the indexed p50 is within `budget_ms` and recall@k against
+    the exact results is at least `min_recall`.
+    """
+    import shutil
+    import tempfile
+
+    import numpy as np
+
+    from .memory_store import VectorMemoryStore
+
+    rng = np.random.default_rng(0)
+    # About a hundred memories per topic; a memory's cosine to others on its topic is around 0.7.
+    centers = rng.standard_normal((max(16, count // 100), dim)).astype(np.float32)
+    batch = 65536
+    sessions = [f"s{i}" for i in range(100)]
+    directory = tempfile.mkdtemp(prefix="memchat-bench-")
+    try:
+        store = VectorMemoryStore(directory, dim=dim)
+        start = time.perf_counter()
+        for i in range(0, count, batch):
+            n = min(batch, count - i)
+            vectors = centers[rng.integers(0, len(centers), n)] + 0.6 * rng.standard_normal((n, dim), dtype=np.float32)
+            # The first batch is one session (the selective filter); later batches rotate over the others.
+            session = sessions[0] if i == 0 else sessions[1 + (i // batch) % 99]
+            store.add(vectors, [f"memory {j}" for j in range(i, i + n)], session=session)
+        store.flush()
+        build_seconds = time.perf_counter() - start
+
+        rows = rng.integers(0, count, queries)
+        probes = np.asarray(store.vectors[np.sort(rows)], dtype=np.float32)
+        probes += 0.3 * rng.standard_normal(probes.shape, dtype=np.float32) / np.sqrt(dim)
+
+        def run(**filters):
+            timings, results = [], []
+            for q in probes:
+                t = time.perf_counter()
+                results.append([h.index for h in store.search(q, k, with_records=False, **filters)[0]])
+                timings.append(time.perf_counter() - t)
+            return timings, results
+
+        run()  # warm-up: fault in the freshly written index
+        indexed_ms, indexed = run()
+        exact_ms, hits = [], 0
+        for qi in range(min(exact_queries, queries)):
+            t = time.perf_counter()
+            exact = store.search(probes[qi], k, with_records=False, exact=True)[0]
+            exact_ms.append(time.perf_counter() - t)
+            hits += len({h.index for h in exact} & set(indexed[qi]))
+        recall = hits / (k * min(exact_queries, queries))
+        broad_ms, _ = run(session=sessions[1:51])
+        selective_ms, _ = run(session=sessions[0])
+        indexed_rows = store._ivf.count if store._ivf is not None else 0
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    indexed_p = _percentiles(indexed_ms)
+    return {
+        "benchmark": "vectors",
+        "count": count,
+        "dim": dim,
+        "k": k,
+        "indexed_rows": indexed_rows,
+        "build_seconds": round(build_seconds, 1),
+        "exact_ms": _percentiles(exact_ms),
+        "indexed_ms": indexed_p,
+        "broad_filter_ms": _percentiles(broad_ms),
+        "selective_filter_ms": _percentiles(selective_ms),
+        "recall_at_k": round(recall, 3),
+        "budget_ms": budget_ms,
+        "ok": indexed_p["p50_ms"] <= budget_ms and recall >= min_recall,
+    }
+
+
+def bench_library(cards: int = 20000, text_size: int = 2000, greetings: int = 4, workers: Optional[int] = None,
+                  warm_budget_s: float = 5.0) -> Dict[str, Any]:
+    """
+    Writes a library of synthetic cards (half PNG, half JSON) and times a
+    cold scan without a manifest, a warm restart (a new CharacterLibrary
+    over the same manifest) and a rescan after 1% of the cards changed.
+    Passes when the warm restart re-parses nothing and stays within
+    `warm_budget_s`.
+    """
+    import base64
+    import shutil
+    import struct
+    import tempfile
+    import zlib
+
+    from .library import CharacterLibrary, MANIFEST_NAME
+    from .png_card import _make_chunk, write_card_to_png
+
+    directory = tempfile.mkdtemp(prefix="memchat-bench-")
+    try:
+        root = os.path.join(directory, "library")
+        os.makedirs(root)
+        base_png = os.path.join(directory, "base.png")
+        with open(base_png, "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n" + _make_chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 6, 0, 0, 0))
+                    + _make_chunk(b"IDAT", zlib.compress(b"\x00" * 5)) + _make_chunk(b"IEND", b""))
+
+        def write_card(i: int, text: int):
+            card = make_synthetic_card(i, text_size=text, greetings=greetings)
+            path = os.path.join(root, f"{i // 1000:03d}", f"card{i}")
+            if i % 2:
+                payload = base64.b64encode(json.dumps(card).encode("utf-8")).decode("ascii")
+                write_card_to_png(base_png, path + ".png", payload)
+            else:
+                with open(path + ".json", "w", encoding="utf-8") as f:
+                    json.dump(card, f)
+
+        for i in range(cards):
+            if i % 1000 == 0:
+                os.makedirs(os.path.join(root, f"{i // 1000:03d}"))
+            write_card(i, text_size)
+        card_bytes = sum(os.path.getsize(os.path.join(d, n)) for d, _, names in os.walk(root) for n in names)
+
+        library = CharacterLibrary(root, max_workers=workers)
+        cold = library.scan()
+        library.close()
+        manifest_bytes = os.path.getsize(os.path.join(root, MANIFEST_NAME))
+
+        library = CharacterLibrary(root, max_workers=workers)
+        warm = library.scan()
+        start = time.perf_counter()
+        listed = list(library.characters(lazy=True))
+        list_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for character in listed[:100]:
+            character.materialize()
+        materialize_us = (time.perf_counter() - start) * 1e6 / max(1, min(100, len(listed)))
+        library.close()
+
+        for i in range(0, cards, 100):
+            write_card(i, text_size + 1)
+        library = CharacterLibrary(root, max_workers=workers)
+        changed = library.scan()
+        library.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {
+        "benchmark": "library",
+        "cards": cards,
+        "card_bytes": card_bytes,
+        "manifest_bytes": manifest_bytes,
+        "manifest_bytes_per_card": manifest_bytes // max(1, cards),
+        "cold": cold.summary(),
+        "warm_restart": warm.summary(),
+        "changed_1pct": changed.summary(),
+        "lazy_list_cards_per_sec": round(len(listed) / list_seconds, 1) if list_seconds > 0 else 0.0,
+        "materialize_us": round(materialize_us, 1),
+        "warm_budget_s": warm_budget_s,
+        "ok": not cold.failed and warm.parsed == 0 and warm.elapsed <= warm_budget_s,
+    }
+
+
+BENCHMARKS = {
+    "memory": bench_memory,
+    "embed": bench_embed,
+    "dedup": bench_dedup,
+    "import": bench_import,
+    "cards": bench_cards,
+    "server": bench_server,
+    "avatars": bench_avatars,
+    "llm_cache": bench_llm_cache,
+    "vectors": bench_vectors,
+    "library": bench_library,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m memchat.benchmarks")
+    sub = parser.add_subparsers(dest="name", required=True)
+
+    memory = sub.add_parser("memory", help="bytes per resident AICharacter")
+    memory.add_argument("--count", type=int, default=10000)
+    memory.add_argument("--text-size", type=int, default=2000)
+
+    embed = sub.add_parser("embed", help="embedding throughput in texts/sec")
+    embed.add_argument("--count", type=int, default=20000)
+    embed.add_argument("--batch-size", type=int, default=512)
+    embed.add_argument("--dim", type=int, default=384)
+
+    dedup = sub.add_parser("dedup", help="near-duplicate memory ratio and per-insert overhead")
+    dedup.add_argument("--count", type=int, default=20000)
+    dedup.add_argument("--batch-size", type=int, default=32)
+    dedup.add_argument("--threshold", type=float, default=0.8)
+
+    imports = sub.add_parser("import", help="cold import time of memchat.main against a budget")
+    imports.add_argument("--runs", type=int, default=5)
+    imports.add_argument("--budget-ms", type=float, default=300.0)
+
+    cards = sub.add_parser("cards", help="card I/O, prompt building and chat turn latency")
+    cards.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")], default=list(CARD_SIZES),
+                       help="comma-separated target card sizes in bytes")
+    cards.add_argument("--greetings", type=lambda v: [int(x) for x in v.split(",")], default=list(CARD_GREETINGS))
+    cards.add_argument("--min-time", type=float, default=0.2, help="seconds spent per case")
+    cards.add_argument("--baseline", help="result file of an earlier run to compare against")
+    cards.add_argument("--save", help="also write the result to this file (e.g. a new baseline)")
+    cards.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    cards.add_argument("--min-delta-us", type=float, default=50.0, help="ignore slowdowns smaller than this")
+
+    server = sub.add_parser("server", help="load generator for the chat server against the stub provider")
+    server.add_argument("--idle-sessions", type=int, default=2000)
+    server.add_argument("--active-sessions", type=int, default=200)
+    server.add_argument("--turns", type=int, default=5)
+    server.add_argument("--first-token-latency", type=float, default=0.05)
+    server.add_argument("--token-latency", type=float, default=0.005)
+
+    avatars = sub.add_parser("avatars", help="thumbnail rendering and cached gallery serving")
+    avatars.add_argument("--cards", type=int, default=1000)
+    avatars.add_argument("--unique-images", type=int, default=100)
+    avatars.add_argument("--page", type=int, default=200)
+    avatars.add_argument("--size", type=int, default=128)
+
+    llm_cache = sub.add_parser("llm_cache", help="record/replay through the LLM response cache")
+    llm_cache.add_argument("--conversations", type=int, default=50)
+    llm_cache.add_argument("--turns", type=int, default=10)
+    llm_cache.add_argument("--first-token-latency", type=float, default=0.05)
+    llm_cache.add_argument("--token-latency", type=float, default=0.002)
+
+    vectors = sub.add_parser("vectors", help="memory search latency and recall at a million vectors")
+    vectors.add_argument("--count", type=int, default=1_000_000)
+    vectors.add_argument("--dim", type=int, default=384)
+    vectors.add_argument("--queries", type=int, default=200)
+    vectors.add_argument("--k", type=int, default=8)
+    vectors.add_argument("--budget-ms", type=float, default=10.0)
+
+    library = sub.add_parser("library", help="cold and warm library scan throughput in cards/sec")
+    library.add_argument("--cards", type=int, default=20000)
+    library.add_argument("--text-size", type=int, default=2000)
+    library.add_argument("--greetings", type=int, default=4)
+    library.add_argument("--workers", type=int, default=None)
+    library.add_argument("--warm-budget-s", type=float, default=5.0)
+
+    args = parser.parse_args(argv)
+    if args.name == "memory":
+        result = bench_memory(args.count, args.text_size)
+    elif args.name == "embed":
+        result = bench_embed(args.count, args.batch_size, args.dim)
+    elif args.name == "dedup":
+        result = bench_dedup(args.count, args.batch_size, args.threshold)
+    elif args.name == "import":
+        result = bench_import(args.runs, args.budget_ms)
+    elif args.name == "cards":
+        baseline = None
+        if args.baseline:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        result = bench_cards(args.sizes, args.greetings, args.min_time, baseline, args.tolerance, args.min_delta_us)
+        if args.save:
+            with open(args.save, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+    elif args.name == "llm_cache":
+        result = bench_llm_cache(args.conversations, args.turns, args.first_token_latency, args.token_latency)
+    elif args.name == "avatars":
+        result = bench_avatars(args.cards, args.unique_images, args.page, args.size)
+    elif args.name == "library":
+        result = bench_library(args.cards, args.text_size, args.greetings, args.workers, args.warm_budget_s)
+    elif args.name == "vectors":
+        result = bench_vectors(args.count, args.dim, args.queries, args.k, args.budget_ms)
+    elif args.name == "server":
+        result = bench_server(args.idle_sessions, args.active_sessions, args.turns,
+                              args.first_token_latency, args.token_latency)
+    json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    if result.get("ok") is False:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
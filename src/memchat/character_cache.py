@@ -0,0 +1,220 @@
+import os
+import sys
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from .character_system import AICharacter
+
+logger = logging.getLogger(__name__)
+
+
+def _deep_size(value: Any) -> int:
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(k) + _deep_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_deep_size(v) for v in value)
+    return size
+
+
+def estimate_size(character: AICharacter) -> int:
+    """Approximate bytes held by a character (strings shared with other objects are counted too)."""
+    size = sys.getsizeof(character)
+    for attr in AICharacter.__slots__:
+        if attr[0] == '_':
+            continue
+        try:
+            size += _deep_size(object.__getattribute__(character, attr))
+        except AttributeError:
+            pass
+    return size
+
+
+@dataclass
+class _Entry:
+    character: AICharacter
+    signature: Tuple[int, int]
+    size: int
+
+
+class CharacterCache:
+    """
+    Process-wide cache of parsed character cards, keyed by resolved path and
+    validated against the file's (mtime, size) on every lookup, so an edited
+    card is re-read on the next `get`.
+
+    Callers get a copy (`AICharacter.copy()`) of the cached character: copies
+    share the card text, and one session's edits never reach the cache or
+    other sessions. Concurrent misses for the same path parse the file once.
+
+    Args:
+        max_bytes (int): Memory bound (estimated) before LRU eviction.
+        max_entries (int, optional): Upper bound on cached characters.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, max_entries: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.bytes = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._loading: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watch = threading.Event()
+
+    @staticmethod
+    def _signature(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def get(self, file_path: str, avatar_path: Optional[str] = None, copy: bool = True) -> Optional[AICharacter]:
+        """
+        Returns the character stored at `file_path`, loading it on a miss.
+        With `copy=False` the shared cached instance is returned; treat it as
+        read-only.
+        """
+        key = os.path.realpath(file_path)
+        while True:
+            signature = self._signature(key)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry.signature == signature:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        character = entry.character
+                        break
+                    self._drop(key)
+                    self.invalidations += 1
+                if signature is None:
+                    self.misses += 1
+                    return AICharacter.load_from_file(file_path, avatar_path=avatar_path)
+                loading = self._loading.get(key)
+                if loading is None:
+                    self._loading[key] = threading.Event()
+                    self.misses += 1
+            if loading is not None:
+                # Another thread is parsing this card; use its result.
+                loading.wait()
+                continue
+            try:
+                character = self._load(key, file_path, signature)
+            finally:
+                with self._lock:
+                    self._loading.pop(key).set()
+            if character is None:
+                return None
+            break
+
+        if avatar_path and character.avatar_path != avatar_path:
+            character = character.copy()
+            character.avatar_path = avatar_path
+            return character
+        return character.copy() if copy else character
+
+    def _load(self, key: str, file_path: str, signature: Tuple[int, int]) -> Optional[AICharacter]:
+        character = AICharacter.load_from_file(file_path)
+        if character is None:
+            return None
+        character.materialize()
+        # A write that raced with the parse would be cached under the old signature.
+        if self._signature(key) != signature:
+            return character
+        size = estimate_size(character)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = _Entry(character, signature, size)
+            self.bytes += size
+            self._evict()
+        return character
+
+    def _drop(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+        return entry
+
+    def _evict(self):
+        while self._entries and (self.bytes > self.max_bytes or
+                                 (self.max_entries is not None and len(self._entries) > self.max_entries)):
+            key, entry = self._entries.popitem(last=False)
+            self.bytes -= entry.size
+            self.evictions += 1
+            logger.debug("Evicted character %s from cache", key)
+
+    def invalidate(self, file_path: Optional[str] = None):
+        """Forgets one card, or every card when no path is given."""
+        with self._lock:
+            if file_path is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self.bytes = 0
+            elif self._drop(os.path.realpath(file_path)) is not None:
+                self.invalidations += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, file_path: str) -> bool:
+        return os.path.realpath(file_path) in self._entries
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    # --- file watching ---
+
+    def watch(self, interval: float = 2.0):
+        """
+        Starts a daemon thread that re-stats cached cards every `interval`
+        seconds and drops changed or deleted ones, so memory is released
+        without waiting for the next lookup.
+        """
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop_watch.clear()
+        self._watcher = threading.Thread(target=self._watch_loop, args=(interval,),
+                                         name="memchat-character-watch", daemon=True)
+        self._watcher.start()
+
+    def stop_watch(self):
+        self._stop_watch.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch_loop(self, interval: float):
+        while not self._stop_watch.wait(interval):
+            with self._lock:
+                snapshot = [(key, entry.signature) for key, entry in self._entries.items()]
+            for key, signature in snapshot:
+                if self._signature(key) != signature:
+                    with self._lock:
+                        entry = self._entries.get(key)
+                        if entry is not None and entry.signature == signature:
+                            self._drop(key)
+                            self.invalidations += 1
+                            logger.debug("Card changed on disk, dropped from cache: %s", key)
+
+
+# Shared by every session in the process.
+character_cache = CharacterCache()
@@ -1,22 +1,117 @@
+import io
 import json
 import base64
-from PIL import Image, ImageDraw, ImageFont, PngImagePlugin
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Optional, Tuple
 import os
+import sys
 import time
 import random
+import hashlib
 import logging
 
+from .avatars import avatar_cache, render_placeholder
+from .metrics import metrics
+from .prompt_template import compile_template, compile_template_cached, render_cache
+from .png_card import (
+    PngFormatError, is_png_file, locate_card_json, read_card_chunk_at, read_card_json, write_card_to_png,
+)
+
 logger = logging.getLogger(__name__)
 
+# Card fields that repeat across a library (spec ids, defaults, tool names);
+# interning them lets every character share one string object.
+_INTERNED_FIELDS = (
+    'spec', 'spec_version', 'data_creator', 'alt_creator',
+    'data_extensions_talkativeness', 'alt_extensions_talkativeness',
+    'data_extensions_depth_prompt_depth', 'alt_extensions_depth_prompt_depth',
+    'data_character_version', 'alt_character_version',
+    'metadata_tool_name', 'metadata_tool_version', 'metadata_tool_url',
+)
+_MAX_INTERN_LENGTH = 64
+
+# Long text fields that lazily loaded cards leave undecoded until first access.
+_LAZY_FIELDS = (
+    'description', 'first_mes', 'personality', 'scenario', 'mes_example',
+    'data_description', 'data_first_mes', 'data_alternate_greetings', 'data_personality',
+    'data_scenario', 'data_mes_example', 'data_extensions_depth_prompt_prompt',
+    'data_system_prompt', 'data_post_history_instructions', 'data_creator_notes',
+    'alt_description', 'alt_first_mes', 'alt_alternate_greetings', 'alt_personality',
+    'alt_scenario', 'alt_mes_example', 'alt_extensions_depth_prompt_prompt',
+    'alt_system_prompt', 'alt_post_history_instructions', 'alt_creator_notes',
+    'data_character_book',
+)
+_LAZY_FIELD_SET = frozenset(_LAZY_FIELDS)
+# Where the lazy fields live in a card dict.
+_LAZY_CARD_PATHS = (
+    ('description',), ('first_mes',), ('personality',), ('scenario',), ('mes_example',),
+    ('data', 'description'), ('data', 'first_mes'), ('data', 'alternate_greetings'), ('data', 'personality'),
+    ('data', 'scenario'), ('data', 'mes_example'), ('data', 'extensions', 'depth_prompt', 'prompt'),
+    ('data', 'system_prompt'), ('data', 'post_history_instructions'), ('data', 'creator_notes'),
+    ('data', 'character_book'),
+    ('alternative', 'description_alt'), ('alternative', 'first_mes_alt'), ('alternative', 'alternate_greetings_alt'),
+    ('alternative', 'personality_alt'), ('alternative', 'scenario_alt'), ('alternative', 'mes_example_alt'),
+    ('alternative', 'extensions_alt', 'depth_prompt_alt', 'prompt_alt'), ('alternative', 'system_prompt_alt'),
+    ('alternative', 'post_history_instructions_alt'), ('alternative', 'creator_notes_alt'),
+)
+
+# Fields present at the top level and again under `data`/`alternative`.
+_SHARED_TEXT_FIELDS = ('name', 'description', 'first_mes', 'personality', 'scenario', 'mes_example')
+
+# Called as hook(character, path, card_dict) after every successful save_to_json/save_to_png.
+_save_hooks: List[Callable[['AICharacter', str, Dict[str, Any]], None]] = []
+
+
+def strip_lazy_fields(card: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy of a card dict without the long text fields that lazy characters
+    leave on disk. Nested dicts are copied only where a field is removed.
+    """
+    light = dict(card)
+    copied = {id(light)}
+    for path in _LAZY_CARD_PATHS:
+        parent = light
+        for key in path[:-1]:
+            child = parent.get(key)
+            if not isinstance(child, dict):
+                break
+            if id(child) not in copied:
+                child = parent[key] = dict(child)
+                copied.add(id(child))
+            parent = child
+        else:
+            parent.pop(path[-1], None)
+    return light
+
+
+def register_save_hook(hook: Callable[['AICharacter', str, Dict[str, Any]], None]):
+    if hook not in _save_hooks:
+        _save_hooks.append(hook)
+
+
+def unregister_save_hook(hook: Callable[['AICharacter', str, Dict[str, Any]], None]):
+    if hook in _save_hooks:
+        _save_hooks.remove(hook)
 
+
+def _run_save_hooks(character: 'AICharacter', path: str, card: Dict[str, Any]):
+    for hook in list(_save_hooks):
+        try:
+            hook(character, path, card)
+        except Exception as e:
+            logger.error(f"Save hook {hook!r} failed for '{path}': {e}")
+
+
+@metrics.timed("card_png_extract_seconds")
 def _extract_json_from_png(image_path: str) -> Optional[Dict[str, Any]]:
-    logger.debug(f"Attempting to extract JSON from PNG: {image_path}")
+    logger.debug("Attempting to extract JSON from PNG: %s", image_path)
+    from PIL import Image  # Pillow is only needed for this fallback reader
+
     try:
         img = Image.open(image_path)
         character_data_str = None
 
-        logger.debug(f"Image info: {img.info}")
+        # Only the keys: the values hold the whole (base64) card.
+        logger.debug("PNG text chunks: %s", img.info.keys())
 
         if hasattr(img, 'text') and isinstance(img.text, dict) and 'chara' in img.text:
             logger.debug("Found 'chara' in img.text")
@@ -26,7 +121,7 @@ def _extract_json_from_png(image_path: str) -> Optional[Dict[str, Any]]:
                 character_data_str = decoded_data_bytes.decode('utf-8')
                 logger.debug("Successfully decoded 'chara' from img.text (base64)")
             except Exception as e:
-                logger.debug(f"Error decoding 'chara' from img.text (base64): {e}")
+                logger.debug("Error decoding 'chara' from img.text (base64): %s", e)
                 if isinstance(encoded_data, str):
                     try:
                         json.loads(encoded_data)
@@ -44,7 +139,7 @@ def _extract_json_from_png(image_path: str) -> Optional[Dict[str, Any]]:
                 character_data_str = decoded_data_bytes.decode('utf-8')
                 logger.debug("Successfully decoded 'chara' from img.info (base64)")
             except Exception as e:
-                logger.debug(f"Error decoding 'chara' from img.info (base64): {e}")
+                logger.debug("Error decoding 'chara' from img.info (base64): %s", e)
                 if isinstance(encoded_data, str):
                     try:
                         json.loads(encoded_data)
@@ -63,13 +158,13 @@ def _extract_json_from_png(image_path: str) -> Optional[Dict[str, Any]]:
                         decoded_bytes = base64.b64decode(value)
                         json.loads(decoded_bytes.decode('utf-8'))
                         character_data_str = decoded_bytes.decode('utf-8')
-                        logger.debug(f"Found and decoded JSON from img.text key '{key}' (base64)")
+                        logger.debug("Found and decoded JSON from img.text key '%s' (base64)", key)
                         break
                     except Exception:
                         try:
                             json.loads(value)
                             character_data_str = value
-                            logger.debug(f"Found and loaded JSON from img.text key '{key}' (direct JSON)")
+                            logger.debug("Found and loaded JSON from img.text key '%s' (direct JSON)", key)
                             break
                         except json.JSONDecodeError:
                             continue
@@ -83,7 +178,7 @@ def _extract_json_from_png(image_path: str) -> Optional[Dict[str, Any]]:
                 logger.debug("Successfully parsed JSON data.")
                 return parsed_data
             except json.JSONDecodeError as e:
-                logger.debug(f"JSONDecodeError: Could not parse character data string: {e}")
+                logger.debug("JSONDecodeError: Could not parse character data string: %s", e)
                 return None
         else:
             logger.debug("No character data string found in PNG.")
@@ -97,8 +192,67 @@ def _extract_json_from_png(image_path: str) -> Optional[Dict[str, Any]]:
         return None
 
 
+class _CardFileSource:
+    """Re-reads a card from disk, straight from its text chunk when the file is unchanged."""
+    __slots__ = ('path', 'size', 'mtime_ns', 'chunk_offset', 'chunk_length', 'chunk_type')
+
+    def __init__(self, path: str, chunk_offset: Optional[int] = None, chunk_length: int = 0, chunk_type: bytes = b""):
+        self.path = path
+        try:
+            st = os.stat(path)
+            self.size, self.mtime_ns = st.st_size, st.st_mtime_ns
+        except OSError:
+            self.size, self.mtime_ns = -1, -1
+        self.chunk_offset = chunk_offset
+        self.chunk_length = chunk_length
+        self.chunk_type = chunk_type
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if self.chunk_offset is not None:
+            try:
+                st = os.stat(self.path)
+                if (st.st_size, st.st_mtime_ns) == (self.size, self.mtime_ns):
+                    return read_card_chunk_at(self.path, self.chunk_offset, self.chunk_length, self.chunk_type)
+            except (OSError, PngFormatError) as e:
+                logger.debug("Card chunk moved in %s, rescanning: %s", self.path, e)
+        if self.path.lower().endswith(".png"):
+            return read_card_json(self.path)
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+class _RawCardSource:
+    """Keeps the encoded card JSON; used when there is no file to go back to."""
+    __slots__ = ('raw',)
+
+    def __init__(self, char_dict: Dict[str, Any]):
+        self.raw = json.dumps(char_dict, ensure_ascii=False).encode('utf-8')
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        return json.loads(self.raw)
+
+
 class AICharacter:
+    # Slots instead of a per-instance __dict__: large libraries keep 100k+ of these resident.
+    __slots__ = (
+        'name', 'description', 'first_mes', 'personality', 'scenario', 'mes_example', 'spec',
+        'spec_version', 'data_name', 'data_description', 'data_first_mes',
+        'data_alternate_greetings', 'data_personality', 'data_scenario', 'data_mes_example',
+        'data_creator', 'data_extensions_talkativeness', 'data_extensions_depth_prompt_prompt',
+        'data_extensions_depth_prompt_depth', 'data_system_prompt',
+        'data_post_history_instructions', 'data_creator_notes', 'data_character_version',
+        'data_tags', 'data_character_book', 'alt_name', 'alt_description', 'alt_first_mes', 'alt_alternate_greetings',
+        'alt_personality', 'alt_scenario', 'alt_mes_example', 'alt_creator',
+        'alt_extensions_talkativeness', 'alt_extensions_depth_prompt_prompt',
+        'alt_extensions_depth_prompt_depth', 'alt_system_prompt', 'alt_post_history_instructions',
+        'alt_creator_notes', 'alt_character_version', 'alt_tags', 'misc_rentry', 'misc_rentry_alt',
+        'metadata_version', 'metadata_created', 'metadata_modified', 'metadata_source',
+        'metadata_tool_name', 'metadata_tool_version', 'metadata_tool_url', 'avatar_path',
+        '_lazy_source', '_templates',
+    )
+
     def __init__(self):
+        self._templates: Optional[Any] = None
         self.name: str = ""
         self.description: str = ""
         self.first_mes: str = ""
@@ -123,6 +277,7 @@ class AICharacter:
         self.data_creator_notes: str = ""
         self.data_character_version: str = "0.1"
         self.data_tags: List[str] = []
+        self.data_character_book: Optional[Dict[str, Any]] = None
         self.alt_name: str = ""
         self.alt_description: str = ""
         self.alt_first_mes: str = ""
@@ -149,6 +304,21 @@ class AICharacter:
         self.metadata_tool_version: str = "0.1"
         self.metadata_tool_url: str = ""
         self.avatar_path: Optional[str] = None
+        self._lazy_source: Optional[Any] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = {}
+        for attr in self.__slots__:
+            try:
+                state[attr] = object.__getattribute__(self, attr)
+            except AttributeError:
+                continue  # not yet loaded field of a lazy card
+        state['_templates'] = None  # recompiled on demand
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        for attr, value in state.items():
+            object.__setattr__(self, attr, value)
 
     def _update_metadata_timestamps(self):
         current_time_ms = int(time.time() * 1000)
@@ -156,7 +326,34 @@ class AICharacter:
         if not self.metadata_created:
             self.metadata_created = current_time_ms
 
-    def _populate_from_dict(self, char_dict: Dict[str, Any]):
+    def _share_strings(self):
+        """
+        Interns low-cardinality values and makes identical top-level, `data_*`
+        and `alt_*` strings point at one object, so duplicated card text is
+        only stored once.
+        """
+        for attr in _INTERNED_FIELDS:
+            value = getattr(self, attr)
+            if type(value) is str and len(value) <= _MAX_INTERN_LENGTH:
+                setattr(self, attr, sys.intern(value))
+        for attr in ('data_tags', 'alt_tags'):
+            tags = getattr(self, attr)
+            if isinstance(tags, list):
+                tags[:] = [sys.intern(t) if type(t) is str and len(t) <= _MAX_INTERN_LENGTH else t for t in tags]
+
+        for field in _SHARED_TEXT_FIELDS:
+            top = getattr(self, field)
+            data_attr, alt_attr = 'data_' + field, 'alt_' + field
+            data_value = getattr(self, data_attr)
+            if data_value is not top and data_value == top:
+                setattr(self, data_attr, top)
+                data_value = top
+            alt_value = getattr(self, alt_attr)
+            if alt_value and alt_value is not data_value and alt_value == data_value:
+                setattr(self, alt_attr, data_value)
+
+    @metrics.timed("card_parse_seconds")
+    def _populate_from_dict(self, char_dict: Dict[str, Any], compact: bool = True):
         self.name = char_dict.get("name", self.name)
         self.description = char_dict.get("description", self.description)
         self.first_mes = char_dict.get("first_mes", self.first_mes)
@@ -185,6 +382,7 @@ class AICharacter:
         self.data_creator_notes = data_block.get("creator_notes", self.data_creator_notes)
         self.data_character_version = data_block.get("character_version", self.data_character_version)
         self.data_tags = data_block.get("tags", self.data_tags)
+        self.data_character_book = data_block.get("character_book", self.data_character_book)
 
         alt_block = char_dict.get("alternative", {})
         self.alt_name = alt_block.get("name_alt", self.alt_name)
@@ -227,23 +425,140 @@ class AICharacter:
         if not self.scenario and self.data_scenario: self.scenario = self.data_scenario
         if not self.mes_example and self.data_mes_example: self.mes_example = self.data_mes_example
 
+        if compact:
+            self._share_strings()
+
+    def __getattr__(self, name: str):
+        # Only reached for unset slots, i.e. the heavy fields of a lazy card.
+        if name in _LAZY_FIELD_SET and self._lazy_source is not None:
+            self.materialize()
+            return object.__getattribute__(self, name)
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    @property
+    def is_lazy(self) -> bool:
+        return self._lazy_source is not None
+
+    def _make_lazy(self, source: Any):
+        for attr in _LAZY_FIELDS:
+            object.__delattr__(self, attr)
+        self._lazy_source = source
+
+    def materialize(self) -> 'AICharacter':
+        """
+        Decodes every field a lazy card left out. Fields assigned since the
+        card was loaded are kept. A no-op for fully loaded characters.
+        """
+        source = self._lazy_source
+        if source is None:
+            return self
+        self._lazy_source = None
+        char_dict = None
+        try:
+            char_dict = source.load()
+        except Exception as e:
+            logger.error(f"Could not re-read lazily loaded card: {e}")
+        if char_dict is None:
+            logger.error("Lazily loaded card is no longer readable; text fields fall back to defaults.")
+            char_dict = {}
+
+        full = AICharacter()
+        full._populate_from_dict(char_dict)
+        for attr in _LAZY_FIELDS:
+            try:
+                object.__getattribute__(self, attr)
+            except AttributeError:
+                setattr(self, attr, getattr(full, attr))
+        return self
+
+    def copy(self) -> 'AICharacter':
+        """
+        Returns an independent copy for one session. Strings are shared (they
+        are immutable) and lists are copied, so edits on either side stay
+        local; compiled prompt templates and rendered prompts are shared
+        while the text stays the same.
+        `data_character_book` is shared: replace it instead of editing it
+        in place. Lazy cards stay lazy.
+        """
+        clone = type(self).__new__(type(self))
+        for attr in self.__slots__:
+            try:
+                value = object.__getattribute__(self, attr)
+            except AttributeError:
+                continue  # not yet loaded field of a lazy card
+            if type(value) is list:
+                value = list(value)
+            object.__setattr__(clone, attr, value)
+        return clone
+
+    @classmethod
+    def from_dict(cls, char_dict: Dict[str, Any], avatar_path: Optional[str] = None,
+                  lazy: bool = False, source_path: Optional[str] = None,
+                  source_chunk: Optional[Tuple[int, int, bytes]] = None) -> 'AICharacter':
+        """
+        Builds a character from a card dict.
+
+        Args:
+            lazy (bool): Keep only the light fields (name, tags, creator, ...)
+                and decode the long text fields on first access.
+            source_path (str, optional): Card file to re-read the text fields
+                from in lazy mode. Without it the encoded JSON is kept instead.
+                `char_dict` then only needs the light fields (see `strip_lazy_fields`).
+            source_chunk (tuple, optional): (offset, length, chunk_type) of
+                the card's text chunk in a PNG `source_path`, as found by
+                `png_card.find_card_chunk`; saves walking the file.
+        """
+        character = cls()
+        character._populate_from_dict(char_dict)
+        character.avatar_path = avatar_path
+        if lazy:
+            if source_path and source_chunk is not None:
+                source = _CardFileSource(source_path, *source_chunk)
+            elif source_path:
+                source = _CardFileSource(source_path)
+            else:
+                source = _RawCardSource(char_dict)
+            character._make_lazy(source)
+        return character
+
     @classmethod
-    def load_from_file(cls, file_path: str, avatar_path: Optional[str] = None) -> Optional['AICharacter']:
-        logger.debug(f"Attempting to load character from file: {file_path}")
+    @metrics.timed("card_load_seconds")
+    def load_from_file(cls, file_path: str, avatar_path: Optional[str] = None, use_pillow: bool = False,
+                       lazy: bool = False) -> Optional['AICharacter']:
+        """
+        Loads a character from a PNG card or a JSON file.
+
+        Args:
+            lazy (bool): Decode only the fields needed for listing and
+                searching (name, tags, creator, avatar path); the long text
+                fields are re-read from the file on first access, or all at
+                once with `materialize()`.
+        """
+        logger.debug("Attempting to load character from file: %s", file_path)
         if not os.path.exists(file_path):
             logger.error(f"Error: Character file not found at specified path: {file_path}")
             return None
 
         char_dict: Optional[Dict[str, Any]] = None
+        lazy_source = None
         file_path_lower = file_path.lower()
         if file_path_lower.endswith(".png"):
-            char_dict = _extract_json_from_png(file_path)
+            if use_pillow:
+                char_dict = _extract_json_from_png(file_path)
+            else:
+                located = locate_card_json(file_path)
+                if located:
+                    chunk, char_dict = located
+                    if lazy:
+                        lazy_source = _CardFileSource(file_path, chunk.offset, chunk.length, chunk.chunk_type)
             if char_dict is None:
                 logger.error(f"Failed to extract valid character JSON from PNG file: {file_path}")
         elif file_path_lower.endswith(".json"):
             try:
                 with open(file_path, 'r', encoding='utf-8') as f:
                     char_dict = json.load(f)
+                if lazy:
+                    lazy_source = _CardFileSource(file_path)
             except FileNotFoundError:
                 logger.error(f"Error: JSON file not found at {file_path}")
                 return None
@@ -260,6 +575,8 @@ class AICharacter:
         character = cls()
         if char_dict:
             character._populate_from_dict(char_dict)
+            if lazy:
+                character._make_lazy(lazy_source or _RawCardSource(char_dict))
         
         if avatar_path:
             character.avatar_path = avatar_path
@@ -279,7 +596,7 @@ class AICharacter:
         data_scenario = self.data_scenario if self.data_scenario else self.scenario
         data_mes_example = self.data_mes_example if self.data_mes_example else self.mes_example
         
-        return {
+        card = {
             "name": self.name,
             "description": self.description,
             "first_mes": self.first_mes,
@@ -348,15 +665,22 @@ class AICharacter:
                 }
             }
         }
+        if self.data_character_book is not None:
+            card["data"]["character_book"] = self.data_character_book
+        return card
 
+    @metrics.timed("card_save_seconds", format="json")
     def save_to_json(self, output_json_path: str):
         self._update_metadata_timestamps()
+        char_data_dict = self.to_dict()
         with open(output_json_path, 'w', encoding='utf-8') as f:
-            json.dump(self.to_dict(), f, indent=4, ensure_ascii=False)
+            json.dump(char_data_dict, f, indent=4, ensure_ascii=False)
         logger.info(f"Character data saved to {output_json_path}")
+        _run_save_hooks(self, output_json_path, char_data_dict)
         
         
 
+    @metrics.timed("card_save_seconds", format="png")
     def save_to_png(self, output_png_path: str, base_image_path: Optional[str] = None):
         self._update_metadata_timestamps()
         try:
@@ -366,36 +690,45 @@ class AICharacter:
 
             img = None
             resolved_base_path = base_image_path
+            candidate_paths = []
 
             if resolved_base_path and os.path.exists(resolved_base_path):
+                candidate_paths.append(resolved_base_path)
+            if self.avatar_path and not self.avatar_path.startswith(('http://', 'https://')):
+                if os.path.exists(self.avatar_path):
+                    candidate_paths.append(self.avatar_path)
+
+            if not candidate_paths:
+                # The placeholder is drawn once per name and reused from the avatar cache.
+                try:
+                    candidate_paths.append(avatar_cache.placeholder(self.name if self.name else "Character Card"))
+                except OSError as e:
+                    logger.warning(f"Could not cache placeholder image: {e}")
+
+            # Metadata-only path: copy the base PNG's chunks and swap the card text. Only the
+            # preferred image qualifies; a non-PNG explicit base is re-encoded, not replaced by the avatar.
+            if candidate_paths and is_png_file(candidate_paths[0]):
                 try:
-                    img = Image.open(resolved_base_path)
+                    write_card_to_png(candidate_paths[0], output_png_path, base64_encoded_data)
+                    logger.info(f"Character data successfully embedded and saved to {output_png_path}")
+                    _run_save_hooks(self, output_png_path, char_data_dict)
+                    return
                 except Exception as e:
-                    logger.warning(f"Could not open provided base image '{resolved_base_path}': {e}.")
-                    img = None
+                    logger.warning(f"Could not copy the chunks of '{candidate_paths[0]}': {e}. Re-encoding image.")
 
-            if img is None and self.avatar_path and not self.avatar_path.startswith(('http://', 'https://')):
-                if os.path.exists(self.avatar_path):
-                    try:
-                        img = Image.open(self.avatar_path)
-                    except Exception as e:
-                        logger.warning(f"Could not open avatar_path '{self.avatar_path}': {e}.")
-                        img = None
+            # Re-encoding needs Pillow; the metadata-only path above does not.
+            from PIL import Image, PngImagePlugin
 
-            if img is None:
-                img = Image.new('RGB', (512, 768), color = (73, 109, 137))
-                d = ImageDraw.Draw(img)
+            for candidate in candidate_paths:
                 try:
-                    font = ImageFont.truetype("arial.ttf", 30)
-                except IOError:
-                    font = ImageFont.load_default()
-                text = self.name if self.name else "Character Card"
-                text_bbox = d.textbbox((0,0), text, font=font)
-                text_width = text_bbox[2] - text_bbox[0]
-                text_height = text_bbox[3] - text_bbox[1]
-                text_x = (img.width - text_width) / 2
-                text_y = (img.height - text_height) / 2
-                d.text((text_x, text_y), text, fill=(255,255,255), font=font)
+                    img = Image.open(candidate)
+                    break
+                except Exception as e:
+                    logger.warning(f"Could not open base image '{candidate}': {e}.")
+                    img = None
+
+            if img is None:
+                img = Image.open(io.BytesIO(render_placeholder(self.name if self.name else "Character Card")))
             
             if img.mode not in ['RGB', 'RGBA']:
                  img = img.convert('RGBA')
@@ -406,6 +739,7 @@ class AICharacter:
             png_info.add_text('chara', base64_encoded_data)
             img.save(output_png_path, "PNG", pnginfo=png_info)
             logger.info(f"Character data successfully embedded and saved to {output_png_path}")
+            _run_save_hooks(self, output_png_path, char_data_dict)
             
 
         except FileNotFoundError as e:
@@ -433,34 +767,54 @@ class AICharacter:
                  starter line, and the character's first message, with {{user}}
                  and {{char}} placeholders replaced.
         """
+        self.materialize()
+        content_key, context_template, greeting_templates = self._compiled_prompt_templates()
+
+        greeting_index = 0
+        if pick_greeting is True:
+            greeting_index = random.randrange(len(greeting_templates))
+        elif isinstance(pick_greeting, int) and pick_greeting > 0:
+            if 0 < pick_greeting < len(greeting_templates):
+                greeting_index = pick_greeting
+            # else, it falls back to the default first message
+
+        context_block = self._render_template(context_template, content_key, 'context', user_name)
+        chosen_first_message = self._render_template(greeting_templates[greeting_index], content_key,
+                                                     greeting_index, user_name)
+        return context_block, chosen_first_message
+
+    def _template_signature(self) -> tuple:
+        # Every field the prompt templates are built from; equal signatures mean equal text.
+        return (self.name, self.data_name, self.description, self.data_description, self.personality,
+                self.data_personality, self.scenario, self.data_scenario, self.mes_example,
+                self.data_mes_example, self.first_mes, self.data_first_mes,
+                tuple(self.data_alternate_greetings or ()))
+
+    def _compiled_prompt_templates(self):
+        """
+        Builds and compiles the context block and greetings once per distinct
+        card text; later calls only render them. The cache is checked against
+        the current field values, so assignments and in-place list edits both
+        invalidate it.
+
+        Returns:
+            tuple: (content key, context template, greeting templates). The
+                content key identifies the text for the shared render cache.
+        """
+        signature = self._template_signature()
+        cached = self._templates
+        if cached is not None and cached[0] == signature:
+            return cached[1], cached[2], cached[3]
+
         char_name = self.data_name if self.data_name else self.name
         description = self.data_description if self.data_description else self.description
-
-        
         personality = self.data_personality if self.data_personality else self.personality
         scenario = self.data_scenario if self.data_scenario else self.scenario
         mes_example = self.data_mes_example if self.data_mes_example else self.mes_example
 
-        
-        chosen_first_message = self.data_first_mes if self.data_first_mes else self.first_mes
-        if not chosen_first_message:
-            chosen_first_message = f"Hello, I am {char_name}."
-
-
-        if pick_greeting is True:
-            options = []
-            if chosen_first_message: 
-                options.append(chosen_first_message)
-            if self.data_alternate_greetings:
-                options.extend(self.data_alternate_greetings)
-            
-            if options: 
-                chosen_first_message = random.choice(options)
-
-        elif isinstance(pick_greeting, int) and pick_greeting > 0:
-            if self.data_alternate_greetings and 0 < pick_greeting <= len(self.data_alternate_greetings):
-                chosen_first_message = self.data_alternate_greetings[pick_greeting - 1]
-            # else, it falls back to the default chosen_first_message already set
+        first_message = self.data_first_mes if self.data_first_mes else self.first_mes
+        if not first_message:
+            first_message = f"Hello, I am {char_name}."
 
         # --- context string ---
         context_parts = []
@@ -472,26 +826,50 @@ class AICharacter:
             context_parts.append(f"Scenario: {scenario}")
         if mes_example:
             context_parts.append(f"Example Messages:\n{mes_example}")
-        
+
         context_block = "[Character Context]\n---\n"
         if context_parts:
             context_block += "\n\n".join(context_parts) + "\n---\n\n"
         else:
             context_block += "No specific context provided.\n---\n\n"
 
-        # conversation_begins_line = "--- Conversation between {{char}} and {{user}} has begun ---\n\n"
-        # final_string = context_block + conversation_begins_line + chosen_first_message
-        # final_string = self.parse_names(user_name, final_string)
-        # return final_string
-        context_block = self.parse_names(user_name, context_block)
-        chosen_first_message = self.parse_names(user_name, chosen_first_message)
-        return context_block, chosen_first_message
+        # greetings[0] is the default first message, greetings[n] the n-th alternate greeting.
+        greetings = [compile_template(first_message)]
+        greetings.extend(compile_template(g) for g in (self.data_alternate_greetings or []))
+        context_template = compile_template(context_block)
+
+        digest = hashlib.blake2b(digest_size=16)
+        for text in [self.name, context_block, first_message] + [t.source for t in greetings[1:]]:
+            digest.update(text.encode('utf-8', 'surrogatepass'))
+            digest.update(b"\0")
+        content_key = digest.digest()
+        self._templates = (signature, content_key, context_template, greetings)
+        return content_key, context_template, greetings
 
-    def parse_names(self, user_name: str, text: str):
+    def _macro_context(self, user_name: str, original: str = "") -> Dict[str, str]:
+        return {
+            "char": self.name if self.name else "Character",
+            "user": user_name if user_name else "User",
+            "original": original,
+        }
 
-        text = text.replace("{{char}}", self.name if self.name else "Character")
-        text = text.replace("{{user}}", user_name if user_name else "User")
-        return text
+    def _render_template(self, template, content_key: bytes, part: Any, user_name: str) -> str:
+        if not template.is_static:
+            return template.render(self._macro_context(user_name))
+        key = (content_key, part, user_name)
+        rendered = render_cache.get(key)
+        if rendered is None:
+            rendered = template.render(self._macro_context(user_name))
+            render_cache.put(key, rendered)
+        return rendered
+
+    def parse_names(self, user_name: str, text: str, original: str = ""):
+        """
+        Renders the macros of card text. `original` is what {{original}}
+        expands to: the prompt the card field overrides (e.g. the app's
+        default system prompt for `system_prompt`).
+        """
+        return compile_template_cached(text).render(self._macro_context(user_name, original))
 
 
     def get_system_prompt(self) -> str|None:
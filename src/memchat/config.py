@@ -2,14 +2,101 @@
 
 
 import os
-from dotenv import load_dotenv
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
 
-load_dotenv()
 
-DEBUG_MODE = True if os.getenv("DEBUG_MODE").lower() == "true" else False
+def _parse_bool(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
 
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+def _parse_str(value: str) -> Optional[str]:
+    return value or None
 
+
+def _parse_int(value: str) -> int:
+    return int(value.strip())
+
+
+# name -> (default, parser for the environment string)
+SETTINGS: Dict[str, Tuple[Any, Callable[[str], Any]]] = {
+    "DEBUG_MODE": (False, _parse_bool),
+
+    "OPENAI_API_KEY": (None, _parse_str),
+    "DEEPSEEK_API_KEY": (None, _parse_str),
+    "GEMINI_API_KEY": (None, _parse_str),
+
+    "LLM_PROVIDER": (None, _parse_str),
+    "LLM_MODEL": (None, _parse_str),
+    # Record/replay provider responses in this SQLite file (see providers.cache).
+    "LLM_CACHE_PATH": (None, _parse_str),
+    # "readwrite", "offline" (fail on cache misses) or "refresh".
+    "LLM_CACHE_MODE": ("readwrite", _parse_str),
+
+    # App defaults that card `system_prompt` / `post_history_instructions` override;
+    # {{original}} in those card fields expands to them.
+    "SYSTEM_PROMPT": (None, _parse_str),
+    "POST_HISTORY_INSTRUCTIONS": (None, _parse_str),
+
+    # Thumbnails and placeholder avatars; defaults to $XDG_CACHE_HOME/memchat/avatars.
+    "AVATAR_CACHE_DIR": (None, _parse_str),
+
+    # Instrumentation (see memchat.metrics). Metrics are only recorded when enabled.
+    "METRICS_ENABLED": (False, _parse_bool),
+    "METRICS_PORT": (None, _parse_int),
+    "METRICS_SNAPSHOT_PATH": (None, _parse_str),
+    # When set, the chat session is sampled and collapsed stacks are written here on exit.
+    "PROFILE_OUTPUT": (None, _parse_str),
+}
+
+
+class Config:
+    """
+    Settings read from the environment (and a `.env` file, loaded once) on
+    first access. Unset or empty variables fall back to their defaults.
+
+    Args:
+        env_file (str, optional): .env file to load; defaults to dotenv's search.
+    """
+
+    def __init__(self, env_file: Optional[str] = None):
+        self._env_file = env_file
+        self._env_loaded = False
+        self._values: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _load_env(self):
+        if self._env_loaded:
+            return
+        self._env_loaded = True
+        try:
+            from dotenv import load_dotenv
+        except ImportError:
+            return
+        load_dotenv(self._env_file)
+
+    def __getattr__(self, name: str) -> Any:
+        if name not in SETTINGS:
+            raise AttributeError(f"Unknown setting: {name}")
+        with self._lock:
+            if name not in self._values:
+                self._load_env()
+                default, parse = SETTINGS[name]
+                raw = os.getenv(name)
+                self._values[name] = parse(raw) if raw else default
+            return self._values[name]
+
+    def reload(self):
+        """Forgets resolved values so the next access re-reads the environment."""
+        with self._lock:
+            self._values.clear()
+
+
+settings = Config()
+
+
+def __getattr__(name: str) -> Any:
+    # Keeps `config.DEBUG_MODE` / `from .config import DEBUG_MODE` working.
+    if name in SETTINGS:
+        return getattr(settings, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
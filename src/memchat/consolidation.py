@@ -0,0 +1,293 @@
+import time
+import queue
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from .providers import LLMProvider, Message
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "You maintain the long-term memory of a role-play conversation. Rewrite the running summary so it "
+    "also covers the new messages. Keep names, facts, promises and unresolved threads; drop small talk. "
+    "Answer with the summary only, in at most {max_words} words."
+)
+
+FACTS_PROMPT = (
+    "List the durable facts the new messages reveal about the user and the characters (preferences, "
+    "relationships, events, plans), one per line starting with '- '. Answer with '- none' if there are none."
+)
+
+
+@dataclass
+class ConsolidationJob:
+    session: Optional[str]
+    messages: List[Message]
+    first_id: Optional[int] = None
+    enqueued_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class ConsolidationMetrics:
+    submitted: int = 0
+    processed: int = 0
+    failed: int = 0
+    dropped: int = 0
+    memories_written: int = 0
+    last_lag: float = 0.0
+    max_lag: float = 0.0
+    last_duration: float = 0.0
+
+
+def _transcript(messages: Sequence[Message]) -> str:
+    return "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+
+
+class AuxAgent:
+    """
+    A step of the consolidation stage. Agents run in order on every job and
+    return texts to store as memories; `state` is shared between the agents
+    of one job (the summarizer puts the new summary there).
+    """
+    name = "aux"
+
+    async def run(self, job: ConsolidationJob, provider: LLMProvider, state: Dict[str, Any]) -> List[str]:
+        raise NotImplementedError
+
+
+class SummaryAgent(AuxAgent):
+    """Folds each history window into a rolling per-session summary."""
+    name = "summary"
+
+    def __init__(self, max_words: int = 200):
+        self.max_words = max_words
+
+    async def run(self, job: ConsolidationJob, provider: LLMProvider, state: Dict[str, Any]) -> List[str]:
+        previous = state.get("previous_summary") or "(empty)"
+        prompt = f"Running summary:\n{previous}\n\nNew messages:\n{_transcript(job.messages)}"
+        summary = (await provider.complete([{"role": "user", "content": prompt}],
+                                           SUMMARY_PROMPT.format(max_words=self.max_words))).strip()
+        if not summary:
+            return []
+        state["summary"] = summary
+        return [summary]
+
+
+class FactExtractionAgent(AuxAgent):
+    """Pulls durable facts out of a history window, one memory per fact."""
+    name = "facts"
+
+    async def run(self, job: ConsolidationJob, provider: LLMProvider, state: Dict[str, Any]) -> List[str]:
+        reply = await provider.complete([{"role": "user", "content": _transcript(job.messages)}], FACTS_PROMPT)
+        facts = []
+        for line in reply.splitlines():
+            line = line.strip()
+            if line.startswith("- "):
+                fact = line[2:].strip()
+                if fact and fact.lower() != "none":
+                    facts.append(fact)
+        return facts
+
+
+class ConsolidationWorker:
+    """
+    Background stage that turns old history windows into memory records.
+
+    Jobs go through a bounded queue to a dedicated thread running its own
+    event loop, so `submit` never blocks a chat turn: when the queue is full
+    the window is dropped and counted. Jobs run one at a time in submission
+    order, which keeps rolling summaries consistent.
+
+    Give the worker its own provider instance; providers hold connections and
+    semaphores bound to the event loop that first used them.
+
+    Args:
+        provider (LLMProvider): Used by the aux agents.
+        agents (list of AuxAgent, optional): Defaults to a SummaryAgent.
+        store (VectorMemoryStore or MemoryDeduper, optional): Where memory
+            texts are written.
+        embedder (Embedder, optional): Required with `store`.
+        max_queue (int): Pending jobs kept before new ones are dropped.
+    """
+
+    def __init__(self, provider: LLMProvider, agents: Optional[Sequence[AuxAgent]] = None,
+                 store: Optional[Any] = None, embedder: Optional[Any] = None, max_queue: int = 64):
+        if store is not None and embedder is None:
+            raise ValueError("An embedder is required to write to a memory store")
+        self.provider = provider
+        self.agents = list(agents) if agents is not None else [SummaryAgent()]
+        self.store = store
+        self.embedder = embedder
+        # Held while writing to `store`; take it when searching the store from another thread.
+        self.store_lock = threading.Lock()
+        self.metrics = ConsolidationMetrics()
+        self._summaries: Dict[Optional[str], str] = {}
+        self._summary_ends: Dict[Optional[str], int] = {}
+        # Queued jobs per session, and sessions to forget once their last queued job ran.
+        self._queued: Dict[Optional[str], int] = {}
+        self._forget: set = set()
+        self._queue: "queue.Queue[Optional[ConsolidationJob]]" = queue.Queue(max_queue)
+        self._pending_since: List[float] = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="memchat-consolidation", daemon=True)
+        self._thread.start()
+
+    # --- chat-side API ---
+
+    def submit(self, messages: Sequence[Message], session: Optional[str] = None,
+               first_id: Optional[int] = None) -> bool:
+        """Queues a history window. Returns False if it was dropped because the queue is full."""
+        job = ConsolidationJob(session, [dict(m) for m in messages], first_id)
+        with self._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.metrics.dropped += 1
+                logger.warning("Consolidation queue is full; dropping a history window.")
+                return False
+            self.metrics.submitted += 1
+            self._pending_since.append(job.enqueued_at)
+            self._queued[session] = self._queued.get(session, 0) + 1
+            self._forget.discard(session)
+        return True
+
+    def forget(self, session: Optional[str]):
+        """
+        Drops a session's rolling summary, e.g. when the session is closed.
+        Windows it still has queued are processed first (their memories are
+        kept), then the summary is dropped.
+        """
+        with self._lock:
+            if self._queued.get(session):
+                self._forget.add(session)
+            else:
+                self._summaries.pop(session, None)
+                self._summary_ends.pop(session, None)
+
+    def summary(self, session: Optional[str] = None) -> str:
+        """Latest rolling summary of a session, or "" before the first window is processed."""
+        return self._summaries.get(session, "")
+
+    def summary_end(self, session: Optional[str] = None) -> int:
+        """Id after the last message covered by the session's summary (0 if none)."""
+        return self._summary_ends.get(session, 0)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def lag(self) -> float:
+        """Seconds the oldest unfinished job has been waiting, 0 when idle."""
+        with self._lock:
+            return time.time() - self._pending_since[0] if self._pending_since else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        m = self.metrics
+        return {
+            "queue_depth": self.queue_depth,
+            "lag": round(self.lag, 3),
+            "submitted": m.submitted,
+            "processed": m.processed,
+            "failed": m.failed,
+            "dropped": m.dropped,
+            "memories_written": m.memories_written,
+            "last_lag": round(m.last_lag, 3),
+            "max_lag": round(m.max_lag, 3),
+            "last_duration": round(m.last_duration, 3),
+        }
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Waits until every queued job is processed. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._pending_since:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, wait: bool = True):
+        """Stops the worker, finishing queued jobs first if `wait` is set."""
+        if not self._thread.is_alive():
+            return
+        if not wait:
+            with self._lock:
+                while True:
+                    try:
+                        job = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    self._pending_since.pop(0)
+                    if job is not None:
+                        self._job_done(job.session)
+        self._queue.put(None)
+        self._thread.join()
+
+    def _job_done(self, session: Optional[str]):
+        # Called with `_lock` held.
+        left = self._queued.get(session, 0) - 1
+        if left > 0:
+            self._queued[session] = left
+            return
+        self._queued.pop(session, None)
+        if session in self._forget:
+            self._forget.discard(session)
+            self._summaries.pop(session, None)
+            self._summary_ends.pop(session, None)
+
+    # --- worker thread ---
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    break
+                started = time.time()
+                try:
+                    loop.run_until_complete(self._process(job))
+                    self.metrics.processed += 1
+                except Exception as e:
+                    self.metrics.failed += 1
+                    logger.error(f"Consolidation job for session {job.session!r} failed: {e}")
+                finally:
+                    finished = time.time()
+                    with self._lock:
+                        if self._pending_since:
+                            self._pending_since.pop(0)
+                        self._job_done(job.session)
+                    self.metrics.last_lag = started - job.enqueued_at
+                    self.metrics.max_lag = max(self.metrics.max_lag, self.metrics.last_lag)
+                    self.metrics.last_duration = finished - started
+            loop.run_until_complete(self.provider.aclose())
+        finally:
+            loop.close()
+
+    async def _process(self, job: ConsolidationJob):
+        state: Dict[str, Any] = {"previous_summary": self._summaries.get(job.session, "")}
+        texts: List[str] = []
+        kinds: List[str] = []
+        for agent in self.agents:
+            produced = await agent.run(job, self.provider, state)
+            texts.extend(produced)
+            kinds.extend([agent.name] * len(produced))
+        if state.get("summary"):
+            self._summaries[job.session] = state["summary"]
+            if job.first_id is not None:
+                self._summary_ends[job.session] = job.first_id + len(job.messages)
+        if texts and self.store is not None:
+            if hasattr(self.embedder, "aembed"):
+                vectors = await self.embedder.aembed(texts)
+            else:
+                vectors = self.embedder.embed(texts)
+            last_id = None if job.first_id is None else job.first_id + len(job.messages) - 1
+            metadata = [{"kind": kind, "first_id": job.first_id, "last_id": last_id} for kind in kinds]
+            with self.store_lock:
+                self.store.add(vectors, texts, session=job.session, metadata=metadata)
+            self.metrics.memories_written += len(texts)
+        logger.debug("Consolidated %d messages of session %r into %d memories",
+                     len(job.messages), job.session, len(texts))
@@ -0,0 +1,239 @@
+import bisect
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+Message = Dict[str, str]
+
+
+class Tokenizer:
+    """Counts tokens in a string. Plug in a real tokenizer by subclassing or via `CallableTokenizer`."""
+
+    def count(self, text: str) -> int:
+        raise NotImplementedError
+
+
+class ApproxTokenizer(Tokenizer):
+    """
+    Fast approximation: about four UTF-8 bytes per token. Close enough for
+    English BPE vocabularies and errs on the safe side for CJK text.
+    """
+
+    def __init__(self, bytes_per_token: float = 4.0):
+        self.bytes_per_token = bytes_per_token
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if text.isascii():
+            size = len(text)
+        else:
+            size = len(text.encode("utf-8"))
+        return int(size / self.bytes_per_token) + 1
+
+
+class CallableTokenizer(Tokenizer):
+    """Adapts an `encode(text) -> list` function, e.g. `tiktoken.get_encoding(...).encode`."""
+
+    def __init__(self, encode: Callable[[str], Sequence[Any]]):
+        self.encode = encode
+
+    def count(self, text: str) -> int:
+        return len(self.encode(text)) if text else 0
+
+
+@dataclass
+class BudgetReport:
+    budget: int
+    sections: Dict[str, int] = field(default_factory=dict)
+    history_messages: int = 0
+    dropped: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def used(self) -> int:
+        return sum(self.sections.values())
+
+    @property
+    def remaining(self) -> int:
+        return self.budget - self.used
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "budget": self.budget,
+            "used": self.used,
+            "remaining": self.remaining,
+            "sections": dict(self.sections),
+            "history_messages": self.history_messages,
+            "dropped": dict(self.dropped),
+        }
+
+
+@dataclass
+class AssembledContext:
+    system_prompt: str
+    messages: List[Message]
+    report: BudgetReport
+
+
+class ContextAssembler:
+    """
+    Fits the character context, retrieved memories and chat history into a
+    model's token limit.
+
+    Token counts are computed once per message and kept with running totals,
+    so a turn only tokenizes the messages added since the previous turn and
+    finding how much history fits is a binary search.
+
+    Sections are filled by priority:
+        1. system prompt and character context
+        2. post-history instructions (`data_post_history_instructions`)
+        3. depth prompt (`data_extensions_depth_prompt_prompt`, inserted
+           `data_extensions_depth_prompt_depth` messages from the end)
+        4. the newest `min_recent_messages` history messages
+        5. extra sections such as retrieved memories, each capped at a share
+           of the budget, in the order given
+        6. the rest of the history, newest first
+
+    Args:
+        max_tokens (int): Model context size.
+        tokenizer (Tokenizer, optional): Defaults to `ApproxTokenizer`.
+        reserve_for_reply (int): Tokens kept free for the model's answer.
+        message_overhead (int): Per-message formatting tokens.
+        min_recent_messages (int): History messages kept ahead of memories.
+    """
+
+    def __init__(self, max_tokens: int = 8192, tokenizer: Optional[Tokenizer] = None,
+                 reserve_for_reply: int = 512, message_overhead: int = 4, min_recent_messages: int = 2):
+        self.max_tokens = max_tokens
+        self.tokenizer = tokenizer or ApproxTokenizer()
+        self.reserve_for_reply = reserve_for_reply
+        self.message_overhead = message_overhead
+        self.min_recent_messages = min_recent_messages
+        self._history: List[Message] = []
+        self._prefix: List[int] = [0]  # _prefix[i] = tokens of history[:i]
+        self._text_counts: Dict[str, int] = {}
+
+    # --- token counting ---
+
+    def count_text(self, text: str) -> int:
+        """Counts tokens, remembering results for recurring texts (system prompt, instructions)."""
+        count = self._text_counts.get(text)
+        if count is None:
+            count = self.tokenizer.count(text)
+            if len(self._text_counts) >= 256:
+                self._text_counts.clear()
+            self._text_counts[text] = count
+        return count
+
+    def count_message(self, message: Message) -> int:
+        return self.tokenizer.count(message.get("content", "")) + self.message_overhead
+
+    # --- history ---
+
+    def append(self, message: Message):
+        self._history.append(message)
+        self._prefix.append(self._prefix[-1] + self.count_message(message))
+
+    def sync(self, messages: Sequence[Message]):
+        """
+        Brings the tracked history in line with `messages`. Appended messages
+        are tokenized incrementally; if the earlier history changed, it is
+        recounted from scratch.
+        """
+        known = len(self._history)
+        if len(messages) >= known and (known == 0 or (messages[known - 1] is self._history[-1]
+                                                      and messages[0] is self._history[0])):
+            for message in messages[known:]:
+                self.append(message)
+            return
+        self._history = []
+        self._prefix = [0]
+        for message in messages:
+            self.append(message)
+
+    @property
+    def history_tokens(self) -> int:
+        return self._prefix[-1]
+
+    def _fit_history(self, stop: int, budget: int) -> int:
+        """Returns the first index i such that history[i:stop] fits in `budget`."""
+        if budget <= 0:
+            return stop
+        target = self._prefix[stop] - budget
+        return min(stop, bisect.bisect_left(self._prefix, target, 0, stop + 1))
+
+    # --- assembly ---
+
+    def build(self, system_prompt: str = "", post_history_instructions: str = "", depth_prompt: str = "",
+              depth: int = 0, extra_sections: Optional[Sequence[tuple]] = None,
+              messages: Optional[Sequence[Message]] = None) -> AssembledContext:
+        """
+        Assembles one turn's prompt.
+
+        Args:
+            system_prompt (str): System prompt including the character context.
+            post_history_instructions (str): Sent after the history.
+            depth_prompt (str): Inserted `depth` messages from the end.
+            extra_sections (list, optional): (name, texts, max_share) tuples,
+                e.g. ("memories", [...], 0.25). Texts are taken in order until
+                the section's share of the budget is used, and joined into
+                the system prompt under a "[Name]" header.
+            messages (list, optional): Full history; synced incrementally.
+
+        Returns:
+            AssembledContext: System prompt, messages to send and a BudgetReport.
+        """
+        if messages is not None:
+            self.sync(messages)
+        budget = self.max_tokens - self.reserve_for_reply
+        report = BudgetReport(budget=budget)
+
+        report.sections["system"] = self.count_text(system_prompt) if system_prompt else 0
+        report.sections["post_history"] = (self.count_text(post_history_instructions) + self.message_overhead
+                                           if post_history_instructions else 0)
+        report.sections["depth_prompt"] = (self.count_text(depth_prompt) + self.message_overhead
+                                           if depth_prompt else 0)
+        if report.remaining < 0:
+            logger.warning(f"Fixed prompt sections exceed the context budget by {-report.remaining} tokens.")
+
+        # The newest messages go in before the extra sections; older history
+        # fills whatever they leave.
+        total = len(self._history)
+        recent_start = max(self._fit_history(total, report.remaining), total - self.min_recent_messages)
+        report.sections["history"] = self._prefix[total] - self._prefix[recent_start]
+
+        extra_text = []
+        for name, texts, max_share in extra_sections or ():
+            header = f"[{name.replace('_', ' ').title()}]\n"
+            allowance = min(int(budget * max_share), report.remaining) - self.count_text(header)
+            used = 0
+            taken = []
+            for text in texts:
+                cost = self.tokenizer.count(text) + 1
+                if used + cost > allowance:
+                    report.dropped[name] = report.dropped.get(name, 0) + 1
+                    continue
+                taken.append(text)
+                used += cost
+            if taken:
+                used += self.count_text(header)
+                extra_text.append(header + "\n".join(taken))
+            report.sections[name] = used
+
+        start = self._fit_history(recent_start, report.remaining)
+        report.sections["history"] = self._prefix[total] - self._prefix[start]
+        report.history_messages = total - start
+        if start:
+            report.dropped["history"] = start
+
+        history = list(self._history[start:])
+        if depth_prompt:
+            position = max(0, len(history) - max(0, depth))
+            history.insert(position, {"role": "system", "content": depth_prompt})
+        if post_history_instructions:
+            history.append({"role": "system", "content": post_history_instructions})
+
+        full_system = "\n\n".join([system_prompt] + extra_text) if extra_text else system_prompt
+        return AssembledContext(full_system, history, report)
@@ -0,0 +1,327 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EmbedStats:
+    texts: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+    @property
+    def texts_per_sec(self) -> float:
+        return self.texts / self.seconds if self.seconds > 0 else 0.0
+
+
+class Embedder:
+    """
+    Turns texts into unit-length float32 vectors. Implementations override
+    `_embed`; `embed` adds timing stats.
+    """
+    name = "base"
+    dim = 0
+
+    def __init__(self):
+        self.stats = EmbedStats()
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Returns an array of shape (len(texts), dim)."""
+        start = time.perf_counter()
+        vectors = self._embed(list(texts)) if texts else np.zeros((0, self.dim), dtype=np.float32)
+        self.stats.seconds += time.perf_counter() - start
+        self.stats.texts += len(texts)
+        self.stats.batches += 1
+        return vectors
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+# --- built-in local embedder ---
+
+_MIX_1 = np.uint64(0xFF51AFD7ED558CCD)
+_MIX_2 = np.uint64(0xC4CEB9FE1A85EC53)
+_POLY = np.uint64(0x100000001B3)
+
+
+def _mix64(h: np.ndarray) -> np.ndarray:
+    """MurmurHash3 finalizer; spreads polynomial hashes over all 64 bits."""
+    h = h ^ (h >> np.uint64(33))
+    h = h * _MIX_1
+    h = h ^ (h >> np.uint64(33))
+    h = h * _MIX_2
+    return h ^ (h >> np.uint64(33))
+
+
+def _encode_batch(texts: Sequence[str]):
+    """
+    Concatenates lowercased UTF-8 texts with NUL separators. Returns the byte
+    array and the text index of every byte (-1 for separators).
+    """
+    encoded = [t.lower().encode("utf-8") for t in texts]
+    blob = b"\x00".join(encoded)
+    data = np.frombuffer(blob, dtype=np.uint8)
+    lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+    owner = np.repeat(np.arange(len(encoded), dtype=np.int64), lengths + 1)[:len(data)]
+    # separators take the slot after each text; mark them
+    starts = np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+    sep_positions = (starts + lengths)[:-1]
+    owner[sep_positions] = -1
+    return data, owner
+
+
+def hash_byte_ngrams(data: np.ndarray, owner: np.ndarray, n: int):
+    """
+    Vectorized 64-bit hashes of all byte n-grams that do not cross a text
+    boundary. Returns (hashes, text index of each n-gram).
+    """
+    count = len(data) - n + 1
+    if count <= 0:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+    values = data.astype(np.uint64)
+    h = np.full(count, np.uint64(n), dtype=np.uint64)
+    for j in range(n):
+        h = h * _POLY + values[j:j + count]
+    first = owner[:count]
+    # Texts are contiguous, so equal owners at both ends mean no separator inside.
+    valid = (first >= 0) & (first == owner[n - 1:n - 1 + count])
+    return _mix64(h[valid]), first[valid]
+
+
+def hash_words(data: np.ndarray, owner: np.ndarray):
+    """Vectorized 64-bit hashes of alphanumeric runs (words). Returns (hashes, text index)."""
+    is_word = ((data >= 48) & (data <= 57)) | ((data >= 97) & (data <= 122)) | (data >= 128)
+    if not is_word.any():
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+    edges = np.diff(np.concatenate(([0], is_word.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    positions = np.flatnonzero(is_word)
+    word_of = np.repeat(np.arange(len(starts)), ends - starts)
+    exponent = (positions - starts[word_of]).astype(np.uint64)
+    powers = np.power(_POLY, exponent)
+    terms = data[positions].astype(np.uint64) * powers
+    hashes = np.add.reduceat(terms, np.concatenate(([0], np.cumsum(ends - starts)[:-1])))
+    return _mix64(hashes ^ np.uint64(0x9E3779B97F4A7C15)), owner[starts]
+
+
+class HashingEmbedder(Embedder):
+    """
+    CPU-only embedder that needs no model: byte n-grams and words are hashed
+    into `dim` signed buckets (a sparse random projection of the n-gram
+    space), then rows are L2-normalized. The whole batch is hashed and
+    accumulated with NumPy; there is no per-text Python loop besides
+    lowercasing and encoding.
+
+    Args:
+        dim (int): Output dimension.
+        ngram_sizes (tuple of int): Byte n-gram lengths to hash.
+        word_weight (float): Weight of whole-word features relative to n-grams.
+    """
+    name = "hashing"
+
+    def __init__(self, dim: int = 384, ngram_sizes: Sequence[int] = (3, 4, 5), word_weight: float = 2.0):
+        super().__init__()
+        self.dim = dim
+        self.ngram_sizes = tuple(ngram_sizes)
+        self.word_weight = word_weight
+        self.name = f"hashing-{dim}-{'-'.join(map(str, self.ngram_sizes))}-{word_weight:g}"
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        data, owner = _encode_batch(texts)
+        parts = [hash_byte_ngrams(data, owner, n) + (1.0,) for n in self.ngram_sizes]
+        parts.append(hash_words(data, owner) + (self.word_weight,))
+
+        dim = np.uint64(self.dim)
+        n_texts = len(texts)
+        matrix = np.zeros(n_texts * self.dim, dtype=np.float64)
+        for hashes, rows, weight in parts:
+            if not len(hashes):
+                continue
+            buckets = (hashes % dim).astype(np.int64)
+            signs = np.where(hashes >> np.uint64(63), -weight, weight)
+            matrix += np.bincount(rows * self.dim + buckets, weights=signs, minlength=n_texts * self.dim)
+
+        matrix = matrix.reshape(n_texts, self.dim).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+# --- caching ---
+
+def content_key(embedder_name: str, text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16, person=b"memchat-embed",
+                           key=embedder_name.encode("utf-8")[:64]).digest()
+
+
+class CachedEmbedder(Embedder):
+    """
+    Wraps an embedder with a content-hash keyed LRU cache, so repeated
+    messages and card text are embedded once. Duplicates within a batch are
+    embedded once as well. The cache can be saved to and loaded from an .npz
+    file.
+
+    Args:
+        inner (Embedder): The embedder doing the work.
+        max_entries (int): Cached vectors kept in memory.
+        path (str, optional): .npz file the cache is loaded from and saved to.
+    """
+
+    def __init__(self, inner: Embedder, max_entries: int = 100000, path: Optional[str] = None):
+        super().__init__()
+        self.inner = inner
+        self.dim = inner.dim
+        self.name = inner.name
+        self.max_entries = max_entries
+        self.path = path
+        self._cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        keys = [content_key(self.name, t) for t in texts]
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        missing: Dict[bytes, List[int]] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._cache.get(key)
+                if vector is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    self._cache.move_to_end(key)
+                    out[i] = vector
+        self.stats.cache_hits += len(texts) - sum(len(v) for v in missing.values())
+        self.stats.cache_misses += len(missing)
+
+        if missing:
+            todo = [texts[positions[0]] for positions in missing.values()]
+            vectors = self.inner.embed(todo)
+            with self._lock:
+                for (key, positions), vector in zip(missing.items(), vectors):
+                    out[positions] = vector
+                    self._cache[key] = vector
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return out
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        if not path:
+            raise ValueError("No cache path given")
+        with self._lock:
+            keys = np.frombuffer(b"".join(self._cache.keys()), dtype=np.uint8).reshape(-1, 16)
+            vectors = np.stack(list(self._cache.values())) if self._cache else np.zeros((0, self.dim), np.float32)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, keys=keys, vectors=vectors, name=np.array(self.name))
+        os.replace(tmp_path, path)
+
+    def load(self, path: str):
+        with np.load(path) as data:
+            if str(data["name"]) != self.name:
+                logger.warning(f"Ignoring embedding cache {path}: built by {data['name']}, not {self.name}")
+                return
+            keys, vectors = data["keys"], data["vectors"]
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._cache[key.tobytes()] = vector
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+# --- remote providers ---
+
+class RemoteEmbedder(Embedder):
+    """
+    Base for embedding APIs. Texts are split into requests of `batch_size`
+    and up to `max_concurrency` requests run at once. Use `aembed` from async
+    code; `embed` runs its own event loop.
+    """
+
+    def __init__(self, dim: int, batch_size: int = 256, max_concurrency: int = 4):
+        super().__init__()
+        self.dim = dim
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+
+    async def aembed(self, texts: Sequence[str]) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(batch: List[str]) -> np.ndarray:
+            async with semaphore:
+                return await self._embed_batch(batch)
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*(run(b) for b in batches))
+        matrix = np.concatenate(results).astype(np.float32, copy=False)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.stats.seconds += time.perf_counter() - start
+        self.stats.texts += len(texts)
+        self.stats.batches += len(batches)
+        return matrix / norms
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        async def run() -> np.ndarray:
+            try:
+                return await self.aembed(texts)
+            finally:
+                # The loop ends with this call; its keep-alive connections cannot be reused.
+                self.close_idle()
+
+        return asyncio.run(run())
+
+    def close_idle(self):
+        """Drops connections kept alive between requests."""
+
+    async def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class OpenAIEmbedder(RemoteEmbedder):
+    """Embeddings from an OpenAI-compatible `/embeddings` endpoint."""
+
+    def __init__(self, api_key: Optional[str], model: str = "text-embedding-3-small", dim: int = 1536,
+                 base_url: str = "https://api.openai.com/v1", **kwargs: Any):
+        super().__init__(dim, **kwargs)
+        from .providers.http import HTTPConnectionPool
+        self.api_key = api_key
+        self.model = model
+        self.name = f"openai-{model}-{dim}"
+        self.pool = HTTPConnectionPool(base_url, max_idle=self.max_concurrency)
+
+    def close_idle(self):
+        self.pool.close_idle()
+
+    async def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        from .providers.http import HTTPError
+        body = json.dumps({"model": self.model, "input": texts, "dimensions": self.dim}).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        response = await self.pool.request("POST", "/embeddings", headers, body)
+        raw = await response.read()
+        if response.status != 200:
+            raise HTTPError(response.status, response.reason, raw)
+        items = sorted(json.loads(raw)["data"], key=lambda item: item["index"])
+        return np.asarray([item["embedding"] for item in items], dtype=np.float32)
@@ -0,0 +1,417 @@
+import os
+import json
+import time
+import bisect
+import logging
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_SEGMENT_SUFFIX = ".jsonl"
+_INDEX_SUFFIX = ".idx"
+_OFFSET_TYPECODE = "Q"  # native-endian uint64 byte offsets, one per record
+_OFFSET_SIZE = array(_OFFSET_TYPECODE).itemsize
+# Written once a compaction's new segments are on disk; its presence means "finish installing them".
+_COMPACTION_PLAN = "compaction.json"
+
+
+class _Segment:
+    __slots__ = ("first_id", "count", "path", "index_path")
+
+    def __init__(self, directory: str, first_id: int, count: int = 0):
+        self.first_id = first_id
+        self.count = count
+        self.path = os.path.join(directory, f"{first_id:012d}{_SEGMENT_SUFFIX}")
+        self.index_path = os.path.join(directory, f"{first_id:012d}{_INDEX_SUFFIX}")
+
+    @property
+    def end_id(self) -> int:
+        return self.first_id + self.count
+
+    def read_offsets(self, start: int, stop: int) -> array:
+        offsets = array(_OFFSET_TYPECODE)
+        with open(self.index_path, "rb") as f:
+            f.seek(start * _OFFSET_SIZE)
+            offsets.frombytes(f.read((stop - start) * _OFFSET_SIZE))
+        return offsets
+
+
+def _scan_offsets(path: str) -> array:
+    """Rebuilds a segment index by scanning for complete lines."""
+    offsets = array(_OFFSET_TYPECODE)
+    pos = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offsets.append(pos)
+            pos += len(line)
+    return offsets
+
+
+class ChatHistoryLog:
+    """
+    Append-only chat history for one session, stored as JSONL segments with
+    a side index of record offsets.
+
+    Each record gets a sequential `id`. Appends write one line plus one index
+    entry, so the cost per turn does not depend on the session length.
+    Writes are fsynced in batches (`fsync_every` records or `fsync_interval`
+    seconds, whichever comes first); `flush()` forces it. On open, a torn
+    final line from a crash is truncated and indexes are rebuilt if needed.
+
+    Args:
+        directory (str): Session directory; created if missing.
+        segment_max_bytes (int): Size at which the active segment is sealed.
+        fsync_every (int): Records per forced fsync.
+        fsync_interval (float): Maximum seconds between fsyncs while appending.
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = 8 * 1024 * 1024,
+                 fsync_every: int = 32, fsync_interval: float = 1.0):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._segments: List[_Segment] = []
+        self._active_offsets = array(_OFFSET_TYPECODE)
+        self._active_size = 0
+        self._log_file = None
+        self._index_file = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._recover()
+
+    # --- opening and recovery ---
+
+    def _recover(self):
+        self._finish_compaction()
+        first_ids = sorted(
+            int(name[:-len(_SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(_SEGMENT_SUFFIX) and name[:-len(_SEGMENT_SUFFIX)].isdigit())
+
+        segments = []
+        for first_id in first_ids:
+            segment = _Segment(self.directory, first_id)
+            offsets = self._load_index(segment)
+            segment.count = len(offsets)
+            if segments and segment.first_id < segments[-1].end_id:
+                raise ValueError(f"Overlapping history segments in {self.directory}")
+            segments.append(segment)
+            if first_id == first_ids[-1]:
+                self._active_offsets = offsets
+
+        if not segments:
+            segments.append(_Segment(self.directory, 0))
+        self._segments = segments
+        self._open_active()
+
+    def _finish_compaction(self):
+        """Completes a compaction interrupted after its commit point, or discards one interrupted before."""
+        plan_path = os.path.join(self.directory, _COMPACTION_PLAN)
+        try:
+            with open(plan_path, "r", encoding="utf-8") as f:
+                plan = json.load(f)
+        except FileNotFoundError:
+            plan = None
+        if plan is not None:
+            logger.warning(f"Finishing interrupted history compaction in {self.directory}")
+            self._apply_compaction(plan)
+        for name in os.listdir(self.directory):
+            if name.endswith((_SEGMENT_SUFFIX + ".tmp", _INDEX_SUFFIX + ".tmp", _COMPACTION_PLAN + ".tmp")):
+                os.unlink(os.path.join(self.directory, name))
+
+    def _apply_compaction(self, plan: Dict[str, List[int]]):
+        # Idempotent: files already moved into place have no .tmp left.
+        for first_id in plan["install"]:
+            segment = _Segment(self.directory, first_id)
+            for path in (segment.index_path, segment.path):
+                if os.path.exists(path + ".tmp"):
+                    os.replace(path + ".tmp", path)
+        for first_id in plan["remove"]:
+            self._remove_segment(_Segment(self.directory, first_id))
+        os.unlink(os.path.join(self.directory, _COMPACTION_PLAN))
+
+    def _load_index(self, segment: _Segment) -> array:
+        size = os.path.getsize(segment.path)
+        offsets = array(_OFFSET_TYPECODE)
+        try:
+            with open(segment.index_path, "rb") as f:
+                raw = f.read()
+            offsets.frombytes(raw[:len(raw) - len(raw) % _OFFSET_SIZE])
+        except FileNotFoundError:
+            pass
+
+        end = self._valid_end(segment.path, offsets, size)
+        if end is None:
+            logger.warning(f"Rebuilding history index for {segment.path}")
+            offsets = _scan_offsets(segment.path)
+            end = offsets[-1] + self._record_length(segment.path, offsets[-1]) if offsets else 0
+
+        if end < size:
+            logger.warning(f"Truncating {size - end} bytes of incomplete history in {segment.path}")
+            with open(segment.path, "r+b") as f:
+                f.truncate(end)
+        with open(segment.index_path, "wb") as f:
+            offsets.tofile(f)
+        return offsets
+
+    @staticmethod
+    def _valid_end(path: str, offsets: array, size: int) -> Optional[int]:
+        """
+        Trims `offsets` to complete records and extends it over complete
+        records written after the index. Returns the end of the last complete
+        record, or None if the index does not match the file.
+        """
+        with open(path, "rb") as f:
+            end = 0
+            while offsets:
+                last = offsets[-1]
+                if last >= size:
+                    return None
+                if last:
+                    f.seek(last - 1)
+                    if f.read(1) != b"\n":
+                        return None
+                f.seek(last)
+                line = f.readline()
+                if line.endswith(b"\n"):
+                    end = last + len(line)
+                    break
+                offsets.pop()  # torn final record
+            f.seek(end)
+            while True:
+                extra = f.readline()
+                if not extra.endswith(b"\n"):
+                    break
+                offsets.append(end)
+                end += len(extra)
+        return end
+
+    @staticmethod
+    def _record_length(path: str, offset: int) -> int:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return len(f.readline())
+
+    def _open_active(self):
+        segment = self._segments[-1]
+        self._log_file = open(segment.path, "ab")
+        self._index_file = open(segment.index_path, "ab")
+        self._active_size = self._log_file.tell()
+
+    def _remove_segment(self, segment: _Segment):
+        for path in (segment.path, segment.index_path):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    # --- writing ---
+
+    def __len__(self) -> int:
+        return self._segments[-1].end_id - self._segments[0].first_id
+
+    @property
+    def next_id(self) -> int:
+        return self._segments[-1].end_id
+
+    @metrics.timed("history_append_seconds")
+    def append(self, message: Dict[str, Any]) -> int:
+        """Appends a message record and returns its id."""
+        record = dict(message)
+        record["id"] = self.next_id
+        record.setdefault("ts", time.time())
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+        if self._active_size and self._active_size + len(line) > self.segment_max_bytes:
+            self._roll_segment()
+
+        segment = self._segments[-1]
+        offset = self._active_size
+        self._log_file.write(line)
+        self._index_file.write(array(_OFFSET_TYPECODE, (offset,)).tobytes())
+        self._active_offsets.append(offset)
+        self._active_size += len(line)
+        segment.count += 1
+        metrics.inc("history_bytes_written", len(line))
+
+        self._pending += 1
+        if self._pending >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.flush()
+        return record["id"]
+
+    @metrics.timed("history_flush_seconds")
+    def flush(self, sync: bool = True):
+        if self._log_file is None:
+            return
+        # Log before index: an index entry must never point past the log.
+        self._log_file.flush()
+        if sync:
+            os.fsync(self._log_file.fileno())
+        self._index_file.flush()
+        if sync:
+            os.fsync(self._index_file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def _roll_segment(self):
+        self.flush()
+        self._log_file.close()
+        self._index_file.close()
+        self._segments.append(_Segment(self.directory, self.next_id))
+        self._active_offsets = array(_OFFSET_TYPECODE)
+        self._open_active()
+
+    def close(self):
+        if self._log_file is None:
+            return
+        self.flush()
+        self._log_file.close()
+        self._index_file.close()
+        self._log_file = self._index_file = None
+
+    def __enter__(self) -> "ChatHistoryLog":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- reading ---
+
+    def _read_records(self, segment: _Segment, start: int, stop: int) -> List[Dict[str, Any]]:
+        """Reads records [start, stop) of a segment (positions, not ids)."""
+        if start >= stop:
+            return []
+        if segment is self._segments[-1]:
+            self._log_file.flush()
+            offsets = self._active_offsets[start:stop]
+            end = self._active_offsets[stop] if stop < len(self._active_offsets) else self._active_size
+        else:
+            offsets = segment.read_offsets(start, min(stop + 1, segment.count))
+            end = offsets[-1] if stop < segment.count else os.path.getsize(segment.path)
+            offsets = offsets[:stop - start]
+        with open(segment.path, "rb") as f:
+            f.seek(offsets[0])
+            blob = f.read(end - offsets[0])
+        return [json.loads(line) for line in blob.splitlines()]
+
+    def tail(self, n: int) -> List[Dict[str, Any]]:
+        """Returns the last `n` records, oldest first, reading only the end of the log."""
+        result: List[Dict[str, Any]] = []
+        for segment in reversed(self._segments):
+            if n <= 0:
+                break
+            take = min(n, segment.count)
+            result[:0] = self._read_records(segment, segment.count - take, segment.count)
+            n -= take
+        return result
+
+    def read(self, start_id: int, stop_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Returns records with start_id <= id < stop_id."""
+        stop_id = self.next_id if stop_id is None else min(stop_id, self.next_id)
+        start_id = max(start_id, self._segments[0].first_id)
+        result = []
+        index = max(0, bisect.bisect_right([s.first_id for s in self._segments], start_id) - 1)
+        for segment in self._segments[index:]:
+            if segment.first_id >= stop_id:
+                break
+            lo = max(start_id, segment.first_id) - segment.first_id
+            hi = min(stop_id, segment.end_id) - segment.first_id
+            result.extend(self._read_records(segment, lo, hi))
+        return result
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for segment in list(self._segments):
+            step = 1024
+            for start in range(0, segment.count, step):
+                yield from self._read_records(segment, start, min(start + step, segment.count))
+
+    # --- compaction ---
+
+    def compact(self, drop_before: Optional[int] = None) -> int:
+        """
+        Rewrites the sealed segments into as few segments as fit
+        `segment_max_bytes`, optionally dropping records with id < drop_before
+        (e.g. after they were consolidated into long-term memory). The active
+        segment is left untouched.
+
+        Returns:
+            int: Number of records dropped.
+        """
+        sealed = self._segments[:-1]
+        if not sealed:
+            return 0
+        self.flush()
+        drop_before = drop_before if drop_before is not None else sealed[0].first_id
+        drop_before = min(drop_before, sealed[-1].end_id)
+
+        new_segments: List[_Segment] = []
+        current = None
+        out = index_out = None
+        size = 0
+        dropped = 0
+        for segment in sealed:
+            for position, line in self._iter_segment_lines(segment):
+                record_id = segment.first_id + position
+                if record_id < drop_before:
+                    dropped += 1
+                    continue
+                if current is None or (size and size + len(line) > self.segment_max_bytes):
+                    if out is not None:
+                        self._finish_compacted(current, out, index_out)
+                    current = _Segment(self.directory, record_id)
+                    out = open(current.path + ".tmp", "wb")
+                    index_out = open(current.index_path + ".tmp", "wb")
+                    new_segments.append(current)
+                    size = 0
+                index_out.write(array(_OFFSET_TYPECODE, (size,)).tobytes())
+                out.write(line)
+                size += len(line)
+                current.count += 1
+        if out is not None:
+            self._finish_compacted(current, out, index_out)
+
+        # The plan is the commit point: a crash before it leaves the old segments
+        # (and stray .tmp files that the next open deletes), a crash after it is
+        # rolled forward by the next open.
+        new_names = {s.path for s in new_segments}
+        plan = {"install": [s.first_id for s in new_segments],
+                "remove": [s.first_id for s in sealed if s.path not in new_names]}
+        self._write_compaction_plan(plan)
+        self._apply_compaction(plan)
+
+        self._segments = new_segments + [self._segments[-1]]
+        logger.info(f"Compacted {len(sealed)} history segments into {len(new_segments)} in {self.directory}")
+        return dropped
+
+    @staticmethod
+    def _iter_segment_lines(segment: _Segment) -> Iterator[Tuple[int, bytes]]:
+        with open(segment.path, "rb") as f:
+            yield from enumerate(f)
+
+    def _write_compaction_plan(self, plan: Dict[str, List[int]]):
+        path = os.path.join(self.directory, _COMPACTION_PLAN)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(plan, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    @staticmethod
+    def _finish_compacted(segment: _Segment, out, index_out):
+        for f in (out, index_out):
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
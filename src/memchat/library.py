@@ -0,0 +1,411 @@
+import io
+import json
+import hashlib
+import os
+import sqlite3
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .character_system import AICharacter, register_save_hook, strip_lazy_fields, unregister_save_hook
+from .library_index import IndexHit, LibraryIndex, card_index_fields
+from .png_card import find_card_chunk, PngFormatError
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".memchat_manifest.sqlite"
+MANIFEST_VERSION = 2
+CARD_EXTENSIONS = (".png", ".json")
+# Version 1 manifests: one JSON document holding every card in full.
+_LEGACY_MANIFEST_NAME = ".memchat_manifest.json"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT,
+    card TEXT,
+    chunk_offset INTEGER,
+    chunk_length INTEGER,
+    chunk_type TEXT,
+    error_type TEXT,
+    error TEXT
+);
+"""
+_COLUMNS = "key, size, mtime_ns, sha256, card, chunk_offset, chunk_length, chunk_type, error_type, error"
+
+# Below this many files to (re)parse, a process pool costs more than it saves.
+_MIN_PARALLEL_FILES = 64
+
+
+@dataclass
+class CardLoadResult:
+    path: str
+    ok: bool
+    # The card's light fields (see `strip_lazy_fields`); `CharacterLibrary.get` reads the rest from the file.
+    data: Optional[Dict[str, Any]] = None
+    error_type: Optional[str] = None
+    error: Optional[str] = None
+    cached: bool = False
+
+
+@dataclass
+class ScanReport:
+    results: List[CardLoadResult] = field(default_factory=list)
+    parsed: int = 0
+    reused: int = 0
+    removed: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def failed(self) -> List[CardLoadResult]:
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def cards_per_sec(self) -> float:
+        return len(self.results) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "cards": len(self.results),
+            "parsed": self.parsed,
+            "reused": self.reused,
+            "removed": self.removed,
+            "failed": len(self.failed),
+            "elapsed_s": round(self.elapsed, 4),
+            "cards_per_sec": round(self.cards_per_sec, 1),
+        }
+
+
+def _hash_bytes(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _parse_card_bytes(path: str, raw: bytes) -> Tuple[Dict[str, Any], Optional[Tuple[int, int, str]]]:
+    """The decoded card and, for PNG cards, the (offset, length, type) of its text chunk."""
+    if path.lower().endswith(".png"):
+        found = find_card_chunk(io.BytesIO(raw))
+        if found is None:
+            raise ValueError("no character data found in PNG text chunks")
+        chunk, data = found
+        return data, (chunk.offset, chunk.length, chunk.chunk_type.decode("ascii"))
+    data = json.loads(raw)
+    if not isinstance(data, dict):
+        raise ValueError("card JSON is not an object")
+    return data, None
+
+
+def _parse_card_file(job: Tuple[str, Optional[str]]) -> Dict[str, Any]:
+    """
+    Process-pool worker. Hashes the file and parses it unless the hash matches
+    `known_hash` (a touched but unchanged file). Only the light fields, the
+    chunk location and the search index fields are sent back. Never raises;
+    failures are returned in the entry, which has no `size`/`mtime_ns` if
+    the file could not be read at all.
+    """
+    path, known_hash = job
+    entry: Dict[str, Any] = {"path": path}
+    try:
+        st = os.stat(path)
+        with open(path, "rb") as f:
+            raw = f.read()
+        entry["size"] = st.st_size
+        entry["mtime_ns"] = st.st_mtime_ns
+        entry["sha256"] = _hash_bytes(raw)
+        if known_hash is not None and entry["sha256"] == known_hash:
+            entry["unchanged"] = True
+            return entry
+        data, entry["chunk"] = _parse_card_bytes(path, raw)
+        entry["card"] = strip_lazy_fields(data)
+        entry["fields"] = card_index_fields(data)
+    except (OSError, ValueError, PngFormatError) as e:
+        entry["error_type"] = type(e).__name__
+        entry["error"] = str(e)
+    return entry
+
+
+def _entries_from_rows(rows: List[Tuple]) -> Dict[str, Dict[str, Any]]:
+    # One decode of all light cards as a JSON array is much faster than one json.loads per row.
+    cards = json.loads("[" + ",".join(row[4] or "null" for row in rows) + "]")
+    return dict(_entry_from_row(row, card) for row, card in zip(rows, cards))
+
+
+def _entry_from_row(row: Tuple, card: Optional[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+    key, size, mtime_ns, sha256, _, chunk_offset, chunk_length, chunk_type, error_type, error = row
+    entry: Dict[str, Any] = {"size": size, "mtime_ns": mtime_ns, "sha256": sha256}
+    if card is not None:
+        entry["card"] = card
+        entry["chunk"] = (chunk_offset, chunk_length, chunk_type) if chunk_type else None
+    else:
+        entry["error_type"], entry["error"] = error_type, error
+    return key, entry
+
+
+def _row_from_entry(key: str, entry: Dict[str, Any]) -> Tuple:
+    card = entry.get("card")
+    chunk = entry.get("chunk") or (None, None, None)
+    return (key, entry["size"], entry["mtime_ns"], entry.get("sha256"),
+            None if card is None else json.dumps(card, ensure_ascii=False, separators=(",", ":")),
+            chunk[0], chunk[1], chunk[2], entry.get("error_type"), entry.get("error"))
+
+
+class CharacterLibrary:
+    """
+    A directory tree of PNG/JSON character cards backed by a persistent
+    manifest. Files whose (size, mtime) or content hash are unchanged since the
+    last scan are served from the manifest instead of being parsed again.
+
+    The manifest is a SQLite table with one row per file: its signature
+    (size, mtime, sha256), the card's light fields and, for PNG cards, where
+    the card chunk sits. Scans only write the rows that changed. The long
+    text fields stay in the card files and are read when a character needs
+    them (see `get` and `characters`).
+
+    Scans also keep a LibraryIndex in the library root up to date for
+    `search` and `autocomplete`. After `watch_saves()`, cards saved into the
+    library with `save_to_json`/`save_to_png` are indexed as they are saved.
+    """
+
+    def __init__(self, root: str, manifest_path: Optional[str] = None, max_workers: Optional[int] = None):
+        self.root = os.path.abspath(root)
+        self.manifest_path = manifest_path or os.path.join(self.root, MANIFEST_NAME)
+        self.max_workers = max_workers
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._index: Optional[LibraryIndex] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.manifest_path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version != MANIFEST_VERSION:
+            if version:
+                logger.info(f"Library manifest version mismatch, rebuilding: {self.manifest_path}")
+            db.executescript(f"DROP TABLE IF EXISTS cards; {_SCHEMA} PRAGMA user_version = {MANIFEST_VERSION};")
+        return db
+
+    def _load_manifest(self):
+        if self._db is not None:
+            return
+        legacy = os.path.join(os.path.dirname(self.manifest_path), _LEGACY_MANIFEST_NAME)
+        if legacy != self.manifest_path and os.path.exists(legacy) and not os.path.exists(self.manifest_path):
+            logger.info(f"Migrating library manifest: '{legacy}' is no longer read and can be deleted; "
+                        f"cards are re-scanned into '{self.manifest_path}'")
+        try:
+            self._db = self._connect()
+            rows = self._db.execute(f"SELECT {_COLUMNS} FROM cards").fetchall()
+        except sqlite3.DatabaseError as e:
+            logger.warning(f"Ignoring unreadable library manifest '{self.manifest_path}': {e}")
+            if self._db is not None:
+                self._db.close()
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(self.manifest_path + suffix):
+                    os.unlink(self.manifest_path + suffix)
+            self._db = self._connect()
+            rows = []
+        self._entries = _entries_from_rows(rows)
+
+    def _save_manifest(self, changed: Iterable[str], removed: Iterable[str]):
+        with self._db:
+            self._db.executemany(f"INSERT OR REPLACE INTO cards ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 [_row_from_entry(key, self._entries[key]) for key in changed])
+            self._db.executemany("DELETE FROM cards WHERE key = ?", [(key,) for key in removed])
+
+    def iter_card_paths(self) -> Iterator[str]:
+        for _, path in self._walk():
+            yield path
+
+    def _walk(self) -> Iterator[Tuple[str, str]]:
+        """(key, path) of every card file; keys are paths relative to the root."""
+        prefix = len(os.path.join(self.root, ""))
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            for name in sorted(filenames):
+                if name.startswith('.'):
+                    continue
+                if name.lower().endswith(CARD_EXTENSIONS):
+                    path = os.path.join(dirpath, name)
+                    yield path[prefix:], path
+
+    def _parse_all(self, jobs: List[Tuple[str, Optional[str]]]) -> List[Dict[str, Any]]:
+        if len(jobs) < _MIN_PARALLEL_FILES or self.max_workers == 1:
+            return [_parse_card_file(job) for job in jobs]
+        workers = self.max_workers or os.cpu_count() or 1
+        chunksize = max(1, min(256, len(jobs) // (workers * 4)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_parse_card_file, jobs, chunksize=chunksize))
+
+    def scan(self) -> ScanReport:
+        """
+        Walks the library, re-parsing only new or changed files, and persists
+        the manifest.
+
+        Returns:
+            ScanReport: One CardLoadResult per card file plus throughput stats.
+        """
+        start = time.perf_counter()
+        self._load_manifest()
+        report = ScanReport()
+
+        seen = set()
+        jobs: List[Tuple[str, Optional[str]]] = []
+        fresh: List[Tuple[str, str]] = []
+        keys: Dict[str, str] = {}
+        for key, path in self._walk():
+            seen.add(key)
+            entry = self._entries.get(key)
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                report.results.append(CardLoadResult(path, False, error_type=type(e).__name__, error=str(e)))
+                continue
+            if entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+                fresh.append((key, path))
+            else:
+                keys[path] = key
+                jobs.append((path, entry.get("sha256") if entry else None))
+
+        for key, path in fresh:
+            report.results.append(self._result_from_entry(key, path, cached=True))
+            report.reused += 1
+
+        changed = []
+        vanished = []
+        index_fields: Dict[str, Dict[str, Any]] = {}
+        for parsed in self._parse_all(jobs):
+            path = parsed.pop("path")
+            key = keys[path]
+            if "size" not in parsed:
+                # Deleted or unreadable since the walk: report it, but keep no manifest row.
+                report.results.append(CardLoadResult(path, False, error_type=parsed.get("error_type"),
+                                                     error=parsed.get("error")))
+                if self._entries.pop(key, None) is not None:
+                    vanished.append(key)
+                continue
+            changed.append(key)
+            if parsed.pop("unchanged", False):
+                entry = self._entries[key]
+                entry["size"], entry["mtime_ns"] = parsed["size"], parsed["mtime_ns"]
+                report.reused += 1
+                report.results.append(self._result_from_entry(key, path, cached=True))
+                continue
+            fields = parsed.pop("fields", None)
+            if fields is not None:
+                index_fields[key] = fields
+            self._entries[key] = parsed
+            report.parsed += 1
+            report.results.append(self._result_from_entry(key, path, cached=False))
+
+        removed = [key for key in self._entries if key not in seen]
+        for key in removed:
+            del self._entries[key]
+        report.removed = len(removed)
+
+        if changed or removed or vanished:
+            self._save_manifest(changed, removed + vanished)
+        signatures = {key: entry.get("sha256") for key, entry in self._entries.items() if "card" in entry}
+        if self.index.sync(signatures, lambda key: index_fields.get(key) or self._read_index_fields(key)):
+            self.index.flush()
+
+        report.elapsed = time.perf_counter() - start
+        logger.info(f"Library scan of {self.root}: {report.summary()}")
+        return report
+
+    def _read_index_fields(self, key: str) -> Optional[Dict[str, Any]]:
+        # Cards the index lost track of (e.g. a deleted index) are re-read in full.
+        return _parse_card_file((os.path.join(self.root, key), None)).get("fields")
+
+    def _result_from_entry(self, key: str, path: str, cached: bool) -> CardLoadResult:
+        entry = self._entries[key]
+        if "card" in entry:
+            return CardLoadResult(path, True, data=entry["card"], cached=cached)
+        return CardLoadResult(path, False, error_type=entry.get("error_type"), error=entry.get("error"), cached=cached)
+
+    def get(self, path: str, lazy: bool = False) -> Optional[AICharacter]:
+        """
+        Builds an AICharacter for an already scanned card. The text fields
+        are read from the card file: right away, or on first access with
+        `lazy=True`.
+        """
+        self._load_manifest()
+        key = os.path.relpath(os.path.abspath(path), self.root)
+        entry = self._entries.get(key)
+        if not entry or "card" not in entry:
+            return None
+        return self._build(key, entry, lazy)
+
+    def characters(self, lazy: bool = False) -> Iterator[AICharacter]:
+        """
+        Yields every successfully parsed card. With `lazy=True` the long text
+        fields are left on disk until accessed, which is what browse and
+        search listings want; otherwise every card file is read.
+        """
+        self._load_manifest()
+        for key, entry in list(self._entries.items()):
+            if "card" in entry:
+                yield self._build(key, entry, lazy)
+
+    def _build(self, key: str, entry: Dict[str, Any], lazy: bool) -> AICharacter:
+        path = os.path.join(self.root, key)
+        chunk = entry.get("chunk")
+        if chunk is not None:
+            # The recorded chunk location is only valid for the scanned version of the file.
+            try:
+                st = os.stat(path)
+                current = (st.st_size, st.st_mtime_ns) == (entry["size"], entry["mtime_ns"])
+            except OSError:
+                current = False
+            chunk = (chunk[0], chunk[1], chunk[2].encode("ascii")) if current else None
+        character = AICharacter.from_dict(entry["card"], avatar_path=self._avatar_for(key),
+                                          lazy=True, source_path=path, source_chunk=chunk)
+        return character if lazy else character.materialize()
+
+    # --- search ---
+
+    @property
+    def index(self) -> LibraryIndex:
+        if self._index is None:
+            self._index = LibraryIndex(self.root)
+        return self._index
+
+    def search(self, query: str = "", tags: Tuple[str, ...] = (), exclude_tags: Tuple[str, ...] = (),
+               creator: Optional[str] = None, limit: Optional[int] = 50) -> List[IndexHit]:
+        """Searches the index; see `LibraryIndex.search`. Hits carry absolute card paths."""
+        hits = self.index.search(query, tags=tags, exclude_tags=exclude_tags, creator=creator, limit=limit)
+        return [hit._replace(key=os.path.join(self.root, hit.key)) for hit in hits]
+
+    def autocomplete(self, prefix: str, limit: int = 10) -> List[IndexHit]:
+        return [hit._replace(key=os.path.join(self.root, hit.key)) for hit in self.index.autocomplete(prefix, limit)]
+
+    def _on_card_saved(self, character: AICharacter, path: str, card: Dict[str, Any]):
+        path = os.path.abspath(path)
+        if not path.lower().endswith(CARD_EXTENSIONS) or os.path.commonpath([self.root, path]) != self.root:
+            return
+        # The file's hash, as a scan records it, so the next `sync` keeps this entry.
+        try:
+            with open(path, "rb") as f:
+                sha256 = _hash_bytes(f.read())
+        except OSError:
+            sha256 = None
+        self.index.put(os.path.relpath(path, self.root), card, sha256)
+
+    def watch_saves(self) -> 'CharacterLibrary':
+        """Indexes cards saved into the library as they are saved, until `close()`."""
+        register_save_hook(self._on_card_saved)
+        return self
+
+    def close(self):
+        unregister_save_hook(self._on_card_saved)
+        if self._index is not None:
+            self._index.flush()
+            self._index.close()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _avatar_for(self, key: str) -> Optional[str]:
+        return os.path.join(self.root, key) if key.lower().endswith(".png") else None
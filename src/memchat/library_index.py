@@ -0,0 +1,477 @@
+import os
+import re
+import json
+import bisect
+import logging
+import threading
+from array import array
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Set
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = ".memchat_index.npz"
+JOURNAL_NAME = ".memchat_index.log"
+INDEX_VERSION = 1
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Field prefixes of posting keys, and how much a query term found there counts.
+FIELD_WEIGHTS = {"n": 8.0, "g": 4.0, "c": 3.0, "t": 1.0}
+
+
+def _tokens(text: str) -> Set[str]:
+    return set(_TOKEN_RE.findall(text.lower())) if text else set()
+
+
+def _normalize_tag(tag: str) -> str:
+    return " ".join(tag.lower().split())
+
+
+def _text(value: Any) -> str:
+    return value if isinstance(value, str) else ""
+
+
+def _capacity(docs: int) -> int:
+    # A multiple of 8, so that every doc slot has a column in the packed tag bitsets.
+    return max(1024, (2 * docs + 7) & ~7)
+
+
+def card_index_fields(card: Dict[str, Any]) -> Dict[str, Any]:
+    """Pulls the searchable fields out of a V1/V2 card dict (as parsed from a card file or `to_dict()`)."""
+    data = card.get("data") if isinstance(card.get("data"), dict) else {}
+    alt = card.get("alternative") if isinstance(card.get("alternative"), dict) else {}
+    name = _text(card.get("name")) or _text(data.get("name"))
+    names = [name, _text(data.get("name")), _text(alt.get("name_alt"))]
+    creators = [_text(data.get("creator")), _text(alt.get("creator_alt")), _text(card.get("creator"))]
+    texts = []
+    for key in ("description", "personality", "scenario"):
+        texts.extend((_text(card.get(key)), _text(data.get(key)), _text(alt.get(key + "_alt"))))
+    texts.append(_text(data.get("creator_notes")))
+    tags = []
+    for source in (data.get("tags"), alt.get("tags_alt"), card.get("tags")):
+        if isinstance(source, list):
+            tags.extend(_normalize_tag(t) for t in source if isinstance(t, str) and t.strip())
+    return {
+        "name": name,
+        "names": [n for n in dict.fromkeys(names) if n],
+        "creator": next((c for c in creators if c), ""),
+        "creators": [c for c in dict.fromkeys(creators) if c],
+        "text": "\n".join(t for t in dict.fromkeys(texts) if t),
+        "tags": list(dict.fromkeys(tags)),
+    }
+
+
+class IndexHit(NamedTuple):
+    key: str
+    name: str
+    score: float
+
+
+@dataclass
+class _Doc:
+    key: str
+    name: str
+    sha256: Optional[str]
+
+
+class LibraryIndex:
+    """
+    Search index of a character library: an inverted index from tokens of
+    the name, creator, tags and description-like fields to document ids,
+    one packed bitset per tag for filtering, and a sorted name table for
+    prefix autocomplete.
+
+    Documents are append-only: re-indexing a card tombstones its old id and
+    appends a new one, so an update only touches the new card's postings.
+    The index is compacted when tombstones reach a quarter of the ids.
+
+    It is persisted as an .npz snapshot plus a JSONL journal of updates made
+    since; `flush()` folds the journal into a new snapshot.
+
+    Args:
+        directory (str): Where the index files live (the library root).
+    """
+
+    compact_ratio = 0.25
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, INDEX_NAME)
+        self.journal_path = os.path.join(directory, JOURNAL_NAME)
+        self._lock = threading.RLock()
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self._docs: List[_Doc] = []
+        self._alive = np.zeros(1024, dtype=bool)
+        self._by_key: Dict[str, int] = {}
+        self._postings: Dict[str, array] = {}
+        self._tag_ids: Dict[str, int] = {}
+        self._tag_bits = np.zeros((0, 128), dtype=np.uint8)
+        # (lowercased name or name suffix starting at a word, doc id), for autocomplete.
+        self._names: List[tuple] = []
+        # Distinct name tokens, for prefix matching in `search`.
+        self._name_terms: List[str] = []
+        # Both lists are appended to by `_put` and sorted on the next query or flush.
+        self._unsorted = False
+        self._dead = 0
+        self._journal = None
+
+    # --- persistence ---
+
+    def _load(self):
+        if os.path.exists(self.snapshot_path):
+            try:
+                self._load_snapshot()
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable library index '{self.snapshot_path}': {e}")
+                self._reset()
+        if os.path.exists(self.journal_path):
+            replayed = 0
+            good = 0  # end of the last complete entry
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn final line
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        break
+                    if op.get("op") == "put":
+                        self._put(op["key"], op["fields"], op.get("sha256"))
+                    elif op.get("op") == "remove":
+                        self._remove(op["key"])
+                    replayed += 1
+                    good += len(line)
+                size = f.seek(0, os.SEEK_END)
+            if good < size:
+                # Later entries are appended, so they must not land behind the bad bytes.
+                logger.warning(f"Truncating library index journal '{self.journal_path}' after {replayed} entries")
+                os.truncate(self.journal_path, good)
+            logger.debug("Replayed %d library index journal entries", replayed)
+
+    def _load_snapshot(self):
+        with np.load(self.snapshot_path) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            if meta.get("version") != INDEX_VERSION:
+                logger.info(f"Library index version mismatch, rebuilding: {self.snapshot_path}")
+                return
+            postings = data["postings"]
+            offsets = data["offsets"]
+            alive = data["alive"]
+            tag_bits = data["tag_bits"]
+        self._docs = [_Doc(key, name, sha) for key, name, sha in meta["docs"]]
+        self._alive = np.zeros(_capacity(len(self._docs)), dtype=bool)
+        self._alive[:len(alive)] = alive
+        self._by_key = {doc.key: i for i, doc in enumerate(self._docs) if self._alive[i]}
+        self._dead = len(self._docs) - len(self._by_key)
+        for i, term in enumerate(meta["terms"]):
+            self._postings[term] = array("I", postings[offsets[i]:offsets[i + 1]].tobytes())
+        self._tag_ids = {tag: i for i, tag in enumerate(meta["tags"])}
+        self._tag_bits = np.zeros((len(self._tag_ids), len(self._alive) // 8), dtype=np.uint8)
+        self._tag_bits[:, :tag_bits.shape[1]] = tag_bits
+        self._names = [tuple(entry) for entry in meta["names"]]
+        self._name_terms = sorted(term[1:] for term in self._postings if term[0] == "n")
+
+    def _sort_names(self):
+        # Timsort merges the appended tail into the sorted prefix, so a bulk build sorts once.
+        if self._unsorted:
+            self._names.sort()
+            self._name_terms.sort()
+            self._unsorted = False
+
+    def flush(self):
+        """Writes a snapshot and clears the journal."""
+        with self._lock:
+            self._sort_names()
+            if self._dead and self._dead >= self.compact_ratio * len(self._docs):
+                self._compact()
+            terms = sorted(self._postings)
+            lengths = np.fromiter((len(self._postings[t]) for t in terms), dtype=np.int64, count=len(terms))
+            offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+            postings = np.frombuffer(b"".join(self._postings[t].tobytes() for t in terms), dtype=np.uint32)
+            meta = {
+                "version": INDEX_VERSION,
+                "docs": [(d.key, d.name, d.sha256) for d in self._docs],
+                "terms": terms,
+                "tags": sorted(self._tag_ids, key=self._tag_ids.get),
+                "names": self._names,
+            }
+            meta_bytes = np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+            tmp_path = self.snapshot_path + ".tmp.npz"
+            np.savez(tmp_path, meta=meta_bytes, postings=postings, offsets=offsets,
+                     alive=self._alive[:len(self._docs)], tag_bits=self._tag_bits[:len(self._tag_ids), :(len(self._docs) + 7) // 8])
+            os.replace(tmp_path, self.snapshot_path)
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if os.path.exists(self.journal_path):
+                os.unlink(self.journal_path)
+
+    def close(self):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def _log(self, op: Dict[str, Any]):
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal.write(json.dumps(op, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._journal.flush()
+
+    # --- updates ---
+
+    def _grow(self, needed: int):
+        capacity = len(self._alive)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+        bits = np.zeros((self._tag_bits.shape[0], (capacity + 7) // 8), dtype=np.uint8)
+        bits[:, :self._tag_bits.shape[1]] = self._tag_bits
+        self._tag_bits = bits
+
+    def _tag_row(self, tag: str) -> int:
+        row = self._tag_ids.get(tag)
+        if row is None:
+            row = len(self._tag_ids)
+            self._tag_ids[tag] = row
+            if row >= self._tag_bits.shape[0]:
+                bits = np.zeros((max(16, 2 * row), self._tag_bits.shape[1]), dtype=np.uint8)
+                bits[:row] = self._tag_bits[:row]
+                self._tag_bits = bits
+        return row
+
+    def _put(self, key: str, fields: Dict[str, Any], sha256: Optional[str]):
+        self._remove(key)
+        doc = len(self._docs)
+        self._grow(doc + 1)
+        self._docs.append(_Doc(key, fields.get("name", ""), sha256))
+        self._alive[doc] = True
+        self._by_key[key] = doc
+
+        terms = set()
+        for prefix, values in (("n", fields.get("names", [])), ("c", fields.get("creators", [])),
+                               ("g", fields.get("tags", [])), ("t", [fields.get("text", "")])):
+            for value in values:
+                terms.update(prefix + token for token in _tokens(value))
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = array("I")
+                if term[0] == "n":
+                    self._name_terms.append(term[1:])
+                    self._unsorted = True
+            postings.append(doc)
+
+        for tag in fields.get("tags", []):
+            row = self._tag_row(tag)
+            self._tag_bits[row, doc >> 3] |= np.uint8(0x80 >> (doc & 7))
+
+        for name in fields.get("names", []):
+            lowered = name.lower()
+            starts = [0] + [m.start() for m in re.finditer(r"(?<=\W)\w", lowered)]
+            for start in dict.fromkeys(starts):
+                self._names.append((lowered[start:], doc))
+                self._unsorted = True
+
+    def _remove(self, key: str) -> bool:
+        doc = self._by_key.pop(key, None)
+        if doc is None:
+            return False
+        self._alive[doc] = False
+        self._dead += 1
+        return True
+
+    def put(self, key: str, card: Dict[str, Any], sha256: Optional[str] = None):
+        """Indexes (or re-indexes) the card stored at library-relative path `key`."""
+        fields = card_index_fields(card)
+        with self._lock:
+            self._put(key, fields, sha256)
+            self._log({"op": "put", "key": key, "fields": fields, "sha256": sha256})
+
+    def remove(self, key: str):
+        with self._lock:
+            if self._remove(key):
+                self._log({"op": "remove", "key": key})
+
+    def sync(self, signatures: Dict[str, Optional[str]], load: Callable[[str], Optional[Dict[str, Any]]]) -> int:
+        """
+        Brings the index in line with the library.
+
+        Args:
+            signatures (dict): Content hash of every loadable card, by key.
+            load (callable): Returns the index fields (see `card_index_fields`)
+                of a new or changed card, or None if it cannot be read.
+
+        Returns:
+            int: The number of changes.
+        """
+        changes = 0
+        with self._lock:
+            for key, sha256 in signatures.items():
+                doc = self._by_key.get(key)
+                if doc is not None and sha256 is not None and self._docs[doc].sha256 == sha256:
+                    continue
+                fields = load(key)
+                if fields is None:
+                    continue
+                self._put(key, fields, sha256)
+                self._log({"op": "put", "key": key, "fields": fields, "sha256": sha256})
+                changes += 1
+            for key in [k for k in self._by_key if k not in signatures]:
+                self.remove(key)
+                changes += 1
+        return changes
+
+    def _compact(self):
+        live = np.flatnonzero(self._alive[:len(self._docs)])
+        remap = np.full(len(self._docs), -1, dtype=np.int64)
+        remap[live] = np.arange(len(live))
+        for term in list(self._postings):
+            ids = np.frombuffer(self._postings[term], dtype=np.uint32)
+            kept = remap[ids]
+            kept = kept[kept >= 0]
+            if len(kept):
+                self._postings[term] = array("I", kept.astype(np.uint32).tobytes())
+            else:
+                del self._postings[term]
+        self._name_terms = sorted(term[1:] for term in self._postings if term[0] == "n")
+        capacity = _capacity(len(live))
+        bits = np.unpackbits(self._tag_bits, axis=1)[:, live]
+        self._tag_bits = np.zeros((bits.shape[0], capacity // 8), dtype=np.uint8)
+        packed = np.packbits(bits, axis=1)
+        self._tag_bits[:, :packed.shape[1]] = packed
+        self._docs = [self._docs[i] for i in live]
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._alive[:len(live)] = True
+        self._by_key = {doc.key: i for i, doc in enumerate(self._docs)}
+        self._names = [(name, int(remap[doc])) for name, doc in self._names if remap[doc] >= 0]
+        self._dead = 0
+
+    # --- queries ---
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def _term_mask(self, term: str, n: int) -> Optional[np.ndarray]:
+        postings = self._postings.get(term)
+        if not postings:
+            return None
+        mask = np.zeros(n, dtype=bool)
+        mask[np.frombuffer(postings, dtype=np.uint32)] = True
+        return mask
+
+    def _tag_mask(self, tag: str, n: int) -> np.ndarray:
+        row = self._tag_ids.get(_normalize_tag(tag))
+        if row is None:
+            return np.zeros(n, dtype=bool)
+        return np.unpackbits(self._tag_bits[row], count=n).view(bool)
+
+    def search(self, query: str = "", tags: Sequence[str] = (), exclude_tags: Sequence[str] = (),
+               creator: Optional[str] = None, limit: Optional[int] = 50) -> List[IndexHit]:
+        """
+        Finds cards containing every word of `query` (in any indexed field;
+        the last word also matches as a prefix of names), with all of `tags`,
+        none of `exclude_tags` and, optionally, words of `creator`.
+
+        Returns:
+            list of IndexHit: Best matches first (name matches rank highest).
+        """
+        with self._lock:
+            self._sort_names()
+            n = len(self._docs)
+            mask = self._alive[:n].copy()
+            score = np.zeros(n, dtype=np.float32)
+            words = _TOKEN_RE.findall(query.lower())
+            for i, word in enumerate(words):
+                found = np.zeros(n, dtype=bool)
+                for field, weight in FIELD_WEIGHTS.items():
+                    term_mask = self._term_mask(field + word, n)
+                    if term_mask is not None:
+                        found |= term_mask
+                        score += weight * term_mask
+                if i == len(words) - 1:
+                    prefixed = self._name_prefix_docs(word)
+                    if len(prefixed):
+                        prefix_mask = np.zeros(n, dtype=bool)
+                        prefix_mask[prefixed] = True
+                        score += FIELD_WEIGHTS["n"] / 2 * (prefix_mask & ~found)
+                        found |= prefix_mask
+                mask &= found
+            for tag in tags:
+                mask &= self._tag_mask(tag, n)
+            for tag in exclude_tags:
+                mask &= ~self._tag_mask(tag, n)
+            if creator:
+                for word in _tokens(creator):
+                    term_mask = self._term_mask("c" + word, n)
+                    if term_mask is None:
+                        mask[:] = False
+                        break
+                    mask &= term_mask
+
+            hits = np.flatnonzero(mask)
+            if limit is not None and len(hits) > limit:
+                top = np.argpartition(-score[hits], limit - 1)[:limit]
+                hits = hits[top]
+            order = np.lexsort((hits, -score[hits]))
+            return [IndexHit(self._docs[i].key, self._docs[i].name, float(score[i])) for i in hits[order]]
+
+    def _name_prefix_docs(self, prefix: str) -> np.ndarray:
+        """Ids of documents with a name token starting with `prefix` (dead ones included)."""
+        terms = self._name_terms
+        start = bisect.bisect_left(terms, prefix)
+        stop = bisect.bisect_left(terms, prefix + "\U0010ffff", start)
+        if start == stop:
+            return np.empty(0, dtype=np.uint32)
+        return np.frombuffer(b"".join(self._postings["n" + terms[i]].tobytes() for i in range(start, stop)),
+                             dtype=np.uint32)
+
+    def _prefix_docs(self, prefix: str, limit: Optional[int] = None) -> np.ndarray:
+        names = self._names
+        docs = []
+        for i in range(bisect.bisect_left(names, (prefix,)), len(names)):
+            name, doc = names[i]
+            if not name.startswith(prefix):
+                break
+            if self._alive[doc]:
+                docs.append(doc)
+                if limit is not None and len(docs) >= limit:
+                    break
+        return np.asarray(docs, dtype=np.int64)
+
+    def autocomplete(self, prefix: str, limit: int = 10) -> List[IndexHit]:
+        """Cards whose name, or a word of it, starts with `prefix` (case-insensitive)."""
+        prefix = prefix.lower().lstrip()
+        if not prefix:
+            return []
+        with self._lock:
+            self._sort_names()
+            seen: Dict[int, None] = {}
+            for doc in self._prefix_docs(prefix, limit * 4).tolist():
+                seen.setdefault(doc)
+                if len(seen) >= limit:
+                    break
+            return [IndexHit(self._docs[d].key, self._docs[d].name, 1.0) for d in seen]
+
+    def tags(self) -> Dict[str, int]:
+        """Every tag with the number of live cards carrying it."""
+        with self._lock:
+            n = len(self._docs)
+            alive = self._alive[:n]
+            counts = {}
+            for tag, row in self._tag_ids.items():
+                count = int((np.unpackbits(self._tag_bits[row], count=n).view(bool) & alive).sum())
+                if count:
+                    counts[tag] = count
+            return counts
+
@@ -0,0 +1,309 @@
+import json
+import hashlib
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .context_window import ApproxTokenizer, Tokenizer
+from .prompt_template import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over many keywords. One pass over a text reports
+    every keyword occurrence, so the cost is linear in the text length
+    however many keywords there are.
+
+    Args:
+        patterns (iterable): (keyword, payload, whole_word) tuples. Keywords
+            must already be lowercased if the text will be.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, Any, bool]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Per state: (keyword length, payload, whole_word) for every keyword ending there.
+        self._out: List[List[Tuple[int, Any, bool]]] = [[]]
+        count = 0
+        for keyword, payload, whole_word in patterns:
+            if not keyword:
+                continue
+            state = 0
+            for ch in keyword:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append((len(keyword), payload, whole_word))
+            count += 1
+        self.pattern_count = count
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                if out[fail[nxt]]:
+                    out[nxt] = out[nxt] + out[fail[nxt]]
+
+    def __len__(self) -> int:
+        return self.pattern_count
+
+    def scan(self, text: str, found: Optional[Set[Any]] = None) -> Set[Any]:
+        """Returns the payloads of all keywords occurring in `text`."""
+        found = set() if found is None else found
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        end = len(text)
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not out[state]:
+                continue
+            for length, payload, whole_word in out[state]:
+                if payload in found:
+                    continue
+                if whole_word:
+                    start = i - length + 1
+                    if start > 0 and _is_word_char(text[start - 1]):
+                        continue
+                    if i + 1 < end and _is_word_char(text[i + 1]):
+                        continue
+                found.add(payload)
+        return found
+
+
+@dataclass
+class LoreEntry:
+    keys: List[str]
+    content: str
+    secondary_keys: List[str] = field(default_factory=list)
+    enabled: bool = True
+    constant: bool = False
+    selective: bool = False
+    case_sensitive: bool = False
+    whole_words: Optional[bool] = None
+    prevent_recursion: bool = False
+    insertion_order: int = 100
+    priority: int = 10
+    # "before_char" or "after_char": ahead of or after the character definitions in the prompt.
+    position: str = "before_char"
+    name: str = ""
+    id: Any = None
+    tokens: int = 0
+
+    @classmethod
+    def from_dict(cls, entry: Dict[str, Any]) -> 'LoreEntry':
+        extensions = entry.get("extensions") or {}
+        whole_words = extensions.get("match_whole_words")
+        return cls(
+            keys=[k for k in entry.get("keys") or [] if isinstance(k, str) and k.strip()],
+            content=entry.get("content") or "",
+            secondary_keys=[k for k in entry.get("secondary_keys") or [] if isinstance(k, str) and k.strip()],
+            enabled=entry.get("enabled", True) is not False,
+            constant=bool(entry.get("constant")),
+            selective=bool(entry.get("selective")),
+            case_sensitive=bool(entry.get("case_sensitive") or extensions.get("case_sensitive")),
+            whole_words=None if whole_words is None else bool(whole_words),
+            prevent_recursion=bool(extensions.get("prevent_recursion")),
+            insertion_order=int(entry.get("insertion_order") or 0),
+            priority=int(entry.get("priority") or 0),
+            position="after_char" if entry.get("position") == "after_char" else "before_char",
+            name=entry.get("name") or entry.get("comment") or "",
+            id=entry.get("id"),
+        )
+
+
+@dataclass
+class LoreActivation:
+    entries: List[LoreEntry]
+    tokens: int
+    dropped: int
+    scanned_chars: int
+
+    def texts(self, position: Optional[str] = None) -> List[str]:
+        return [e.content for e in self.entries if position is None or e.position == position]
+
+
+class Lorebook:
+    """
+    A character book (V2 `character_book`, a.k.a. world info) compiled for
+    keyword scanning.
+
+    All entries' keys go into two Aho-Corasick automata, one for
+    case-insensitive keys (scanned over lowercased text) and one for
+    case-sensitive keys, so a turn costs one pass over the scanned messages
+    regardless of how many entries the book has. Activated entries' content
+    is scanned again for recursive activation; each round only scans the text
+    added by the previous one.
+
+    Args:
+        entries (list of LoreEntry): Book entries.
+        scan_depth (int): Number of recent messages scanned for keys.
+        token_budget (int): Tokens the activated entries may use.
+        recursive_scanning (bool): Let activated entries trigger others.
+        whole_words (bool): Default for entries without `match_whole_words`.
+        max_recursion (int): Recursion rounds.
+        tokenizer (Tokenizer, optional): Counts entry tokens.
+    """
+
+    def __init__(self, entries: Sequence[LoreEntry], name: str = "", scan_depth: int = 2,
+                 token_budget: int = 1024, recursive_scanning: bool = False, whole_words: bool = True,
+                 max_recursion: int = 3, tokenizer: Optional[Tokenizer] = None):
+        self.name = name
+        self.entries = [e for e in entries if e.enabled and e.content]
+        self.scan_depth = scan_depth
+        self.token_budget = token_budget
+        self.recursive_scanning = recursive_scanning
+        self.max_recursion = max_recursion
+        tokenizer = tokenizer or ApproxTokenizer()
+        for entry in self.entries:
+            entry.tokens = tokenizer.count(entry.content)
+
+        # Payloads are (entry index, is_secondary).
+        folded, exact = [], []
+        for index, entry in enumerate(self.entries):
+            whole = whole_words if entry.whole_words is None else entry.whole_words
+            target = exact if entry.case_sensitive else folded
+            for key in entry.keys:
+                target.append((key if entry.case_sensitive else key.lower(), (index, False), whole))
+            if entry.selective:
+                for key in entry.secondary_keys:
+                    target.append((key if entry.case_sensitive else key.lower(), (index, True), whole))
+        self._folded = KeywordMatcher(folded)
+        self._exact = KeywordMatcher(exact)
+        self._constant = [i for i, e in enumerate(self.entries) if e.constant]
+
+    @classmethod
+    def from_card(cls, book: Optional[Dict[str, Any]], **kwargs: Any) -> Optional['Lorebook']:
+        """Compiles a `character_book` dict; returns None for an empty or missing book."""
+        if not isinstance(book, dict):
+            return None
+        entries = []
+        for raw in book.get("entries") or []:
+            if not isinstance(raw, dict):
+                continue
+            try:
+                entries.append(LoreEntry.from_dict(raw))
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Skipping malformed lorebook entry {raw.get('id')}: {e}")
+        if not entries:
+            return None
+        options = {"name": book.get("name") or ""}
+        if book.get("scan_depth") is not None:
+            options["scan_depth"] = int(book["scan_depth"])
+        if book.get("token_budget") is not None:
+            options["token_budget"] = int(book["token_budget"])
+        if book.get("recursive_scanning") is not None:
+            options["recursive_scanning"] = bool(book["recursive_scanning"])
+        options.update(kwargs)
+        return cls(entries, **options)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _scan(self, text: str, hits: Set[Tuple[int, bool]]):
+        if len(self._folded):
+            self._folded.scan(text.lower(), hits)
+        if len(self._exact):
+            self._exact.scan(text, hits)
+
+    def _resolve(self, hits: Set[Tuple[int, bool]], active: Set[int]) -> List[int]:
+        new = []
+        for index, secondary in hits:
+            if secondary or index in active:
+                continue
+            if self.entries[index].selective and self.entries[index].secondary_keys \
+                    and (index, True) not in hits:
+                continue
+            new.append(index)
+        return new
+
+    def activate(self, messages: Sequence[Dict[str, str]], scan_depth: Optional[int] = None,
+                 token_budget: Optional[int] = None) -> LoreActivation:
+        """
+        Finds the entries triggered by the last `scan_depth` messages.
+
+        Returns:
+            LoreActivation: Entries that fit the token budget, ordered by
+            `insertion_order`. When the budget runs out, entries with lower
+            `priority` are dropped first; constant entries go first.
+        """
+        depth = self.scan_depth if scan_depth is None else scan_depth
+        budget = self.token_budget if token_budget is None else token_budget
+        recent = messages[-depth:] if depth > 0 else []
+
+        hits: Set[Tuple[int, bool]] = set()
+        scanned = 0
+        for message in recent:
+            content = message.get("content", "")
+            scanned += len(content)
+            self._scan(content, hits)
+
+        active: Set[int] = set(self._constant)
+        new = self._resolve(hits, active)
+        active.update(new)
+        rounds = 0
+        while new and self.recursive_scanning and rounds < self.max_recursion:
+            rounds += 1
+            for index in new:
+                entry = self.entries[index]
+                if not entry.prevent_recursion:
+                    scanned += len(entry.content)
+                    self._scan(entry.content, hits)
+            new = self._resolve(hits, active)
+            active.update(new)
+
+        ranked = sorted(active, key=lambda i: (not self.entries[i].constant, -self.entries[i].priority,
+                                               self.entries[i].insertion_order))
+        chosen, used = [], 0
+        for index in ranked:
+            tokens = self.entries[index].tokens
+            if used + tokens > budget:
+                continue
+            chosen.append(index)
+            used += tokens
+        chosen.sort(key=lambda i: (self.entries[i].insertion_order, i))
+        return LoreActivation([self.entries[i] for i in chosen], used, len(active) - len(chosen), scanned)
+
+
+# Compiled books keyed by a digest of the card's `character_book`, so sessions
+# of the same card share one automaton. A Lorebook is not modified by `activate`.
+lorebook_cache = LRUCache(maxsize=256)
+_MISSING = object()
+
+
+def lorebook_from_card_cached(book: Optional[Dict[str, Any]]) -> Optional[Lorebook]:
+    """`Lorebook.from_card` with the result shared through `lorebook_cache`."""
+    if not isinstance(book, dict):
+        return None
+    try:
+        encoded = json.dumps(book, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    except (TypeError, ValueError):
+        return Lorebook.from_card(book)
+    key = hashlib.blake2b(encoded.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    lorebook = lorebook_cache.get(key, _MISSING)
+    if lorebook is _MISSING:
+        lorebook = Lorebook.from_card(book)
+        lorebook_cache.put(key, lorebook)
+    return lorebook
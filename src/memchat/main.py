@@ -1,42 +1,300 @@
-
+import sys
+import asyncio
+import signal
 import logging
+import threading
+from typing import AsyncIterator, List, Optional, Sequence, Union
+from .character_cache import character_cache
 from .character_system import AICharacter
-from .config import DEBUG_MODE 
-
-if DEBUG_MODE:
-    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-else:
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from .config import settings
+from .consolidation import ConsolidationWorker
+from .context_window import AssembledContext, BudgetReport, ContextAssembler
+from .history import ChatHistoryLog
+from .lorebook import lorebook_from_card_cached
+from .metrics import SamplingProfiler, metrics
+from .providers import ChatStream, LLMProvider, Message, create_provider
 
 logger = logging.getLogger(__name__)
 
+
+def _configure_logging():
+    # Done when the app starts rather than at import, so importing memchat.main stays cheap.
+    level = logging.DEBUG if settings.DEBUG_MODE else logging.INFO
+    logging.basicConfig(level=level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
 class chat_agent:
 
-    def __init__(self, character: AICharacter, chat_historic = None): # TODO: LLM provider interface for this; 
+    # Messages kept in memory (and sent to the provider) when resuming from a history log.
+    history_window = 200
+    # Model context size used for trimming the prompt.
+    context_tokens = 8192
+    # Once this many messages are older than the newest `keep_recent_messages`,
+    # they are handed to the consolidator as one window.
+    consolidation_window = 40
+    keep_recent_messages = 20
+
+    def __init__(self, character: AICharacter, chat_historic: Union[List[Message], ChatHistoryLog, None] = None,
+                 provider: Optional[LLMProvider] = None, user_name: str = "User", pick_greeting=False,
+                 context: Optional[ContextAssembler] = None, consolidator: Optional[ConsolidationWorker] = None,
+                 session: Optional[str] = None, profiler: Optional[SamplingProfiler] = None):
         self.character = character
-        pass
+        self.provider = provider or create_provider()
+        self.context = context or ContextAssembler(self.context_tokens)
+        self.last_context_report: Optional[BudgetReport] = None
+        self.consolidator = consolidator
+        self.session = session
+        # Samples this session's turns only; see SamplingProfiler.session().
+        self.profiler = profiler
+        self._consolidated = 0
+        self.user_name = user_name
+        self.context_block, self.first_message = character.get_initial_llm_message(user_name, pick_greeting)
+        # Shared with every session of a card with the same book; compiled once.
+        self.lorebook = lorebook_from_card_cached(character.data_character_book)
+        self.history_log: Optional[ChatHistoryLog] = None
+        if isinstance(chat_historic, ChatHistoryLog):
+            self.history_log = chat_historic
+            chat_historic = [{"role": r["role"], "content": r["content"]}
+                             for r in chat_historic.tail(self.history_window)]
+        self.messages: List[Message] = list(chat_historic) if chat_historic else []
+        if not self.messages:
+            self._record({"role": "assistant", "content": self.first_message})
+        self.last_stream: Optional[ChatStream] = None
+        self._reply_task: Optional[asyncio.Task] = None
+
+    def _record(self, message: Message):
+        self.messages.append(message)
+        if self.history_log is not None:
+            self.history_log.append(message)
+
+    def system_prompt(self, lore: Sequence[str] = ()) -> str:
+        """`lore` holds the activated `before_char` lorebook entries, placed ahead of the character context."""
+        # A card system prompt replaces the default one; {{original}} in it inserts the default.
+        default = settings.SYSTEM_PROMPT or ""
+        system_prompt = self.character.get_system_prompt()
+        system_prompt = self.character.parse_names(self.user_name, system_prompt, default) if system_prompt else default
+        parts = [system_prompt] if system_prompt else []
+        if lore:
+            parts.append("[Lorebook]\n" + "\n".join(lore))
+        parts.append(self.context_block)
+        return "\n\n".join(parts)
+
+    def _schedule_consolidation(self):
+        """Hands full windows of old messages to the background consolidator; never waits on it."""
+        if self.consolidator is None:
+            return
+        while len(self.messages) - self._consolidated >= self.consolidation_window + self.keep_recent_messages:
+            window = self.messages[self._consolidated:self._consolidated + self.consolidation_window]
+            self.consolidator.submit(window, session=self.session, first_id=self._consolidated)
+            self._consolidated += self.consolidation_window
+
+    @metrics.timed("prompt_build_seconds")
+    def build_context(self, memories: Optional[List[str]] = None) -> AssembledContext:
+        """
+        Fits the system prompt, card instructions, lorebook entries, memories
+        and history into the context budget. Lorebook entries go before or
+        after the character context according to their `position`.
+        """
+        character = self.character
+        sections = []
+        lore_before: List[str] = []
+        history = self.messages
+        if self.consolidator is not None:
+            # Messages folded into the rolling summary are sent as the summary instead.
+            summary = self.consolidator.summary(self.session)
+            if summary:
+                sections.append(("summary", [summary], 0.15))
+                history = self.messages[self.consolidator.summary_end(self.session):]
+        if self.lorebook is not None:
+            lore = self.lorebook.activate(history)
+            lore_before = [character.parse_names(self.user_name, t) for t in lore.texts("before_char")]
+            after = lore.texts("after_char")
+            if after:
+                sections.append(("lorebook", [character.parse_names(self.user_name, t) for t in after], 1.0))
+        if memories:
+            sections.append(("memories", memories, 0.25))
+        default_post_history = settings.POST_HISTORY_INSTRUCTIONS or ""
+        post_history = character.data_post_history_instructions
+        depth_prompt = character.data_extensions_depth_prompt_prompt
+        try:
+            depth = int(character.data_extensions_depth_prompt_depth or 0)
+        except (TypeError, ValueError):
+            depth = 0
+        return self.context.build(
+            system_prompt=self.system_prompt(lore_before),
+            post_history_instructions=(character.parse_names(self.user_name, post_history, default_post_history)
+                                       if post_history else default_post_history),
+            depth_prompt=character.parse_names(self.user_name, depth_prompt) if depth_prompt else "",
+            depth=depth,
+            extra_sections=sections,
+            messages=history,
+        )
+
+    async def send(self, user_input: str) -> AsyncIterator[str]:
+        """
+        Adds the user's message and streams the character's reply. The reply
+        is recorded in the history once complete, or with whatever arrived
+        before an interruption.
+        """
+        if self.profiler is not None:
+            with self.profiler.session():
+                async for chunk in self._send(user_input):
+                    yield chunk
+        else:
+            async for chunk in self._send(user_input):
+                yield chunk
+
+    async def _send(self, user_input: str) -> AsyncIterator[str]:
+        self._record({"role": "user", "content": user_input})
+        context = self.build_context()
+        self.last_context_report = context.report
+        stream = self.provider.stream(context.messages, context.system_prompt)
+        self.last_stream = stream
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            if stream.text:
+                self._record({"role": "assistant", "content": stream.text})
+            self._schedule_consolidation()
 
-    def run(): # TODO: Add message handling, historic logging (into json file); Call aux. Agents.
+    async def reply(self, user_input: str, on_chunk=None) -> str:
+        """Runs `send` as a cancellable task; `interrupt()` stops it early."""
+        async def consume():
+            async for chunk in self.send(user_input):
+                if on_chunk:
+                    on_chunk(chunk)
+
+        self._reply_task = asyncio.create_task(consume())
+        try:
+            await self._reply_task
+        except asyncio.CancelledError:
+            if not self._reply_task.cancelled():
+                raise
+            logger.info("Reply interrupted.")
+        finally:
+            self._reply_task = None
+        return self.last_stream.text if self.last_stream else ""
+
+    def interrupt(self):
+        if self._reply_task and not self._reply_task.done():
+            self._reply_task.cancel()
+
+    def close(self):
+        if self.history_log is not None:
+            self.history_log.close()
+        if self.consolidator is not None:
+            self.consolidator.forget(self.session)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        print(f"{self.character.name}: {self.messages[-1]['content']}")
         while True:
-            user_input = input("You: ")
-            
+            try:
+                user_input = await asyncio.to_thread(input, "You: ")
+            except EOFError:
+                break
+            if not user_input.strip():
+                continue
+
+            print(f"{self.character.name}: ", end="", flush=True)
+            try:
+                loop.add_signal_handler(signal.SIGINT, self.interrupt)
+            except (NotImplementedError, RuntimeError):
+                pass
+            try:
+                await self.reply(user_input, on_chunk=lambda chunk: print(chunk, end="", flush=True))
+            finally:
+                try:
+                    loop.remove_signal_handler(signal.SIGINT)
+                except (NotImplementedError, RuntimeError):
+                    pass
+            print()
+            if not logger.isEnabledFor(logging.DEBUG):
+                continue
+            stats = self.last_stream.stats if self.last_stream else None
+            if stats and stats.time_to_first_token is not None:
+                logger.debug("Time to first token: %.3fs, total: %.3fs", stats.time_to_first_token, stats.total_time)
+            if self.last_context_report:
+                logger.debug("Context budget: %s", self.last_context_report.as_dict())
+            if self.consolidator is not None:
+                logger.debug("Consolidation: %s", self.consolidator.snapshot())
+
+
+def _start_metrics() -> Optional[threading.Event]:
+    """Enables instrumentation when configured; returns the snapshot writer's stop event, if any."""
+    if not (settings.METRICS_ENABLED or settings.METRICS_PORT or settings.METRICS_SNAPSHOT_PATH):
+        return None
+    metrics.enable()
+    if settings.METRICS_PORT:
+        metrics.serve(settings.METRICS_PORT)
+    if settings.METRICS_SNAPSHOT_PATH:
+        return metrics.write_snapshots(settings.METRICS_SNAPSHOT_PATH)
+    return None
 
 
-def run():
+def _serve(argv: List[str]):
+    import argparse
+    from .server import serve
+
+    parser = argparse.ArgumentParser(prog="memchat-app serve", description="Run the multi-session chat server.")
+    parser.add_argument("characters_dir", help="directory that session character paths are resolved against")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--history-dir", help="keep per-session chat histories here")
+    parser.add_argument("--max-sessions", type=int, default=10000)
+    parser.add_argument("--idle-timeout", type=float, default=1800.0,
+                        help="seconds before an idle session is evicted (needs --history-dir)")
+    args = parser.parse_args(argv)
+    serve(args.characters_dir, args.host, args.port, history_dir=args.history_dir,
+          max_sessions=args.max_sessions, idle_timeout=args.idle_timeout)
+
+
+def run(argv: Optional[List[str]] = None):
+    _configure_logging()
+    stop_snapshots = _start_metrics()
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["serve"]:
+        try:
+            _serve(argv[1:])
+        finally:
+            if stop_snapshots is not None:
+                stop_snapshots.set()
+        return
     logger.info("Hello from memchat!")
     username = input("What is your name? ")
     logger.info(f"Hello, {username}!")
     char_path = input("Insert path of the character to load: ").strip("'\"")
-    
-    char = AICharacter.load_from_file(char_path)
+
+    char = character_cache.get(char_path)
 
     if char:
         logger.info(f"Character loaded: {char}")
     else:
         logger.error("Failed to load character.")
+        return
+
+    history_dir = input("Chat history directory (leave empty to not keep history): ").strip("'\"")
+    history_log = ChatHistoryLog(history_dir) if history_dir else None
 
-    context_block, first_message = char.get_initial_llm_message(username)
-    logger.info(first_message)
+    # Aux. agents (summaries, fact extraction) run in the background on their own provider.
+    consolidator = ConsolidationWorker(create_provider())
+    profiler = SamplingProfiler().start() if settings.PROFILE_OUTPUT else None
+    agent = chat_agent(char, chat_historic=history_log, user_name=username, consolidator=consolidator,
+                       session=char.name, profiler=profiler)
+    try:
+        asyncio.run(agent.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.close()
+        consolidator.close(wait=False)
+        if profiler is not None:
+            profiler.stop()
+            profiler.save(settings.PROFILE_OUTPUT)
+            logger.info(f"Profile written to {settings.PROFILE_OUTPUT} ({profiler.total} samples, {profiler.idle} idle)")
+        if stop_snapshots is not None:
+            stop_snapshots.set()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,336 @@
+import os
+import re
+import time
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .embeddings import _encode_batch, _mix64, _POLY, hash_byte_ngrams
+
+logger = logging.getLogger(__name__)
+
+_SIGNATURES_NAME = "minhash.npy"
+_EMPTY = np.uint32(0xFFFFFFFF)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def lsh_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Picks (bands, rows) with bands * rows == num_perm so the LSH candidate
+    curve crosses 50% just below `threshold`; candidates are then verified
+    against the full signature, so erring low only costs a comparison.
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        crossover = (1.0 / bands) ** (1.0 / rows)
+        score = abs(crossover - threshold) + (0.05 if crossover > threshold else 0.0)
+        if best is None or score < best[0]:
+            best = (score, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """
+    MinHash signatures of whitespace-normalized, lowercased byte n-grams,
+    computed for a whole batch with NumPy. Texts shorter than `ngram` bytes
+    get an empty signature and never match anything.
+
+    Args:
+        num_perm (int): Signature length (hash functions).
+        ngram (int): Shingle size in bytes.
+        seed (int): Seeds the hash functions; signatures are only comparable
+            between hashers with the same settings.
+    """
+
+    # Shingles hashed per step; bounds the (shingles x num_perm) temporary.
+    chunk_shingles = 16384
+
+    def __init__(self, num_perm: int = 64, ngram: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.ngram = ngram
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self._salts = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        """Returns an array of shape (len(texts), num_perm), dtype uint32."""
+        out = np.full((len(texts), self.num_perm), _EMPTY, dtype=np.uint32)
+        if not texts:
+            return out
+        data, owner = _encode_batch([_WHITESPACE_RE.sub(" ", t).strip() for t in texts])
+        hashes, rows = hash_byte_ngrams(data, owner, self.ngram)
+        for i in range(0, len(hashes), self.chunk_shingles):
+            h = hashes[i:i + self.chunk_shingles]
+            r = rows[i:i + self.chunk_shingles]
+            permuted = (_mix64(h[:, None] ^ self._salts[None, :]) >> np.uint64(32)).astype(np.uint32)
+            # n-grams come in text order, so each text's rows are contiguous.
+            starts = np.flatnonzero(np.concatenate(([True], r[1:] != r[:-1])))
+            mins = np.minimum.reduceat(permuted, starts, axis=0)
+            targets = r[starts]
+            out[targets] = np.minimum(out[targets], mins)
+        return out
+
+
+def band_keys(signatures: np.ndarray, bands: int) -> np.ndarray:
+    """Hashes each band of each signature to 64 bits. Returns shape (n, bands)."""
+    n, num_perm = signatures.shape
+    rows = num_perm // bands
+    values = signatures.reshape(n, bands, rows).astype(np.uint64)
+    h = np.full((n, bands), np.uint64(rows), dtype=np.uint64)
+    for j in range(rows):
+        h = h * _POLY + values[:, :, j]
+    return _mix64(h ^ np.arange(bands, dtype=np.uint64))
+
+
+@dataclass
+class DedupStats:
+    inserted: int = 0
+    merged: int = 0
+    seconds: float = 0.0
+
+    @property
+    def dedup_ratio(self) -> float:
+        total = self.inserted + self.merged
+        return self.merged / total if total else 0.0
+
+    @property
+    def overhead_per_insert(self) -> float:
+        """Seconds of dedup work (signatures, LSH lookups) per memory offered."""
+        total = self.inserted + self.merged
+        return self.seconds / total if total else 0.0
+
+
+class MemoryDeduper:
+    """
+    Near-duplicate filter in front of a VectorMemoryStore.
+
+    `add` has the store's signature. Each text gets a MinHash signature; LSH
+    band buckets give candidate rows, and a candidate whose estimated Jaccard
+    similarity reaches `threshold` absorbs the new memory (its reference
+    count goes up and its timestamp moves forward) instead of a new row
+    being stored. Duplicates within one batch are caught as well. Only rows
+    of the same session are matched, so the same text said in two sessions
+    stays searchable under both.
+
+    Signatures are kept in `minhash.npy` next to the store. Rows missing
+    from it, e.g. for a store filled before dedup was enabled, are hashed
+    from the stored texts when the deduper is opened; `dedup_existing()`
+    then merges duplicates already in the store.
+
+    Args:
+        store (VectorMemoryStore): Store to write to.
+        threshold (float): Estimated Jaccard similarity that counts as a duplicate.
+        num_perm (int): MinHash signature length.
+        ngram (int): Shingle size in bytes.
+    """
+
+    def __init__(self, store: Any, threshold: float = 0.8, num_perm: int = 64, ngram: int = 5, seed: int = 1):
+        self.store = store
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, ngram, seed)
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        self.stats = DedupStats()
+        self._path = os.path.join(store.directory, _SIGNATURES_NAME)
+        self._signatures = np.full((max(1024, store.count), num_perm), _EMPTY, dtype=np.uint32)
+        self._size = 0
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(self.bands)]
+        self._load()
+
+    # --- signatures ---
+
+    def _append_signatures(self, signatures: np.ndarray):
+        needed = self._size + len(signatures)
+        if needed > len(self._signatures):
+            grown = np.full((max(needed, 2 * len(self._signatures)), self.hasher.num_perm), _EMPTY, dtype=np.uint32)
+            grown[:self._size] = self._signatures[:self._size]
+            self._signatures = grown
+        self._signatures[self._size:needed] = signatures
+        self._size = needed
+
+    def _load(self):
+        count = self.store.count
+        if os.path.exists(self._path):
+            saved = np.load(self._path)
+            if saved.shape[1] == self.hasher.num_perm and len(saved) <= count:
+                self._append_signatures(saved)
+            else:
+                logger.warning(f"Ignoring {self._path}: built with other settings or for another store")
+        missing = count - self._size
+        if missing:
+            logger.info(f"Hashing {missing} memories for near-duplicate detection")
+            step = 4096
+            for start in range(self._size, count, step):
+                records = self.store.get_records(range(start, min(start + step, count)))
+                self._append_signatures(self.hasher.signatures([r.get("text", "") for r in records]))
+        live = np.flatnonzero(self.store.counts[:count] > 0)
+        self._index_rows(live)
+
+    def _keys(self, signatures: np.ndarray, sessions: np.ndarray) -> np.ndarray:
+        # Salting band keys with the session keeps buckets per session.
+        salt = _mix64(np.asarray(sessions, dtype=np.int64).astype(np.uint64) + np.uint64(1))
+        return band_keys(signatures, self.bands) ^ salt[:, None]
+
+    def _index_rows(self, indices: np.ndarray):
+        if not len(indices):
+            return
+        signatures = self._signatures[indices]
+        keys = self._keys(signatures, self.store.session_ids[indices])
+        usable = (signatures != _EMPTY).any(axis=1)
+        for band, buckets in enumerate(self._buckets):
+            for index, key in zip(indices[usable].tolist(), keys[usable, band].tolist()):
+                buckets.setdefault(key, []).append(index)
+
+    def _rebuild_index(self):
+        self._buckets = [{} for _ in range(self.bands)]
+        self._index_rows(np.flatnonzero(self.store.counts[:self._size] > 0))
+
+    def flush(self):
+        tmp_path = self._path + ".tmp.npy"
+        np.save(tmp_path, self._signatures[:self._size])
+        os.replace(tmp_path, self._path)
+
+    # --- matching ---
+
+    def _best_match(self, signature: np.ndarray, keys: np.ndarray, session: int,
+                    pending: Sequence[np.ndarray] = ()) -> int:
+        """Most similar indexed row of `session` at or above the threshold, or -1."""
+        candidates = set()
+        for band, key in enumerate(keys.tolist()):
+            bucket = self._buckets[band].get(key)
+            if bucket:
+                candidates.update(bucket)
+        if not candidates:
+            return -1
+        ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        known = ids < self._size
+        # Rows pending in this batch share its session; stored rows are checked.
+        same = ~known
+        same[known] = self.store.session_ids[ids[known]] == session
+        ids, known = ids[same], known[same]
+        if not len(ids):
+            return -1
+        rows = np.empty((len(ids), signature.shape[0]), dtype=np.uint32)
+        rows[known] = self._signatures[ids[known]]
+        for i in np.flatnonzero(~known):
+            rows[i] = pending[ids[i] - self._size]
+        similarity = (rows == signature).mean(axis=1)
+        best = int(np.argmax(similarity))
+        return int(ids[best]) if similarity[best] >= self.threshold else -1
+
+    def add(self, embeddings: np.ndarray, texts: Sequence[str], session: Optional[str] = None,
+            timestamps: Optional[Sequence[float]] = None,
+            metadata: Optional[Sequence[Dict[str, Any]]] = None) -> np.ndarray:
+        """
+        Stores the memories that are not near-duplicates and counts the rest
+        against the memory they duplicate.
+
+        Returns:
+            ndarray: For each input, the index of the row that now holds it.
+        """
+        start = time.perf_counter()
+        signatures = self.hasher.signatures(texts)
+        code = self.store._session_code(session)
+        keys = self._keys(signatures, np.full(len(texts), code))
+        usable = (signatures != _EMPTY).any(axis=1)
+
+        result = np.empty(len(texts), dtype=np.int64)
+        fresh: List[int] = []
+        pending: List[np.ndarray] = []
+        duplicates: List[int] = []
+        for i in range(len(texts)):
+            match = self._best_match(signatures[i], keys[i], code, pending) if usable[i] else -1
+            if match >= 0:
+                result[i] = match
+                duplicates.append(i)
+                continue
+            row = self._size + len(fresh)
+            result[i] = row
+            fresh.append(i)
+            pending.append(signatures[i])
+            if usable[i]:
+                for band, key in enumerate(keys[i].tolist()):
+                    self._buckets[band].setdefault(key, []).append(row)
+        self.stats.seconds += time.perf_counter() - start
+
+        if fresh:
+            subset = np.asarray(fresh)
+            try:
+                self.store.add(
+                    np.asarray(embeddings)[subset], [texts[i] for i in fresh], session=session,
+                    timestamps=None if timestamps is None else np.asarray(timestamps, dtype=np.float64)[subset],
+                    metadata=None if metadata is None else [metadata[i] for i in fresh],
+                )
+            except BaseException:
+                # Drop the bucket entries of rows that were never stored.
+                self._rebuild_index()
+                raise
+            self._append_signatures(signatures[subset])
+        if duplicates:
+            targets = result[duplicates]
+            self.store.bump(targets, None if timestamps is None
+                            else np.asarray(timestamps, dtype=np.float64)[duplicates])
+        self.stats.inserted += len(fresh)
+        self.stats.merged += len(duplicates)
+        return result
+
+    def dedup_existing(self) -> int:
+        """
+        Batch mode: merges near-duplicate rows already in the store into the
+        oldest row of each group, within each session. Returns the number of
+        rows merged away.
+        """
+        start = time.perf_counter()
+        live = np.flatnonzero(self.store.counts[:self._size] > 0)
+        signatures = self._signatures[live]
+        usable = (signatures != _EMPTY).any(axis=1)
+        live, signatures = live[usable], signatures[usable]
+        if len(live) < 2:
+            return 0
+        sessions = self.store.session_ids[live]
+        keys = self._keys(signatures, sessions)
+
+        parent = np.arange(len(live))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for band in range(self.bands):
+            # Rows sharing a band key are candidates; compare each with the first of its bucket.
+            _, first, inverse = np.unique(keys[:, band], return_index=True, return_inverse=True)
+            heads = first[inverse]
+            members = np.flatnonzero(heads != np.arange(len(live)))
+            if not len(members):
+                continue
+            similarity = (signatures[members] == signatures[heads[members]]).mean(axis=1)
+            match = (similarity >= self.threshold) & (sessions[members] == sessions[heads[members]])
+            for a, b in zip(heads[members][match].tolist(), members[match].tolist()):
+                ra, rb = find(a), find(b)
+                if ra != rb:
+                    parent[max(ra, rb)] = min(ra, rb)
+
+        roots = np.array([find(i) for i in range(len(live))])
+        merged = np.flatnonzero(roots != np.arange(len(live)))
+        self.store.merge(live[roots[merged]], live[merged])
+        self._rebuild_index()
+        self.stats.seconds += time.perf_counter() - start
+        self.stats.merged += len(merged)
+        logger.info(f"Merged {len(merged)} near-duplicate memories in {self.store.directory}")
+        return len(merged)
+
+    def search(self, *args: Any, **kwargs: Any):
+        return self.store.search(*args, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def close(self):
+        self.flush()
+        self.store.close()
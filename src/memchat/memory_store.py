@@ -0,0 +1,691 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import tempfile
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+logger = logging.getLogger(__name__)
+
+_META_NAME = "meta.json"
+_VECTORS_NAME = "vectors.npy"
+_TIMESTAMPS_NAME = "timestamps.npy"
+_SESSIONS_NAME = "sessions.npy"
+_OFFSETS_NAME = "record_offsets.npy"
+_COUNTS_NAME = "counts.npy"
+_RECORDS_NAME = "records.jsonl"
+# Index generation g lives in ivf-<g>.npz (lists and centroids) and ivf-<g>-codes.npy.
+_INDEX_PREFIX = "ivf-"
+
+_NO_SESSION = -1
+
+
+class MemoryHit(NamedTuple):
+    index: int
+    score: float
+    record: Optional[Dict[str, Any]]
+
+
+def _atomic_write_json(path: str, data: Dict[str, Any]):
+    fd, tmp_path = tempfile.mkstemp(prefix=".meta-", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _nearest(data: np.ndarray, centroids: np.ndarray, block: int = 65536) -> np.ndarray:
+    assign = np.empty(len(data), dtype=np.int32)
+    for i in range(0, len(data), block):
+        assign[i:i + block] = np.argmax(data[i:i + block] @ centroids.T, axis=1)
+    return assign
+
+
+def _kmeans(data: np.ndarray, n: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Spherical k-means: unit centroids maximizing the summed cosine similarity to their rows."""
+    n = min(n, len(data))
+    centroids = data[rng.choice(len(data), n, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(data, centroids)
+        # Per-cluster sums as a one-hot product: much faster than np.add.reduceat over rows.
+        onehot = np.zeros((n, len(data)), dtype=np.float32)
+        onehot[assign, np.arange(len(data))] = 1
+        filled = onehot.any(axis=1)
+        centroids[filled] = (onehot @ data)[filled]
+        if not filled.all():
+            centroids[~filled] = data[rng.choice(len(data), int((~filled).sum()), replace=False)]
+        centroids = _normalize_rows(centroids)
+    return centroids
+
+
+class _IVFIndex:
+    """
+    Inverted-file index over rows [0, count) of a store: rows are grouped
+    into lists by nearest centroid, and each list keeps its rows' int8 codes
+    contiguously, so a query only decodes the lists it probes.
+
+    Centroids come from two-level k-means (coarse centroids, then fine
+    centroids within each coarse cluster), which keeps assigning a million
+    rows to thousands of lists cheap.
+    """
+
+    def __init__(self, coarse: np.ndarray, fine_starts: np.ndarray, centroids: np.ndarray, scale: np.ndarray,
+                 offsets: np.ndarray, rows: np.ndarray, codes: np.ndarray, trained: int):
+        self.coarse = coarse
+        self.fine_starts = fine_starts
+        self.centroids = centroids
+        self.scale = scale
+        self.offsets = offsets
+        self.rows = rows
+        self.codes = codes
+        self.trained = trained
+
+    @property
+    def count(self) -> int:
+        return len(self.rows)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, count: int, rng: np.random.Generator) -> "_IVFIndex":
+        nlist = max(16, int(4 * np.sqrt(count)))
+        n_coarse = max(4, int(np.ceil(np.sqrt(nlist))))
+        n_fine = max(1, nlist // n_coarse)
+        sample_rows = np.sort(rng.choice(count, min(count, 32 * n_coarse * n_fine), replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+        coarse = _kmeans(sample, n_coarse, 8, rng)
+        sample_assign = _nearest(sample, coarse)
+        fine, starts = [], [0]
+        for c in range(len(coarse)):
+            members = sample[sample_assign == c]
+            children = _kmeans(members, n_fine, 8, rng) if len(members) else coarse[c:c + 1]
+            fine.append(children)
+            starts.append(starts[-1] + len(children))
+        # Per-dimension int8 scale; outliers beyond the sample's range are clipped.
+        scale = np.maximum(np.abs(sample).max(axis=0), 1e-6).astype(np.float32) / 127
+        centroids = np.concatenate(fine)
+        return cls(coarse, np.asarray(starts, dtype=np.int64), centroids, scale, np.zeros(len(centroids) + 1, np.int64),
+                   np.zeros(0, dtype=np.int64), np.zeros((0, sample.shape[1]), np.int8), count)
+
+    def assign(self, block: np.ndarray) -> np.ndarray:
+        coarse = _nearest(block, self.coarse)
+        lists = np.empty(len(block), dtype=np.int64)
+        for c in np.unique(coarse):
+            members = np.flatnonzero(coarse == c)
+            lo, hi = self.fine_starts[c], self.fine_starts[c + 1]
+            lists[members] = lo + _nearest(block[members], self.centroids[lo:hi])
+        return lists
+
+    def quantize(self, block: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(block / self.scale), -127, 127).astype(np.int8)
+
+    def extended(self, vectors: np.ndarray, stop: int, codes_path: str, block: int = 65536) -> "_IVFIndex":
+        """A new index that also covers rows [count, stop), written to `codes_path`."""
+        start = self.count
+        lists, codes = [], []
+        for i in range(start, stop, block):
+            chunk = np.asarray(vectors[i:min(i + block, stop)], dtype=np.float32)
+            lists.append(self.assign(chunk))
+            codes.append(self.quantize(chunk))
+        new_lists = np.concatenate(lists) if lists else np.zeros(0, dtype=np.int64)
+        new_codes = np.concatenate(codes) if codes else np.zeros((0, self.codes.shape[1]), np.int8)
+        order = np.argsort(new_lists, kind="stable")
+        new_rows = np.arange(start, stop, dtype=np.int64)[order]
+        new_codes = new_codes[order]
+        nlist = len(self.centroids)
+        new_sizes = np.bincount(new_lists, minlength=nlist)
+        new_starts = np.concatenate(([0], np.cumsum(new_sizes)))
+
+        offsets = np.concatenate(([0], np.cumsum(np.diff(self.offsets) + new_sizes))).astype(np.int64)
+        rows = np.empty(stop, dtype=np.int64)
+        out = open_memmap(codes_path, mode="w+", dtype=np.int8, shape=(stop, self.codes.shape[1]))
+        for l in range(nlist):
+            pos = offsets[l]
+            old_lo, old_hi = self.offsets[l], self.offsets[l + 1]
+            mid = pos + old_hi - old_lo
+            rows[pos:mid] = self.rows[old_lo:old_hi]
+            out[pos:mid] = self.codes[old_lo:old_hi]
+            rows[mid:offsets[l + 1]] = new_rows[new_starts[l]:new_starts[l + 1]]
+            out[mid:offsets[l + 1]] = new_codes[new_starts[l]:new_starts[l + 1]]
+        out.flush()
+        return _IVFIndex(self.coarse, self.fine_starts, self.centroids, self.scale, offsets, rows, out, self.trained)
+
+    def scan(self, query: np.ndarray, lists: np.ndarray):
+        """Candidate rows of the probed lists with their approximate scores."""
+        scaled = query * self.scale
+        spans = [(self.offsets[l], self.offsets[l + 1]) for l in lists]
+        rows = np.concatenate([self.rows[a:b] for a, b in spans])
+        # Decoding list by list keeps each float block in cache for its product.
+        return rows, np.concatenate([self.codes[a:b].astype(np.float32) @ scaled for a, b in spans])
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(f, coarse=self.coarse, fine_starts=self.fine_starts, centroids=self.centroids,
+                     scale=self.scale, offsets=self.offsets, rows=self.rows, trained=np.int64(self.trained))
+            f.flush()
+            os.fsync(f.fileno())
+
+    @classmethod
+    def load(cls, path: str, codes_path: str) -> "_IVFIndex":
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        return cls(arrays["coarse"], arrays["fine_starts"], arrays["centroids"], arrays["scale"],
+                   arrays["offsets"], arrays["rows"], open_memmap(codes_path, mode="r"), int(arrays["trained"]))
+
+
+class VectorMemoryStore:
+    """
+    Long-term memory of one character: unit-normalized embeddings in a
+    contiguous memory-mapped matrix, with timestamp and session columns for
+    filtering and the memory texts in a JSONL side file. A reference count
+    per row records how often a memory was stored again (see
+    `memory_dedup`); rows merged into another have count 0 and are skipped
+    by searches.
+
+    Storage grows by doubling, so appends are amortized O(1). Small stores
+    are searched exactly: a blocked matrix product against all (or the
+    filtered) rows followed by a partial sort. From `min_index_rows` rows on,
+    `flush()` maintains an IVF index (see `_IVFIndex`): a query scores the
+    centroids, decodes the int8 codes of the `nprobe` closest lists,
+    re-ranks the best candidates with the stored vectors and merges the
+    exact scan of rows appended since the index was built.
+
+    Args:
+        directory (str): Store directory; created if missing.
+        dim (int, optional): Embedding size. Required when creating a store.
+        dtype (str): "float32" or "float16" storage. float16 halves disk and
+            page-cache use, but each search block is converted to float32
+            first, so float32 is the faster choice for large stores.
+        initial_capacity (int): Rows allocated for a new store.
+    """
+
+    block_rows = 262144
+    # Below this fraction of matching rows, filtered rows are gathered instead of masking a full scan.
+    gather_threshold = 0.25
+    # Stores smaller than this are only searched exactly.
+    min_index_rows = 20000
+    # Rows appended since the last build are scanned exactly; past this many the index is extended.
+    max_unindexed_rows = 8192
+    # Lists probed per query, and approximate candidates re-ranked with exact scores.
+    nprobe = 64
+    rerank = 64
+
+    def __init__(self, directory: str, dim: Optional[int] = None, dtype: str = "float32",
+                 initial_capacity: int = 1024):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, _META_NAME)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if dim is not None and dim != meta["dim"]:
+                raise ValueError(f"Memory store at {directory} has dim {meta['dim']}, not {dim}")
+            self.dim = meta["dim"]
+            self.dtype = np.dtype(meta["dtype"])
+            self.count = meta["count"]
+            self.capacity = meta["capacity"]
+            self.sessions: List[str] = meta["sessions"]
+            self.dead = meta.get("dead", 0)
+            self._index_generation = meta.get("index_generation")
+            self._open_columns("r+")
+            self._truncate_records()
+            self._load_index()
+        else:
+            if dim is None:
+                raise ValueError("dim is required to create a memory store")
+            if np.dtype(dtype) not in (np.float32, np.float16):
+                raise ValueError(f"Unsupported embedding dtype: {dtype}")
+            self.dim = dim
+            self.dtype = np.dtype(dtype)
+            self.count = 0
+            self.capacity = max(1, initial_capacity)
+            self.sessions = []
+            self.dead = 0
+            self._index_generation = None
+            self._ivf = None
+            self._create_columns(self.capacity)
+            open(os.path.join(directory, _RECORDS_NAME), "wb").close()
+            self._write_meta()
+        self._session_codes = {name: i for i, name in enumerate(self.sessions)}
+        self._records_file = open(os.path.join(directory, _RECORDS_NAME), "ab")
+
+    # --- storage ---
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _column_specs(self):
+        return (
+            ("vectors", _VECTORS_NAME, self.dtype, (self.dim,)),
+            ("timestamps", _TIMESTAMPS_NAME, np.dtype(np.float64), ()),
+            ("session_ids", _SESSIONS_NAME, np.dtype(np.int32), ()),
+            ("offsets", _OFFSETS_NAME, np.dtype(np.uint64), ()),
+            ("counts", _COUNTS_NAME, np.dtype(np.uint32), ()),
+        )
+
+    def _create_columns(self, capacity: int, suffix: str = ""):
+        for attr, name, dtype, shape in self._column_specs():
+            column = open_memmap(self._path(name + suffix), mode="w+", dtype=dtype, shape=(capacity,) + shape)
+            setattr(self, attr, column)
+
+    def _open_columns(self, mode: str):
+        for attr, name, dtype, shape in self._column_specs():
+            if attr == "counts" and not os.path.exists(self._path(name)):
+                # Stores created before reference counts: every row counts once.
+                column = open_memmap(self._path(name), mode="w+", dtype=dtype, shape=(self.capacity,))
+                column[:] = 1
+                column.flush()
+            setattr(self, attr, open_memmap(self._path(name), mode=mode))
+
+    def _write_meta(self):
+        _atomic_write_json(self._path(_META_NAME), {
+            "dim": self.dim, "dtype": self.dtype.name, "count": self.count,
+            "capacity": self.capacity, "sessions": self.sessions, "dead": self.dead,
+            "index_generation": self._index_generation,
+        })
+
+    def _truncate_records(self):
+        # Records past `count` belong to an append that never committed its metadata.
+        path = self._path(_RECORDS_NAME)
+        if self.count == 0:
+            end = 0
+        else:
+            last = int(self.offsets[self.count - 1])
+            with open(path, "rb") as f:
+                f.seek(last)
+                end = last + len(f.readline())
+        if os.path.getsize(path) > end:
+            with open(path, "r+b") as f:
+                f.truncate(end)
+
+    def _index_paths(self, generation: int):
+        return (self._path(f"{_INDEX_PREFIX}{generation}.npz"), self._path(f"{_INDEX_PREFIX}{generation}-codes.npy"))
+
+    def _load_index(self):
+        self._ivf = None
+        if self._index_generation is not None:
+            try:
+                self._ivf = _IVFIndex.load(*self._index_paths(self._index_generation))
+            except (OSError, KeyError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable memory index in {self.directory}: {e}")
+                self._index_generation = None
+        if self._ivf is not None and self._ivf.count > self.count:
+            logger.warning(f"Memory index in {self.directory} covers uncommitted rows; dropping it")
+            self._ivf = None
+            self._index_generation = None
+        self._remove_stale_indexes()
+
+    def _remove_stale_indexes(self):
+        # Generations other than the committed one: superseded, or written by an interrupted build.
+        keep = set(self._index_paths(self._index_generation)) if self._index_generation is not None else set()
+        for name in os.listdir(self.directory):
+            path = self._path(name)
+            if name.startswith(_INDEX_PREFIX) and path not in keep:
+                os.unlink(path)
+
+    def _index_due(self) -> bool:
+        if self.count < self.min_index_rows:
+            return False
+        return self._ivf is None or self.count - self._ivf.count >= self.max_unindexed_rows
+
+    def _build_index(self, retrain: bool):
+        start = time.perf_counter()
+        generation = (self._index_generation or 0) + 1
+        index_path, codes_path = self._index_paths(generation)
+        base = self._ivf
+        if retrain or base is None:
+            base = _IVFIndex.train(self.vectors, self.count, np.random.default_rng(generation))
+        self._ivf = base.extended(self.vectors, self.count, codes_path)
+        self._ivf.save(index_path)
+        self._index_generation = generation
+        logger.debug("Indexed %d memories in %d lists in %.2fs (%s)", self.count, len(self._ivf.centroids),
+                     time.perf_counter() - start, "trained" if base.count == 0 else "extended")
+
+    def build_index(self, retrain: bool = True):
+        """
+        Builds the search index now (retraining the centroids with `retrain`)
+        instead of waiting for `flush()` to do it once the store is large enough.
+        """
+        self._flush_columns()
+        self._build_index(retrain)
+        self._write_meta()
+        self._remove_stale_indexes()
+
+    def _grow(self, needed: int):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        old = {attr: getattr(self, attr) for attr, _, _, _ in self._column_specs()}
+        for attr, column in old.items():
+            column.flush()
+        self._create_columns(capacity, suffix=".grow")
+        for attr, name, _, _ in self._column_specs():
+            getattr(self, attr)[:self.count] = old[attr][:self.count]
+            getattr(self, attr).flush()
+        del old
+        for attr, name, _, _ in self._column_specs():
+            setattr(self, attr, None)
+            os.replace(self._path(name + ".grow"), self._path(name))
+        self.capacity = capacity
+        self._open_columns("r+")
+        logger.debug("Grew memory store %s to %d rows", self.directory, capacity)
+
+    def _session_code(self, session: Optional[str]) -> int:
+        if session is None:
+            return _NO_SESSION
+        code = self._session_codes.get(session)
+        if code is None:
+            code = len(self.sessions)
+            self.sessions.append(session)
+            self._session_codes[session] = code
+        return code
+
+    # --- writing ---
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, embeddings: np.ndarray, texts: Sequence[str], session: Optional[str] = None,
+            timestamps: Optional[Sequence[float]] = None,
+            metadata: Optional[Sequence[Dict[str, Any]]] = None) -> np.ndarray:
+        """
+        Appends memories in one batch.
+
+        Args:
+            embeddings (array): Shape (n, dim); normalized before storing.
+            texts (list of str): Memory texts, one per row.
+            session (str, optional): Session the memories came from.
+            timestamps (list of float, optional): Unix times; default now.
+            metadata (list of dict, optional): Extra fields stored with each text.
+
+        Returns:
+            ndarray: Indices of the new rows.
+        """
+        vectors = _normalize_rows(embeddings)
+        n = len(vectors)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of dim {self.dim}, got {vectors.shape[1]}")
+        if len(texts) != n:
+            raise ValueError("texts and embeddings must have the same length")
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+        if self.count + n > self.capacity:
+            self._grow(self.count + n)
+
+        now = time.time()
+        code = self._session_code(session)
+        start = self.count
+        stop = start + n
+
+        offset = self._records_file.tell()
+        lines = []
+        offsets = np.empty(n, dtype=np.uint64)
+        for i, text in enumerate(texts):
+            record = {"text": text, "session": session}
+            if metadata is not None and metadata[i]:
+                record.update(metadata[i])
+            line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+            offsets[i] = offset
+            offset += len(line)
+            lines.append(line)
+        self._records_file.write(b"".join(lines))
+        self._records_file.flush()
+
+        self.vectors[start:stop] = vectors
+        self.timestamps[start:stop] = now if timestamps is None else np.asarray(timestamps, dtype=np.float64)
+        self.session_ids[start:stop] = code
+        self.offsets[start:stop] = offsets
+        self.counts[start:stop] = 1
+        self.count = stop
+        if self._index_due():
+            self.flush()
+        return np.arange(start, stop)
+
+    def bump(self, indices: Sequence[int], timestamps: Optional[Sequence[float]] = None):
+        """
+        Counts memories that were stored again, moving their timestamps
+        forward to the latest occurrence.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if not len(indices):
+            return
+        np.add.at(self.counts, indices, 1)
+        now = time.time() if timestamps is None else np.asarray(timestamps, dtype=np.float64)
+        np.maximum.at(self.timestamps, indices, np.broadcast_to(now, indices.shape))
+
+    def merge(self, targets: Sequence[int], sources: Sequence[int]):
+        """
+        Folds each source row into its target: counts are added, the newer
+        timestamp is kept and the source row is no longer returned by searches.
+        """
+        targets = np.asarray(targets, dtype=np.int64)
+        sources = np.asarray(sources, dtype=np.int64)
+        if not len(sources):
+            return
+        live = self.counts[sources] > 0
+        targets, sources = targets[live], sources[live]
+        np.add.at(self.counts, targets, self.counts[sources])
+        np.maximum.at(self.timestamps, targets, self.timestamps[sources])
+        self.counts[sources] = 0
+        self.dead += int(len(sources))
+
+    def _flush_columns(self):
+        self._records_file.flush()
+        os.fsync(self._records_file.fileno())
+        for attr, _, _, _ in self._column_specs():
+            getattr(self, attr).flush()
+
+    def flush(self):
+        """
+        Persists appended rows; memories added since the last flush are lost
+        on a crash. Builds or extends the search index when it is due: the
+        centroids are retrained each time the store has doubled since.
+        """
+        self._flush_columns()
+        if self._index_due():
+            self._build_index(retrain=self._ivf is None or self.count >= 2 * self._ivf.trained)
+        self._write_meta()
+        self._remove_stale_indexes()
+
+    def close(self):
+        if self._records_file.closed:
+            return
+        self.flush()
+        self._records_file.close()
+
+    def __enter__(self) -> "VectorMemoryStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- reading ---
+
+    def get_records(self, indices: Iterable[int]) -> List[Dict[str, Any]]:
+        self._records_file.flush()
+        records = []
+        with open(self._path(_RECORDS_NAME), "rb") as f:
+            for index in indices:
+                f.seek(int(self.offsets[index]))
+                record = json.loads(f.readline())
+                record["ts"] = float(self.timestamps[index])
+                record["count"] = int(self.counts[index])
+                records.append(record)
+        return records
+
+    def _filter_mask(self, session: Union[str, Sequence[str], None], since: Optional[float],
+                     until: Optional[float], rows: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """Which of `rows` (default: every row) pass the filters; None when nothing is filtered."""
+        select = slice(0, self.count) if rows is None else rows
+        mask = self.counts[select] > 0 if self.dead else None
+        if session is not None:
+            names = [session] if isinstance(session, str) else list(session)
+            codes = [self._session_codes[name] for name in names if name in self._session_codes]
+            m = np.isin(self.session_ids[select], codes)
+            mask = m if mask is None else mask & m
+        if since is not None:
+            m = self.timestamps[select] >= since
+            mask = m if mask is None else mask & m
+        if until is not None:
+            m = self.timestamps[select] < until
+            mask = m if mask is None else mask & m
+        return mask
+
+    def _exact_top(self, q: np.ndarray, k: int, mask: Optional[np.ndarray], start: int = 0):
+        """Exact top-k over rows [start, count); returns (scores, indices), each (q, <=k), unsorted."""
+        n_queries = q.shape[0]
+        if mask is not None and mask[start:].sum() < self.gather_threshold * (self.count - start):
+            candidates = start + np.flatnonzero(mask[start:])
+            blocks = ((candidates[i:i + self.block_rows], None)
+                      for i in range(0, len(candidates), self.block_rows))
+        else:
+            blocks = ((slice(i, min(i + self.block_rows, self.count)), mask)
+                      for i in range(start, self.count, self.block_rows))
+
+        best_scores = np.full((n_queries, 0), -np.inf, dtype=np.float32)
+        best_index = np.empty((n_queries, 0), dtype=np.int64)
+        for rows, block_mask in blocks:
+            if isinstance(rows, slice):
+                block = self.vectors[rows]
+                index = np.arange(rows.start, rows.stop)
+            else:
+                block = self.vectors[rows]
+                index = rows
+            scores = q @ block.astype(np.float32, copy=False).T  # (q, rows)
+            if block_mask is not None:
+                scores[:, ~block_mask[rows]] = -np.inf
+            if scores.shape[1] > k:
+                top = np.argpartition(scores, -k, axis=1)[:, -k:]
+                scores = np.take_along_axis(scores, top, axis=1)
+                index = index[top]
+            else:
+                index = np.broadcast_to(index, scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_index = np.concatenate([best_index, index], axis=1)
+            if best_scores.shape[1] > k:
+                top = np.argpartition(best_scores, -k, axis=1)[:, -k:]
+                best_scores = np.take_along_axis(best_scores, top, axis=1)
+                best_index = np.take_along_axis(best_index, top, axis=1)
+        return best_scores, best_index
+
+    def _indexed_top(self, query: np.ndarray, k: int, nprobe: int, session, since, until):
+        """
+        Approximate top-k of one query over the indexed rows, or None when
+        fewer than k probed rows pass the filters (the caller then scans exactly).
+        """
+        ivf = self._ivf
+        lists = np.argpartition(-(ivf.centroids @ query), min(nprobe, len(ivf.centroids)) - 1)[:nprobe]
+        rows, approx = ivf.scan(query, lists)
+        keep = self._filter_mask(session, since, until, rows)
+        if keep is not None:
+            rows, approx = rows[keep], approx[keep]
+        if len(rows) < k:
+            return None
+        rerank = max(self.rerank, 4 * k)
+        if len(rows) > rerank:
+            top = np.argpartition(approx, -rerank)[-rerank:]
+            rows = rows[top]
+        rows = np.sort(rows)  # ascending reads from the memmap
+        scores = self.vectors[rows].astype(np.float32, copy=False) @ query
+        if len(rows) > k:
+            top = np.argpartition(scores, -k)[-k:]
+            rows, scores = rows[top], scores[top]
+        return scores, rows
+
+    def search(self, queries: np.ndarray, k: int = 8, session: Union[str, Sequence[str], None] = None,
+               since: Optional[float] = None, until: Optional[float] = None,
+               with_records: bool = True, exact: bool = False,
+               nprobe: Optional[int] = None) -> List[List[MemoryHit]]:
+        """
+        Top-k cosine similarity search for a batch of queries.
+
+        Args:
+            queries (array): Shape (q, dim) or (dim,).
+            k (int): Results per query.
+            session (str or list of str, optional): Only memories from these sessions.
+            since, until (float, optional): Only memories with since <= ts < until.
+            with_records (bool): Load the stored text and metadata of each hit.
+            exact (bool): Scan every row even when the store is indexed.
+            nprobe (int, optional): Index lists probed per query; defaults to
+                the `nprobe` attribute. More lists trade speed for recall.
+
+        Returns:
+            list: For each query, up to k MemoryHit sorted by descending score.
+        """
+        q = _normalize_rows(queries)
+        if q.shape[1] != self.dim:
+            raise ValueError(f"Expected queries of dim {self.dim}, got {q.shape[1]}")
+        n_queries = q.shape[0]
+
+        if exact or self._ivf is None:
+            best_scores, best_index = self._exact_top(q, k, self._filter_mask(session, since, until))
+        else:
+            indexed = self._ivf.count
+            full_mask = None
+            tail_mask = self._filter_mask(session, since, until, np.arange(indexed, self.count))
+            if tail_mask is not None:
+                tail_mask = np.concatenate([np.zeros(indexed, dtype=bool), tail_mask])
+            tail_scores, tail_index = self._exact_top(q, k, tail_mask, start=indexed)
+            best_scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+            best_index = np.zeros((n_queries, k), dtype=np.int64)
+            for qi in range(n_queries):
+                found = self._indexed_top(q[qi], k, nprobe or self.nprobe, session, since, until)
+                if found is None:
+                    # Too few probed rows match the filters; a selective filter makes the exact scan cheap.
+                    if full_mask is None:
+                        full_mask = self._filter_mask(session, since, until)
+                    found = tuple(a[0] for a in self._exact_top(q[qi:qi + 1], k, full_mask))
+                    scores, index = found
+                else:
+                    scores = np.concatenate([found[0], tail_scores[qi]])
+                    index = np.concatenate([found[1], tail_index[qi]])
+                if len(scores) > k:
+                    top = np.argpartition(scores, -k)[-k:]
+                    scores, index = scores[top], index[top]
+                best_scores[qi, :len(scores)] = scores
+                best_index[qi, :len(index)] = index
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_index = np.take_along_axis(best_index, order, axis=1)
+
+        results = []
+        for qi in range(n_queries):
+            keep = np.isfinite(best_scores[qi])
+            indices = best_index[qi][keep]
+            scores = best_scores[qi][keep]
+            records = self.get_records(indices) if with_records else [None] * len(indices)
+            results.append([MemoryHit(int(i), float(s), r) for i, s, r in zip(indices, scores, records)])
+        return results
+
+
+def _character_slug(character_name: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", character_name).strip("_")[:48] or "character"
+    digest = hashlib.sha1(character_name.encode("utf-8")).hexdigest()[:10]
+    return f"{slug}-{digest}"
+
+
+def open_character_memory(root: str, character_name: str, dim: Optional[int] = None,
+                          **kwargs: Any) -> VectorMemoryStore:
+    """Opens (or creates) the memory store of a character under `root`."""
+    return VectorMemoryStore(os.path.join(root, _character_slug(character_name)), dim=dim, **kwargs)
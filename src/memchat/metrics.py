@@ -0,0 +1,365 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets, as in the Prometheus clients.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items())) if labels else ()
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics: "Metrics", name: str, labels: Dict[str, Any]):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None:
+            self.metrics.inc(self.name.rsplit("_seconds", 1)[0] + "_errors", **self.labels)
+        return False
+
+
+class Metrics:
+    """
+    In-process counters and latency histograms for the hot paths (card
+    load/parse/save, prompt building, provider requests, history writes).
+
+    Disabled by default: `span()` then returns a shared no-op context manager
+    and `inc`/`observe` return after one attribute check, so instrumented
+    code pays almost nothing until `enable()` is called.
+
+    Args:
+        enabled (bool): Start recording immediately.
+        prefix (str): Prepended to every exported metric name.
+        buckets (tuple): Histogram bucket upper bounds in seconds.
+    """
+
+    def __init__(self, enabled: bool = False, prefix: str = "memchat_", buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._counters: Dict[_Key, float] = {}
+        self._histograms: Dict[_Key, _Histogram] = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started = time.time()
+
+    # --- recording ---
+
+    def inc(self, name: str, value: float = 1, **labels: Any):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels: Any):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        bucket = bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(len(self.buckets) + 1)
+            histogram.counts[bucket] += 1
+            histogram.sum += seconds
+            histogram.count += 1
+
+    def span(self, name: str, **labels: Any):
+        """
+        Times a block into the histogram `name`; an exception escaping the
+        block also counts towards `<name without _seconds>_errors`.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, labels)
+
+    def timed(self, name: str, **labels: Any) -> Callable:
+        """Decorator form of `span()`; the enabled check happens per call."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Span(self, name, labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # --- export ---
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns a JSON-serializable copy of every metric.
+
+        Returns:
+            dict: `counters` and `histograms`, each a list of entries with
+                `name` and `labels`; histograms carry count, sum and
+                cumulative bucket counts keyed by upper bound.
+        """
+        with self._lock:
+            counters = [(k, v) for k, v in self._counters.items()]
+            histograms = [(k, list(h.counts), h.sum, h.count) for k, h in self._histograms.items()]
+        bounds = [str(b) for b in self.buckets] + ["+Inf"]
+        result: Dict[str, Any] = {"timestamp": time.time(), "started": self.started, "counters": [], "histograms": []}
+        for (name, labels), value in sorted(counters):
+            result["counters"].append({"name": name, "labels": dict(labels), "value": value})
+        for (name, labels), counts, total, count in sorted(histograms, key=lambda h: h[0]):
+            cumulative, running = {}, 0
+            for bound, n in zip(bounds, counts):
+                running += n
+                cumulative[bound] = running
+            result["histograms"].append({"name": name, "labels": dict(labels), "count": count,
+                                         "sum": total, "buckets": cumulative})
+        return result
+
+    def prometheus_text(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format (version 0.0.4)."""
+        snapshot = self.snapshot()
+        lines: List[str] = []
+        typed = set()
+
+        def header(name: str, kind: str):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for counter in snapshot["counters"]:
+            name = self.prefix + counter["name"]
+            if not name.endswith("_total"):
+                name += "_total"
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(counter['labels'])} {_format_value(counter['value'])}")
+        for histogram in snapshot["histograms"]:
+            name = self.prefix + histogram["name"]
+            header(name, "histogram")
+            labels = histogram["labels"]
+            for bound, count in histogram["buckets"].items():
+                lines.append(f"{name}_bucket{_format_labels(labels, le=bound)} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9464, host: str = "127.0.0.1"):
+        """
+        Serves `GET /metrics` (Prometheus text) and `GET /metrics.json` from a
+        daemon thread. Returns the server; call `shutdown()` on it to stop.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = metrics.prometheus_text().encode("utf-8"), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(metrics.snapshot()).encode("utf-8"), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("metrics endpoint: " + format, *args)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="memchat-metrics", daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+    def write_snapshot(self, path: str):
+        """Atomically writes `snapshot()` as JSON to `path`."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def write_snapshots(self, path: str, interval: float = 60.0) -> threading.Event:
+        """
+        Writes a snapshot to `path` every `interval` seconds from a daemon
+        thread. Set the returned event to stop (a last snapshot is written).
+        """
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    self.write_snapshot(path)
+                except OSError as e:
+                    logger.warning(f"Could not write metrics snapshot to '{path}': {e}")
+            self.write_snapshot(path)
+
+        threading.Thread(target=loop, name="memchat-metrics-snapshots", daemon=True).start()
+        return stop
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels: Dict[str, str], **extra: str) -> str:
+    items = {**labels, **extra}
+    if not items:
+        return ""
+    escaped = (k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for k, v in items.items())
+    return "{" + ",".join(escaped) + "}"
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler: a daemon thread periodically captures the stack of
+    one thread (by default the one that calls `start()`) while sampling is
+    active. `session()` limits sampling to a block, so a single chat session
+    can be profiled while others share the same event loop thread.
+
+    Samples taken while the event loop waits for I/O are only counted in
+    `idle`. Results are aggregated as collapsed stacks ("outer;inner count" lines),
+    the input format of flamegraph.pl and speedscope.
+
+    Args:
+        interval (float): Seconds between samples.
+        max_depth (int): Frames kept per stack, innermost first.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: Counter = Counter()
+        self.total = 0
+        # Samples where the thread was waiting in the event loop's selector.
+        self.idle = 0
+        self._active = 0
+        self._thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self, thread_id: Optional[int] = None) -> "SamplingProfiler":
+        """Starts the sampler thread; samples are taken only inside `session()` blocks."""
+        if self._thread is not None:
+            return self
+        self._thread_id = thread_id or threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="memchat-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def session(self) -> "_ProfilerSession":
+        return _ProfilerSession(self)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            if not self._active:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            self.total += 1
+            if frame.f_code.co_filename.endswith("selectors.py"):
+                self.idle += 1
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+    def top(self, n: int = 20) -> List[Tuple[str, int]]:
+        """Innermost frames by sample count (self time)."""
+        leaves: Counter = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(n)
+
+    def save(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
+
+
+class _ProfilerSession:
+    __slots__ = ("profiler",)
+
+    def __init__(self, profiler: SamplingProfiler):
+        self.profiler = profiler
+
+    def __enter__(self):
+        self.profiler._active += 1
+        return self.profiler
+
+    def __exit__(self, *exc):
+        self.profiler._active -= 1
+        return False
+
+
+# Process-wide registry used by the instrumented modules.
+metrics = Metrics()
@@ -0,0 +1,347 @@
+import json
+import base64
+import hashlib
+import os
+import struct
+import tempfile
+import zlib
+import logging
+from typing import Any, BinaryIO, Dict, Iterator, NamedTuple, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Keywords checked first, in order. V3 cards carry both `ccv3` and a V2 `chara` fallback.
+CARD_KEYWORDS = ("ccv3", "chara")
+
+_TEXT_CHUNK_TYPES = (b"tEXt", b"zTXt", b"iTXt")
+_CHUNK_HEADER = struct.Struct(">I4s")
+
+CardSource = Union[str, BinaryIO]
+
+
+class PngFormatError(ValueError):
+    pass
+
+
+class CardTextChunk(NamedTuple):
+    keyword: str
+    text: str
+    chunk_type: bytes
+    offset: int  # start of the chunk (length field) in the file
+    length: int  # length of the chunk data
+
+
+def _iter_chunks(f: BinaryIO) -> Iterator[Tuple[bytes, int, int]]:
+    """
+    Walks the chunk list of an open PNG file, yielding (type, offset, length).
+    Only chunk headers are read; data is skipped with a seek unless the
+    consumer reads it before advancing the iterator.
+    """
+    base = f.tell()
+    if f.read(8) != PNG_SIGNATURE:
+        raise PngFormatError("not a PNG file")
+    offset = base + 8
+    while True:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        length, chunk_type = _CHUNK_HEADER.unpack(header)
+        yield chunk_type, offset, length
+        if chunk_type == b"IEND":
+            return
+        offset += 12 + length
+
+
+def _read_chunk_data(f: BinaryIO, offset: int, length: int, chunk_type: bytes) -> bytes:
+    f.seek(offset + 8)
+    data = f.read(length)
+    crc = f.read(4)
+    if len(data) != length or len(crc) != 4:
+        raise PngFormatError(f"truncated {chunk_type!r} chunk at offset {offset}")
+    if zlib.crc32(data, zlib.crc32(chunk_type)) != struct.unpack(">I", crc)[0]:
+        raise PngFormatError(f"CRC mismatch in {chunk_type!r} chunk at offset {offset}")
+    return data
+
+
+def _decode_text_chunk(chunk_type: bytes, data: bytes) -> Optional[Tuple[str, str]]:
+    keyword, sep, rest = data.partition(b"\x00")
+    if not sep:
+        return None
+    key = keyword.decode("latin-1")
+
+    if chunk_type == b"tEXt":
+        return key, rest.decode("latin-1")
+
+    if chunk_type == b"zTXt":
+        if not rest or rest[0] != 0:
+            return None
+        return key, zlib.decompress(rest[1:]).decode("latin-1")
+
+    # iTXt: compression flag, compression method, language tag\0, translated keyword\0, text
+    if len(rest) < 2:
+        return None
+    compressed, method = rest[0], rest[1]
+    parts = rest[2:].split(b"\x00", 2)
+    if len(parts) != 3:
+        return None
+    text = parts[2]
+    if compressed:
+        if method != 0:
+            return None
+        text = zlib.decompress(text)
+    return key, text.decode("utf-8")
+
+
+def _text_chunk(f: BinaryIO, chunk_type: bytes, offset: int, length: int) -> Optional[CardTextChunk]:
+    data = _read_chunk_data(f, offset, length, chunk_type)
+    try:
+        decoded = _decode_text_chunk(chunk_type, data)
+    except (zlib.error, UnicodeDecodeError) as e:
+        logger.debug("Skipping undecodable %r chunk at offset %d: %s", chunk_type, offset, e)
+        return None
+    if decoded is None:
+        return None
+    return CardTextChunk(decoded[0], decoded[1], chunk_type, offset, length)
+
+
+def iter_card_text_chunks(f: BinaryIO) -> Iterator[CardTextChunk]:
+    """
+    Yields the decoded tEXt/zTXt/iTXt chunks of the file, including those
+    written after the image data. IDAT chunks are skipped with a seek, so the
+    pixel payload is never read.
+    """
+    for chunk_type, offset, length in _iter_chunks(f):
+        if chunk_type in _TEXT_CHUNK_TYPES:
+            chunk = _text_chunk(f, chunk_type, offset, length)
+            if chunk is not None:
+                yield chunk
+
+
+def _decode_card_payload(text: str) -> Optional[Dict[str, Any]]:
+    try:
+        payload = base64.b64decode(text, validate=True).decode("utf-8")
+    except Exception:
+        payload = text
+    try:
+        parsed = json.loads(payload)
+    except json.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def find_card_chunk(f: BinaryIO) -> Optional[Tuple[CardTextChunk, Dict[str, Any]]]:
+    """
+    Returns the text chunk holding the character card together with its
+    decoded JSON. `ccv3` wins over `chara`; any other text chunk carrying
+    JSON (plain or base64) is used as a last resort. Chunks after the image
+    data are only looked at when no card chunk precedes it.
+    """
+    found: Dict[str, CardTextChunk] = {}
+    others = []
+    for chunk_type, offset, length in _iter_chunks(f):
+        # Writers normally put the card before the image data; only files without
+        # one there (e.g. `chara` inserted just before IEND) are walked to the end.
+        if chunk_type == b"IDAT" and found:
+            break
+        if chunk_type not in _TEXT_CHUNK_TYPES:
+            continue
+        chunk = _text_chunk(f, chunk_type, offset, length)
+        if chunk is None:
+            continue
+        if chunk.keyword in CARD_KEYWORDS:
+            found.setdefault(chunk.keyword, chunk)
+        else:
+            others.append(chunk)
+
+    candidates = [found[k] for k in CARD_KEYWORDS if k in found] + others
+    for chunk in candidates:
+        parsed = _decode_card_payload(chunk.text)
+        if parsed is not None:
+            return chunk, parsed
+    return None
+
+
+def read_card_json(source: CardSource) -> Optional[Dict[str, Any]]:
+    """
+    Reads the character card JSON embedded in a PNG by streaming its chunk
+    list. Pixels are never decoded.
+
+    Args:
+        source (str or binary file): Path to the PNG, or an open binary file
+            positioned at the PNG signature.
+
+    Returns:
+        dict or None: The card data, or None if no card could be found.
+    """
+    result = locate_card_json(source)
+    return result[1] if result else None
+
+
+def locate_card_json(source: CardSource) -> Optional[Tuple[CardTextChunk, Dict[str, Any]]]:
+    """Like `read_card_json`, but also returns the chunk the card was read from."""
+    name = source if isinstance(source, str) else getattr(source, "name", "<stream>")
+    try:
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                result = find_card_chunk(f)
+        else:
+            result = find_card_chunk(source)
+    except FileNotFoundError:
+        logger.error(f"Error: Image file not found at {name}")
+        return None
+    except (PngFormatError, OSError) as e:
+        logger.error(f"Could not read PNG chunks from '{name}': {e}")
+        return None
+
+    if result is None:
+        logger.debug("No character data found in PNG text chunks: %s", name)
+        return None
+    chunk = result[0]
+    logger.debug("Loaded character data from %r chunk '%s' in %s", chunk.chunk_type, chunk.keyword, name)
+    return result
+
+
+def _make_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type)))
+
+
+def make_text_chunk(keyword: str, text: str) -> bytes:
+    """Builds a complete tEXt chunk (length, type, data and CRC)."""
+    return _make_chunk(b"tEXt", keyword.encode("latin-1") + b"\x00" + text.encode("latin-1"))
+
+
+def _copy_range(src: BinaryIO, dst: BinaryIO, offset: int, length: int, bufsize: int = 1 << 20):
+    src.seek(offset)
+    while length > 0:
+        buf = src.read(min(bufsize, length))
+        if not buf:
+            raise PngFormatError("unexpected end of file while copying chunk")
+        dst.write(buf)
+        length -= len(buf)
+
+
+def _output_mode(path: str) -> int:
+    # mkstemp creates files as 0600; keep the mode of the file being replaced,
+    # otherwise use the default for new files.
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def write_card_to_png(base_png_path: str, output_png_path: str, text: str):
+    """
+    Writes `text` as the card payload of a copy of `base_png_path` without
+    decoding the image. Every other chunk is copied byte-for-byte; existing
+    `chara`/`ccv3` text chunks are dropped and a fresh `chara` chunk is
+    inserted before the first IDAT. `text` is a V2 card, so no `ccv3` chunk
+    is written: a stale one would shadow it, and V2 data must not claim V3.
+
+    The output is written to a temporary file in the destination directory
+    and renamed over `output_png_path`, so the base and output may be the
+    same file.
+
+    Raises:
+        PngFormatError: If the base file is not a well-formed PNG.
+    """
+    out_dir = os.path.dirname(os.path.abspath(output_png_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".card-", suffix=".png.tmp", dir=out_dir)
+    try:
+        with open(base_png_path, "rb") as src, os.fdopen(fd, "wb") as dst:
+            chunks = list(_iter_chunks(src))
+            if not chunks or chunks[0][0] != b"IHDR" or chunks[-1][0] != b"IEND":
+                raise PngFormatError("missing IHDR or IEND chunk")
+
+            keep = []
+            for chunk_type, offset, length in chunks:
+                if chunk_type in _TEXT_CHUNK_TYPES:
+                    data = _read_chunk_data(src, offset, length, chunk_type)
+                    keyword = data.partition(b"\x00")[0].decode("latin-1")
+                    if keyword in CARD_KEYWORDS:
+                        continue
+                keep.append((chunk_type, offset, length))
+
+            new_chunks = make_text_chunk("chara", text)
+
+            dst.write(PNG_SIGNATURE)
+            inserted = False
+            for chunk_type, offset, length in keep:
+                if not inserted and chunk_type in (b"IDAT", b"IEND"):
+                    dst.write(new_chunks)
+                    inserted = True
+                _copy_range(src, dst, offset, length + 12)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.chmod(tmp_path, _output_mode(output_png_path))
+        os.replace(tmp_path, output_png_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def image_digest(path: str) -> str:
+    """
+    SHA-256 of the image content of a file. For PNGs, text chunks (where
+    card data lives) are skipped, so the same picture embedded in different
+    cards has the same digest; other formats are hashed whole.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        try:
+            chunks = [(t, o, n) for t, o, n in _iter_chunks(f) if t not in _TEXT_CHUNK_TYPES]
+        except PngFormatError:
+            chunks = None
+        if chunks is None:
+            f.seek(0)
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        else:
+            for chunk_type, offset, length in chunks:
+                _copy_range(f, _HashWriter(digest), offset, length + 12)
+    return digest.hexdigest()
+
+
+class _HashWriter:
+    __slots__ = ("digest",)
+
+    def __init__(self, digest):
+        self.digest = digest
+
+    def write(self, data: bytes):
+        self.digest.update(data)
+
+
+def is_png_file(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(8) == PNG_SIGNATURE
+    except OSError:
+        return False
+
+
+def read_card_chunk_at(path: str, offset: int, length: int, chunk_type: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Decodes the card from a known text chunk location (as recorded by
+    `find_card_chunk`) without walking the rest of the file.
+
+    Raises:
+        PngFormatError: If the chunk at `offset` no longer matches.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8 or _CHUNK_HEADER.unpack(header) != (length, chunk_type):
+            raise PngFormatError(f"no {chunk_type!r} chunk at offset {offset}")
+        data = _read_chunk_data(f, offset, length, chunk_type)
+    decoded = _decode_text_chunk(chunk_type, data)
+    if decoded is None:
+        raise PngFormatError(f"undecodable {chunk_type!r} chunk at offset {offset}")
+    return _decode_card_payload(decoded[1])
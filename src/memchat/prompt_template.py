@@ -0,0 +1,132 @@
+import re
+import time
+import random
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Hashable, Optional, Tuple, Union
+
+# {{name}} or {{name:argument}}; macro names are matched case-insensitively.
+_MACRO_RE = re.compile(r"\{\{\s*([A-Za-z_]+)\s*(?::(.*?))?\}\}", re.DOTALL)
+
+# Macros whose value changes between renders of the same context.
+VOLATILE_MACROS = frozenset({"time", "date", "weekday", "random"})
+KNOWN_MACROS = frozenset({"char", "user", "original"}) | VOLATILE_MACROS
+
+Segment = Union[str, Tuple[str, Optional[str]]]
+
+
+def _random_options(argument: Optional[str]) -> list:
+    if not argument:
+        return [""]
+    # {{random::a::b}} allows commas inside options; {{random:a,b}} is the short form.
+    if argument.startswith(":"):
+        return argument[1:].split("::")
+    return argument.split(",")
+
+
+class CompiledTemplate:
+    """
+    Card text split once into literal and macro segments, so rendering is a
+    single pass over a short list instead of repeated `str.replace` calls.
+    """
+    __slots__ = ("source", "segments", "is_static")
+
+    def __init__(self, source: str, segments: Tuple[Segment, ...]):
+        self.source = source
+        self.segments = segments
+        self.is_static = not any(type(seg) is tuple and seg[0] in VOLATILE_MACROS for seg in segments)
+
+    def render(self, context: Dict[str, str]) -> str:
+        """
+        Args:
+            context (dict): Macro values, e.g. {"char": ..., "user": ...,
+                "original": ...}. Time and random macros are computed here.
+        """
+        if len(self.segments) == 1 and type(self.segments[0]) is str:
+            return self.segments[0]
+        parts = []
+        append = parts.append
+        for seg in self.segments:
+            if type(seg) is str:
+                append(seg)
+                continue
+            name, argument = seg
+            if name == "time":
+                append(time.strftime("%H:%M"))
+            elif name == "date":
+                append(time.strftime("%B %d, %Y"))
+            elif name == "weekday":
+                append(time.strftime("%A"))
+            elif name == "random":
+                append(random.choice(_random_options(argument)))
+            else:
+                append(context.get(name, ""))
+        return "".join(parts)
+
+
+def compile_template(text: str) -> CompiledTemplate:
+    segments = []
+    pos = 0
+    for match in _MACRO_RE.finditer(text):
+        name = match.group(1).lower()
+        if name not in KNOWN_MACROS:
+            continue  # unknown macros are kept verbatim as part of the literal
+        if match.start() > pos:
+            segments.append(text[pos:match.start()])
+        segments.append((name, match.group(2)))
+        pos = match.end()
+    if pos < len(text) or not segments:
+        segments.append(text[pos:])
+
+    # Merge adjacent literals left behind by skipped unknown macros.
+    merged = []
+    for seg in segments:
+        if merged and type(seg) is str and type(merged[-1]) is str:
+            merged[-1] += seg
+        else:
+            merged.append(seg)
+    return CompiledTemplate(text, tuple(merged))
+
+
+compile_template_cached = lru_cache(maxsize=256)(compile_template)
+
+
+class LRUCache:
+    """A small thread-safe LRU mapping with hit/miss counters."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Rendered prompt text keyed by (card content key, part, user name); shared by every copy of a card.
+render_cache = LRUCache(maxsize=4096)
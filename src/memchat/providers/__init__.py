@@ -0,0 +1,56 @@
+from typing import Any, Optional
+
+from .base import ChatStream, LLMProvider, Message, ProviderError, ProviderTimeoutError, StreamStats
+from .cache import CacheMissError, CachingProvider, ResponseCache
+from .gemini import GeminiProvider
+from .openai import DeepSeekProvider, OpenAICompatibleProvider
+from .stub import StubProvider
+
+__all__ = [
+    "ChatStream", "LLMProvider", "Message", "ProviderError", "ProviderTimeoutError", "StreamStats",
+    "GeminiProvider", "DeepSeekProvider", "OpenAICompatibleProvider", "StubProvider", "create_provider",
+    "CacheMissError", "CachingProvider", "ResponseCache",
+]
+
+
+def create_provider(name: Optional[str] = None, model: Optional[str] = None, **kwargs: Any) -> LLMProvider:
+    """
+    Builds a provider from the configured API keys.
+
+    Args:
+        name (str, optional): "openai", "deepseek", "gemini" or "stub". Defaults
+            to LLM_PROVIDER, then to the first provider with an API key, then
+            to the offline stub.
+        model (str, optional): Overrides the provider's default model (or LLM_MODEL).
+
+    With LLM_CACHE_PATH set, the provider is wrapped in a CachingProvider
+    using LLM_CACHE_MODE.
+    """
+    from .. import config
+
+    name = (name or config.LLM_PROVIDER or "").lower()
+    keys = {
+        "openai": config.OPENAI_API_KEY,
+        "deepseek": config.DEEPSEEK_API_KEY,
+        "gemini": config.GEMINI_API_KEY,
+    }
+    if not name:
+        name = next((n for n, key in keys.items() if key), "stub")
+    model = model or config.LLM_MODEL
+    if model:
+        kwargs["model"] = model
+
+    if name == "openai":
+        provider = OpenAICompatibleProvider(keys["openai"], **kwargs)
+    elif name == "deepseek":
+        provider = DeepSeekProvider(keys["deepseek"], **kwargs)
+    elif name == "gemini":
+        provider = GeminiProvider(keys["gemini"], **kwargs)
+    elif name == "stub":
+        provider = StubProvider(**kwargs)
+    else:
+        raise ValueError(f"Unknown LLM provider: {name}")
+
+    if config.LLM_CACHE_PATH:
+        provider = CachingProvider(provider, ResponseCache(config.LLM_CACHE_PATH), mode=config.LLM_CACHE_MODE)
+    return provider
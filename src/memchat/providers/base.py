@@ -0,0 +1,199 @@
+import asyncio
+import contextlib
+import threading
+import time
+import logging
+import weakref
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# {"role": "user" | "assistant" | "system", "content": str}
+Message = Dict[str, str]
+
+
+class ProviderError(Exception):
+    pass
+
+
+class ProviderTimeoutError(ProviderError):
+    pass
+
+
+@dataclass
+class StreamStats:
+    started: float = 0.0
+    first_token_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    chunks: int = 0
+    chars: int = 0
+    cancelled: bool = False
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started
+
+    @property
+    def total_time(self) -> Optional[float]:
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started
+
+
+class ChatStream:
+    """
+    Async iterator over the text chunks of one reply. Holds a concurrency
+    slot of its provider while running and enforces the first-token and
+    total timeouts. Cancelling the consuming task (e.g. the user interrupts)
+    closes the underlying request.
+    """
+
+    def __init__(self, provider: "LLMProvider", messages: List[Message], system_prompt: Optional[str],
+                 params: Dict[str, Any]):
+        self.provider = provider
+        self.messages = messages
+        self.system_prompt = system_prompt
+        self.params = params
+        self.stats = StreamStats()
+        self.text = ""
+        self._iterator: Optional[AsyncIterator[str]] = None
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        if self._iterator is None:
+            self._iterator = self._run()
+        return self._iterator
+
+    async def __anext__(self) -> str:
+        return await self.__aiter__().__anext__()
+
+    async def _run(self) -> AsyncIterator[str]:
+        provider = self.provider
+        stats = self.stats
+        parts = []
+        outcome = "error"
+        async with provider._slots():
+            stats.started = time.perf_counter()
+            deadline = asyncio.get_running_loop().time() + provider.total_timeout
+            chunks = provider._stream_chunks(self.messages, self.system_prompt, self.params)
+            try:
+                while True:
+                    wait = provider.first_token_timeout if stats.first_token_at is None else provider.idle_timeout
+                    loop_now = asyncio.get_running_loop().time()
+                    try:
+                        async with asyncio.timeout_at(min(deadline, loop_now + wait)):
+                            chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    except TimeoutError:
+                        raise ProviderTimeoutError(f"{provider.name}: no response within the time limit") from None
+                    if not chunk:
+                        continue
+                    if stats.first_token_at is None:
+                        stats.first_token_at = time.perf_counter()
+                    stats.chunks += 1
+                    stats.chars += len(chunk)
+                    parts.append(chunk)
+                    yield chunk
+                outcome = "ok"
+            except (asyncio.CancelledError, GeneratorExit):
+                stats.cancelled = True
+                outcome = "cancelled"
+                raise
+            except ProviderTimeoutError:
+                outcome = "timeout"
+                raise
+            finally:
+                stats.finished_at = time.perf_counter()
+                self.text = "".join(parts)
+                await chunks.aclose()
+                if metrics.enabled:
+                    self._record_metrics(outcome)
+
+    def _record_metrics(self, outcome: str):
+        name, stats = self.provider.name, self.stats
+        metrics.inc("provider_requests", provider=name, outcome=outcome)
+        metrics.observe("provider_request_seconds", stats.total_time, provider=name)
+        if stats.time_to_first_token is not None:
+            metrics.observe("provider_first_token_seconds", stats.time_to_first_token, provider=name)
+        metrics.inc("provider_chunks", stats.chunks, provider=name)
+
+    async def aclose(self):
+        if self._iterator is not None:
+            await self._iterator.aclose()
+
+    async def read(self) -> str:
+        async for _ in self:
+            pass
+        return self.text
+
+
+class LLMProvider:
+    """
+    Base class for chat completion backends. Subclasses implement
+    `_stream_chunks`; callers use `stream()` or `complete()`.
+
+    Args:
+        model (str): Model identifier sent to the backend.
+        max_concurrency (int): Replies allowed in flight at once.
+        first_token_timeout (float): Seconds to wait for the first chunk.
+        idle_timeout (float): Seconds to wait between later chunks.
+        total_timeout (float): Upper bound for a whole reply.
+    """
+    name = "base"
+
+    def __init__(self, model: str, max_concurrency: int = 16, first_token_timeout: float = 60.0,
+                 idle_timeout: float = 30.0, total_timeout: float = 300.0, **default_params: Any):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.first_token_timeout = first_token_timeout
+        self.idle_timeout = idle_timeout
+        self.total_timeout = total_timeout
+        self.default_params = default_params
+        # One semaphore per event loop: an asyncio.Semaphore cannot be awaited from
+        # another loop (a second asyncio.run, the consolidation thread).
+        self._semaphores = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+
+    @contextlib.asynccontextmanager
+    async def _slots(self) -> AsyncIterator[None]:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        async with semaphore:
+            with self._in_flight_lock:
+                self._in_flight += 1
+            try:
+                yield
+            finally:
+                with self._in_flight_lock:
+                    self._in_flight -= 1
+
+    @property
+    def in_flight(self) -> int:
+        """Replies currently holding a concurrency slot, across event loops."""
+        return self._in_flight
+
+    def stream(self, messages: List[Message], system_prompt: Optional[str] = None, **params: Any) -> ChatStream:
+        """
+        Starts a streamed reply. Nothing is sent until the returned stream is
+        iterated.
+        """
+        return ChatStream(self, messages, system_prompt, {**self.default_params, **params})
+
+    async def complete(self, messages: List[Message], system_prompt: Optional[str] = None, **params: Any) -> str:
+        return await self.stream(messages, system_prompt, **params).read()
+
+    async def _stream_chunks(self, messages: List[Message], system_prompt: Optional[str],
+                             params: Dict[str, Any]) -> AsyncIterator[str]:
+        raise NotImplementedError
+        yield ""
+
+    async def aclose(self):
+        pass
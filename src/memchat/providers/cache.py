@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from ..metrics import metrics
+from .base import LLMProvider, Message, ProviderError
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the key derivation changes, so old entries stop matching.
+KEY_VERSION = 1
+
+CACHE_MODES = ("readwrite", "offline", "refresh")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    chunks TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+class CacheMissError(ProviderError):
+    pass
+
+
+def request_key(provider: str, model: str, params: Dict[str, Any], system_prompt: Optional[str],
+                messages: List[Message]) -> str:
+    """
+    Canonical hash of a chat request: the same provider, model, parameters,
+    system prompt and messages always give the same key, regardless of dict
+    ordering or extra message fields (ids, timestamps).
+    """
+    canonical = json.dumps(
+        [KEY_VERSION, provider, model, params, system_prompt or "",
+         [[m["role"], m["content"]] for m in messages]],
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Recorded replies, stored chunk by chunk in a single SQLite file.
+
+    Entries are evicted least-recently-used first once the stored text
+    exceeds `max_bytes`. Hit bookkeeping (last use, hit count) is buffered
+    and written with the next insert or `flush()`, so a lookup is a single
+    primary-key read.
+
+    Args:
+        path (str): Database file; created if missing.
+        max_bytes (int): Bound on the total size of stored replies.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        self.bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            row = self._db.execute("SELECT chunks FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= 256:
+                self._flush_touched()
+        return json.loads(row[0])
+
+    def put(self, key: str, model: str, chunks: List[str]):
+        data = json.dumps(chunks, ensure_ascii=False, separators=(",", ":"))
+        size = len(data.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._flush_touched()
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, chunks, size, created, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)", (key, model, data, size, now, now))
+            self.bytes += size - (old[0] if old else 0)
+            if self.bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Down to 90% so that a full cache does not evict on every insert.
+        target = int(self.max_bytes * 0.9)
+        rows = self._db.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+        doomed = []
+        for key, size in rows:
+            if self.bytes <= target:
+                break
+            doomed.append((key,))
+            self.bytes -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+        logger.debug("Evicted %d cached responses", len(doomed))
+
+    def _flush_touched(self):
+        if not self._touched:
+            return
+        self._db.executemany("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                             [(ts, key) for key, ts in self._touched.items()])
+        self._touched.clear()
+
+    def flush(self):
+        with self._lock:
+            self._flush_touched()
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT key FROM responses")]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._db.close()
+
+
+class CachingProvider(LLMProvider):
+    """
+    Wraps a provider with a ResponseCache. A hit replays the recorded
+    chunks in order without contacting the backend; a miss streams from the
+    wrapped provider and records the reply once it completed (interrupted
+    or failed replies are not stored).
+
+    Args:
+        inner (LLMProvider): The provider to call on misses.
+        cache (ResponseCache): Where replies are recorded.
+        mode (str): "readwrite" (default), "offline" (misses raise
+            CacheMissError, the backend is never called) or "refresh"
+            (always call the backend and overwrite the recording).
+    """
+
+    def __init__(self, inner: LLMProvider, cache: ResponseCache, mode: str = "readwrite"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        super().__init__(inner.model, max_concurrency=inner.max_concurrency,
+                         first_token_timeout=inner.first_token_timeout, idle_timeout=inner.idle_timeout,
+                         total_timeout=inner.total_timeout, **inner.default_params)
+        self.inner = inner
+        self.cache = cache
+        self.mode = mode
+        self.name = inner.name
+
+    def key(self, messages: List[Message], system_prompt: Optional[str], params: Dict[str, Any]) -> str:
+        return request_key(self.inner.name, self.model, params, system_prompt, messages)
+
+    async def _stream_chunks(self, messages: List[Message], system_prompt: Optional[str],
+                             params: Dict[str, Any]) -> AsyncIterator[str]:
+        key = self.key(messages, system_prompt, params)
+        if self.mode != "refresh":
+            chunks = self.cache.get(key)
+            if chunks is not None:
+                metrics.inc("llm_cache_hits", provider=self.name)
+                for chunk in chunks:
+                    yield chunk
+                return
+            metrics.inc("llm_cache_misses", provider=self.name)
+            if self.mode == "offline":
+                raise CacheMissError(f"{self.name}: no cached response for request {key[:16]} (offline mode)")
+
+        recorded = []
+        async for chunk in self.inner._stream_chunks(messages, system_prompt, params):
+            recorded.append(chunk)
+            yield chunk
+        self.cache.put(key, self.model, recorded)
+
+    async def aclose(self):
+        self.cache.flush()
+        await self.inner.aclose()
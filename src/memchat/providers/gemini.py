@@ -0,0 +1,67 @@
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .base import LLMProvider, Message, ProviderError
+from .http import HTTPConnectionPool, HTTPError
+from .openai import iter_sse_data
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiProvider(LLMProvider):
+    """Streams from the Gemini `streamGenerateContent` endpoint (SSE mode)."""
+    name = "gemini"
+
+    def __init__(self, api_key: Optional[str], model: str = "gemini-2.0-flash",
+                 base_url: str = "https://generativelanguage.googleapis.com/v1beta",
+                 max_idle_connections: int = 8, connect_timeout: float = 10.0, **kwargs: Any):
+        super().__init__(model, **kwargs)
+        self.api_key = api_key
+        self.pool = HTTPConnectionPool(base_url, max_idle=max_idle_connections, connect_timeout=connect_timeout)
+
+    def _build_body(self, messages: List[Message], system_prompt: Optional[str], params: Dict[str, Any]) -> Dict[str, Any]:
+        contents = []
+        system_parts = [system_prompt] if system_prompt else []
+        for m in messages:
+            if m["role"] == "system":
+                system_parts.append(m["content"])
+                continue
+            role = "model" if m["role"] == "assistant" else "user"
+            contents.append({"role": role, "parts": [{"text": m["content"]}]})
+        body: Dict[str, Any] = {"contents": contents}
+        if system_parts:
+            body["systemInstruction"] = {"parts": [{"text": "\n\n".join(system_parts)}]}
+        if params:
+            body["generationConfig"] = params
+        return body
+
+    async def _stream_chunks(self, messages: List[Message], system_prompt: Optional[str],
+                             params: Dict[str, Any]) -> AsyncIterator[str]:
+        body = json.dumps(self._build_body(messages, system_prompt, params)).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Accept": "text/event-stream"}
+        if self.api_key:
+            headers["x-goog-api-key"] = self.api_key
+        path = f"/models/{self.model}:streamGenerateContent?alt=sse"
+        response = await self.pool.request("POST", path, headers, body)
+        try:
+            if response.status != 200:
+                raise ProviderError(str(HTTPError(response.status, response.reason, await response.read())))
+            async for data in iter_sse_data(response.iter_lines()):
+                try:
+                    event = json.loads(data)
+                except json.JSONDecodeError:
+                    logger.debug("Skipping malformed SSE event from %s", self.name)
+                    continue
+                if "error" in event:
+                    raise ProviderError(f"{self.name}: {event['error']}")
+                for candidate in event.get("candidates") or []:
+                    for part in (candidate.get("content") or {}).get("parts") or []:
+                        text = part.get("text")
+                        if text:
+                            yield text
+        finally:
+            response.close()
+
+    async def aclose(self):
+        await self.pool.aclose()
@@ -0,0 +1,232 @@
+import asyncio
+import ssl
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+_MAX_HEADER_LINE = 64 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, reason: str, body: bytes = b""):
+        super().__init__(f"HTTP {status} {reason}: {body[:500].decode('utf-8', 'replace')}")
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+
+class _Connection:
+    __slots__ = ("reader", "writer", "reused")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+
+    def close(self):
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+    @property
+    def is_closing(self) -> bool:
+        return self.writer.is_closing() or self.reader.at_eof()
+
+
+class HTTPResponse:
+    """
+    A streamed response body. The connection goes back to the pool once the
+    body has been read to the end; closing the response early (e.g. on
+    cancellation) discards the connection instead.
+    """
+
+    def __init__(self, pool: "HTTPConnectionPool", conn: _Connection, status: int, reason: str,
+                 headers: Dict[str, str], method: str):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._pool = pool
+        self._conn: Optional[_Connection] = conn
+        self._keep_alive = headers.get("connection", "").lower() != "close"
+        self._no_body = method == "HEAD" or status in (204, 304) or 100 <= status < 200
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        conn = self._conn
+        if conn is None:
+            return
+        completed = False
+        try:
+            reader = conn.reader
+            if self._no_body:
+                pass
+            elif "chunked" in self.headers.get("transfer-encoding", "").lower():
+                while True:
+                    size_line = await reader.readuntil(b"\r\n")
+                    size = int(size_line.split(b";", 1)[0].strip(), 16)
+                    if size == 0:
+                        while (await reader.readuntil(b"\r\n")) != b"\r\n":
+                            pass  # trailers
+                        break
+                    data = await reader.readexactly(size)
+                    await reader.readexactly(2)
+                    yield data
+            elif "content-length" in self.headers:
+                remaining = int(self.headers["content-length"])
+                while remaining > 0:
+                    data = await reader.read(min(remaining, 65536))
+                    if not data:
+                        raise asyncio.IncompleteReadError(b"", remaining)
+                    remaining -= len(data)
+                    yield data
+            else:
+                self._keep_alive = False
+                while True:
+                    data = await reader.read(65536)
+                    if not data:
+                        break
+                    yield data
+            completed = True
+        finally:
+            if completed and self._keep_alive:
+                self._release()
+            else:
+                self.close()
+
+    async def iter_lines(self) -> AsyncIterator[str]:
+        buffer = b""
+        async for data in self.iter_chunks():
+            buffer += data
+            while True:
+                nl = buffer.find(b"\n")
+                if nl < 0:
+                    break
+                line, buffer = buffer[:nl], buffer[nl + 1:]
+                yield line.rstrip(b"\r").decode("utf-8")
+        if buffer:
+            yield buffer.rstrip(b"\r").decode("utf-8")
+
+    async def read(self) -> bytes:
+        return b"".join([data async for data in self.iter_chunks()])
+
+    def _release(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._release(conn)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+
+
+class HTTPConnectionPool:
+    """
+    Minimal HTTP/1.1 client with keep-alive connection reuse for a single
+    origin. Enough for JSON and server-sent-event APIs without pulling in an
+    HTTP library.
+    """
+
+    def __init__(self, base_url: str, max_idle: int = 8, connect_timeout: float = 10.0):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported URL scheme: {base_url}")
+        self.host = parts.hostname or ""
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.base_path = parts.path.rstrip("/")
+        self.ssl_context = ssl.create_default_context() if parts.scheme == "https" else None
+        self.max_idle = max_idle
+        self.connect_timeout = connect_timeout
+        self.connections_opened = 0
+        self._idle: List[_Connection] = []
+        # Loop the idle connections belong to; their streams cannot be used from another one.
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closed = False
+
+    def _host_header(self) -> str:
+        default = 443 if self.ssl_context else 80
+        return self.host if self.port == default else f"{self.host}:{self.port}"
+
+    async def _acquire(self) -> _Connection:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self.close_idle()
+            self._loop = loop
+        while self._idle:
+            conn = self._idle.pop()
+            if not conn.is_closing:
+                conn.reused = True
+                return conn
+            conn.close()
+        async with asyncio.timeout(self.connect_timeout):
+            reader, writer = await asyncio.open_connection(
+                self.host, self.port, ssl=self.ssl_context, limit=_MAX_HEADER_LINE)
+        self.connections_opened += 1
+        return _Connection(reader, writer)
+
+    def _release(self, conn: _Connection):
+        if self._closed or conn.is_closing or len(self._idle) >= self.max_idle:
+            conn.close()
+        else:
+            self._idle.append(conn)
+
+    async def request(self, method: str, path: str, headers: Optional[Dict[str, str]] = None,
+                      body: bytes = b"") -> HTTPResponse:
+        """
+        Sends a request and returns once the status line and headers are in.
+        A request on a reused connection that the server already closed is
+        retried once on a fresh connection.
+        """
+        for attempt in (0, 1):
+            conn = await self._acquire()
+            try:
+                return await self._send(conn, method, path, headers or {}, body)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                conn.close()
+                if not conn.reused or attempt:
+                    raise
+                logger.debug("Stale keep-alive connection to %s, retrying: %s", self.host, e)
+            except BaseException:
+                conn.close()
+                raise
+        raise AssertionError("unreachable")
+
+    async def _send(self, conn: _Connection, method: str, path: str, headers: Dict[str, str],
+                    body: bytes) -> HTTPResponse:
+        lines = [f"{method} {self.base_path}{path} HTTP/1.1", f"Host: {self._host_header()}",
+                 "Connection: keep-alive", f"Content-Length: {len(body)}"]
+        lines.extend(f"{k}: {v}" for k, v in headers.items())
+        conn.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await conn.writer.drain()
+
+        status_line = await conn.reader.readuntil(b"\r\n")
+        version, status, reason = _parse_status_line(status_line)
+        response_headers = {}
+        while True:
+            line = await conn.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        if version == "HTTP/1.0" and response_headers.get("connection", "").lower() != "keep-alive":
+            response_headers["connection"] = "close"
+        return HTTPResponse(self, conn, status, reason, response_headers, method)
+
+    def close_idle(self):
+        """Closes the kept-alive connections; the pool stays usable."""
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    async def aclose(self):
+        self._closed = True
+        self.close_idle()
+
+
+def _parse_status_line(line: bytes) -> Tuple[str, int, str]:
+    parts = line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+        raise ConnectionError(f"Malformed HTTP status line: {line[:100]!r}")
+    return parts[0], int(parts[1]), parts[2] if len(parts) > 2 else ""
@@ -0,0 +1,88 @@
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .base import LLMProvider, Message, ProviderError
+from .http import HTTPConnectionPool, HTTPError
+
+logger = logging.getLogger(__name__)
+
+
+async def iter_sse_data(lines: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Yields the `data:` payloads of a server-sent-event stream."""
+    data_lines = []
+    async for line in lines:
+        if not line:
+            if data_lines:
+                yield "\n".join(data_lines)
+                data_lines = []
+            continue
+        if line.startswith("data:"):
+            data_lines.append(line[5:].lstrip())
+    if data_lines:
+        yield "\n".join(data_lines)
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """
+    Streams from any `/chat/completions` endpoint that follows the OpenAI
+    wire format (OpenAI, DeepSeek, most local servers).
+    """
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str], model: str = "gpt-4o-mini",
+                 base_url: str = "https://api.openai.com/v1", max_idle_connections: int = 8,
+                 connect_timeout: float = 10.0, **kwargs: Any):
+        super().__init__(model, **kwargs)
+        self.api_key = api_key
+        self.pool = HTTPConnectionPool(base_url, max_idle=max_idle_connections, connect_timeout=connect_timeout)
+
+    def _build_body(self, messages: List[Message], system_prompt: Optional[str], params: Dict[str, Any]) -> Dict[str, Any]:
+        payload_messages = []
+        if system_prompt:
+            payload_messages.append({"role": "system", "content": system_prompt})
+        payload_messages.extend({"role": m["role"], "content": m["content"]} for m in messages)
+        return {"model": self.model, "messages": payload_messages, "stream": True, **params}
+
+    async def _stream_chunks(self, messages: List[Message], system_prompt: Optional[str],
+                             params: Dict[str, Any]) -> AsyncIterator[str]:
+        body = json.dumps(self._build_body(messages, system_prompt, params)).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Accept": "text/event-stream"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        response = await self.pool.request("POST", "/chat/completions", headers, body)
+        try:
+            if response.status != 200:
+                raise ProviderError(str(HTTPError(response.status, response.reason, await response.read())))
+            done = False
+            # Read to the end even after [DONE] so the connection can go back to the pool.
+            async for data in iter_sse_data(response.iter_lines()):
+                if done:
+                    continue
+                if data == "[DONE]":
+                    done = True
+                    continue
+                try:
+                    event = json.loads(data)
+                except json.JSONDecodeError:
+                    logger.debug("Skipping malformed SSE event from %s", self.name)
+                    continue
+                if "error" in event:
+                    raise ProviderError(f"{self.name}: {event['error']}")
+                for choice in event.get("choices") or []:
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        yield content
+        finally:
+            response.close()
+
+    async def aclose(self):
+        await self.pool.aclose()
+
+
+class DeepSeekProvider(OpenAICompatibleProvider):
+    name = "deepseek"
+
+    def __init__(self, api_key: Optional[str], model: str = "deepseek-chat",
+                 base_url: str = "https://api.deepseek.com/v1", **kwargs: Any):
+        super().__init__(api_key, model=model, base_url=base_url, **kwargs)
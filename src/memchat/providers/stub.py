@@ -0,0 +1,52 @@
+import asyncio
+import random
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from .base import LLMProvider, Message
+
+
+def _echo_reply(messages: List[Message], system_prompt: Optional[str]) -> str:
+    last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    return f"*nods thoughtfully* You said: \"{last_user}\". Tell me more about that."
+
+
+class StubProvider(LLMProvider):
+    """
+    In-process provider for offline runs and load tests. Replies are split
+    into word-sized chunks and delivered with simulated latency.
+
+    Args:
+        first_token_latency (float): Seconds before the first chunk.
+        token_latency (float): Seconds between chunks.
+        jitter (float): Relative random variation applied to each delay.
+        reply_fn (callable, optional): Builds the reply text from
+            (messages, system_prompt). Defaults to echoing the last user turn.
+    """
+    name = "stub"
+
+    def __init__(self, model: str = "stub", first_token_latency: float = 0.2, token_latency: float = 0.02,
+                 jitter: float = 0.0, reply_fn: Optional[Callable[[List[Message], Optional[str]], str]] = None,
+                 seed: Optional[int] = None, **kwargs: Any):
+        super().__init__(model, **kwargs)
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.jitter = jitter
+        self.reply_fn = reply_fn or _echo_reply
+        self._rng = random.Random(seed)
+        self.requests = 0
+
+    def _delay(self, base: float) -> float:
+        if not self.jitter or base <= 0:
+            return base
+        return max(0.0, base * (1 + self._rng.uniform(-self.jitter, self.jitter)))
+
+    async def _stream_chunks(self, messages: List[Message], system_prompt: Optional[str],
+                             params: Dict[str, Any]) -> AsyncIterator[str]:
+        self.requests += 1
+        reply = self.reply_fn(messages, system_prompt)
+        await asyncio.sleep(self._delay(self.first_token_latency))
+        words = reply.split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self._delay(self.token_latency))
+            yield word if i == len(words) - 1 else word + " "
@@ -0,0 +1,768 @@
+import os
+import re
+import json
+import time
+import base64
+import struct
+import signal
+import asyncio
+import hashlib
+import logging
+import secrets
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from .character_cache import CharacterCache, character_cache
+from .consolidation import ConsolidationWorker
+from .history import ChatHistoryLog
+from .main import chat_agent
+from .metrics import metrics
+from .providers import LLMProvider, create_provider
+
+logger = logging.getLogger(__name__)
+
+_MAX_HEADER_LINE = 16 * 1024
+_MAX_HEADERS = 100
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_SESSION_META = "session.json"
+_SESSION_ID = re.compile(r"^[0-9a-f]{8,64}$")
+
+_REASONS = {
+    200: "OK", 201: "Created", 204: "No Content", 101: "Switching Protocols", 400: "Bad Request",
+    404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 411: "Length Required",
+    413: "Payload Too Large", 426: "Upgrade Required", 429: "Too Many Requests",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class HTTPRequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class SessionBusyError(HTTPRequestError):
+    def __init__(self, session_id: str):
+        super().__init__(429, f"Session {session_id} already has the maximum number of queued messages")
+
+
+class TurnCancelledError(Exception):
+    pass
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]
+    body: bytes = b""
+
+    def json(self) -> Dict[str, Any]:
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise HTTPRequestError(400, f"Invalid JSON body: {e}")
+        if not isinstance(data, dict):
+            raise HTTPRequestError(400, "JSON body must be an object")
+        return data
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+
+class Turn:
+    """
+    One user message and its streamed reply. The reply is buffered up to
+    `buffer` chunks; beyond that the producing session waits for the reader,
+    so a slow client slows its own generation instead of growing memory.
+    """
+
+    def __init__(self, content: str, buffer: int = 64):
+        self.content = content
+        self.text = ""
+        self.error: Optional[BaseException] = None
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+        self._buffer = buffer
+        self._chunks: Deque[str] = deque()
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+
+    async def put(self, chunk: str):
+        while len(self._chunks) >= self._buffer:
+            self._writable.clear()
+            await self._writable.wait()
+        self._chunks.append(chunk)
+        self._readable.set()
+
+    def close(self, error: Optional[BaseException] = None):
+        self.closed = True
+        self.error = error
+        self._readable.set()
+
+    def cancel(self):
+        """Stops the turn; the partial reply is kept in the session history."""
+        if self.task is not None:
+            self.task.cancel()
+        elif not self.closed:
+            self.close(TurnCancelledError("cancelled before it started"))
+
+    async def chunks(self) -> AsyncIterator[str]:
+        while True:
+            while self._chunks:
+                chunk = self._chunks.popleft()
+                self._writable.set()
+                yield chunk
+            if self.closed:
+                if self.error is not None:
+                    raise self.error
+                return
+            self._readable.clear()
+            await self._readable.wait()
+
+
+class ChatSession:
+    """
+    A chat_agent plus a FIFO of pending turns. Turns of one session run one at
+    a time in submission order; sessions run concurrently with each other.
+    An idle session holds no task.
+    """
+
+    def __init__(self, session_id: str, agent: chat_agent, character_key: str, max_pending: int = 4,
+                 stream_buffer: int = 64):
+        self.id = session_id
+        self.agent = agent
+        self.character_key = character_key
+        self.max_pending = max_pending
+        self.stream_buffer = stream_buffer
+        self.created = time.time()
+        self.last_active = time.monotonic()
+        self.turns = 0
+        self._queue: Deque[Turn] = deque()
+        self._current: Optional[Turn] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.closing = False
+
+    @property
+    def busy(self) -> bool:
+        return self._worker is not None
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue) + (self._current is not None)
+
+    def submit(self, content: str) -> Turn:
+        if self.closing:
+            raise HTTPRequestError(409, f"Session {self.id} is closing")
+        if self.pending >= self.max_pending:
+            raise SessionBusyError(self.id)
+        turn = Turn(content, self.stream_buffer)
+        self._queue.append(turn)
+        self.last_active = time.monotonic()
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._drain(), name=f"memchat-session-{self.id}")
+        return turn
+
+    async def _drain(self):
+        try:
+            while self._queue:
+                turn = self._queue.popleft()
+                if turn.closed:
+                    continue
+                self._current = turn
+                turn.task = asyncio.create_task(self._produce(turn))
+                await asyncio.wait([turn.task])
+                self._current = None
+                self.last_active = time.monotonic()
+        finally:
+            self._current = None
+            # No await between the empty check and this: submit() sees a consistent state.
+            self._worker = None
+
+    async def _produce(self, turn: Turn):
+        try:
+            async for chunk in self.agent.send(turn.content):
+                await turn.put(chunk)
+        except asyncio.CancelledError:
+            turn.text = self.agent.last_stream.text if self.agent.last_stream else ""
+            turn.close(TurnCancelledError("interrupted"))
+            raise
+        except Exception as e:
+            logger.error(f"Session {self.id}: reply failed: {e}")
+            metrics.inc("server_turn_errors")
+            turn.close(e)
+            return
+        turn.text = self.agent.last_stream.text
+        self.turns += 1
+        turn.close()
+
+    async def wait_idle(self):
+        while self._worker is not None:
+            await asyncio.wait([self._worker])
+
+    def cancel(self):
+        for turn in self._queue:
+            turn.cancel()
+        self._queue.clear()
+        if self._current is not None:
+            self._current.cancel()
+
+    async def close(self):
+        """Cancels the queued and running turns, waits for the partial reply to be recorded, then closes the history."""
+        self.closing = True
+        self.cancel()
+        await self.wait_idle()
+        self.agent.close()
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "character": self.agent.character.name,
+            "user_name": self.agent.user_name,
+            "messages": len(self.agent.messages),
+            "turns": self.turns,
+            "pending": self.pending,
+            "created": self.created,
+        }
+
+
+@dataclass
+class ServerStats:
+    connections: int = 0
+    requests: int = 0
+    sessions_created: int = 0
+    sessions_restored: int = 0
+    sessions_evicted: int = 0
+    rejected: int = 0
+    turns: int = 0
+    started: float = field(default_factory=time.time)
+
+
+class ChatServer:
+    """
+    Serves many chat sessions from one asyncio event loop over HTTP/1.1 and
+    WebSocket, without a web framework.
+
+    Endpoints:
+        POST   /sessions                  {"character", "user_name", "pick_greeting", "session_id"}
+        GET    /sessions/{id}
+        DELETE /sessions/{id}
+        POST   /sessions/{id}/messages    {"content", "stream"}; with "stream" (or
+                                          `Accept: text/event-stream`) the reply is sent as
+                                          server-sent events, otherwise as one JSON object
+        GET    /sessions/{id}/ws          WebSocket; send {"content"} or {"type": "interrupt"},
+                                          receive {"type": "chunk"|"done"|"error", ...}
+        GET    /health, GET /metrics
+
+    Characters are loaded through the shared CharacterCache, so sessions on
+    the same card share its text. With `history_dir`, every session keeps a
+    ChatHistoryLog there; idle sessions are then evicted after
+    `idle_timeout` and transparently restored on their next request.
+
+    Args:
+        characters_dir (str): Root that `character` paths are resolved against.
+        provider (LLMProvider, optional): Shared by all sessions. Its
+            `max_concurrency` bounds concurrent generations.
+        history_dir (str, optional): Directory for per-session histories.
+        max_sessions (int): Sessions kept in memory; creation beyond it gets 503.
+        max_pending (int): Queued messages per session before 429.
+        stream_buffer (int): Reply chunks buffered per turn before generation
+            waits for the client.
+        idle_timeout (float): Seconds before an idle session is evicted.
+        max_body (int): Largest accepted request body in bytes.
+    """
+
+    def __init__(self, characters_dir: str, provider: Optional[LLMProvider] = None,
+                 history_dir: Optional[str] = None, consolidator: Optional[ConsolidationWorker] = None,
+                 cache: Optional[CharacterCache] = None, max_sessions: int = 10000, max_pending: int = 4,
+                 stream_buffer: int = 64, idle_timeout: float = 1800.0, max_body: int = 1024 * 1024):
+        self.characters_dir = os.path.realpath(characters_dir)
+        self.provider = provider or create_provider()
+        self.history_dir = history_dir
+        self.consolidator = consolidator
+        self.cache = cache or character_cache
+        self.max_sessions = max_sessions
+        self.max_pending = max_pending
+        self.stream_buffer = stream_buffer
+        self.idle_timeout = idle_timeout
+        self.max_body = max_body
+        self.sessions: Dict[str, ChatSession] = {}
+        self.stats = ServerStats()
+        self._server: Optional[asyncio.Server] = None
+        self._connections: set = set()
+        self._reaper: Optional[asyncio.Task] = None
+        self._closing = False
+
+    # --- sessions ---
+
+    def _resolve_character(self, character: str) -> str:
+        path = os.path.realpath(os.path.join(self.characters_dir, character))
+        if os.path.commonpath([self.characters_dir, path]) != self.characters_dir:
+            raise HTTPRequestError(400, "Character path is outside the characters directory")
+        if not os.path.isfile(path):
+            raise HTTPRequestError(404, f"Character not found: {character}")
+        return path
+
+    def _session_dir(self, session_id: str) -> Optional[str]:
+        return os.path.join(self.history_dir, session_id) if self.history_dir else None
+
+    def create_session(self, character: str, user_name: str = "User", pick_greeting: Any = False,
+                       session_id: Optional[str] = None) -> ChatSession:
+        if self._closing:
+            raise HTTPRequestError(503, "Server is shutting down")
+        if len(self.sessions) >= self.max_sessions:
+            self._evict_idle(force=True)
+            if len(self.sessions) >= self.max_sessions:
+                self.stats.rejected += 1
+                raise HTTPRequestError(503, "Too many sessions")
+        if session_id is None:
+            session_id = secrets.token_hex(8)
+        elif not _SESSION_ID.match(session_id):
+            raise HTTPRequestError(400, "session_id must be 8-64 lowercase hex characters")
+        elif session_id in self.sessions:
+            raise HTTPRequestError(409, f"Session {session_id} already exists")
+
+        path = self._resolve_character(character)
+        session_dir = self._session_dir(session_id)
+        if session_dir and os.path.exists(os.path.join(session_dir, _SESSION_META)):
+            raise HTTPRequestError(409, f"Session {session_id} already exists")
+        session = self._open_session(session_id, path, user_name, pick_greeting)
+        if session_dir:
+            meta = {"character": os.path.relpath(path, self.characters_dir), "user_name": user_name,
+                    "pick_greeting": pick_greeting}
+            with open(os.path.join(session_dir, _SESSION_META), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+        self.stats.sessions_created += 1
+        metrics.inc("server_sessions_created")
+        return session
+
+    def _open_session(self, session_id: str, path: str, user_name: str, pick_greeting: Any) -> ChatSession:
+        char = self.cache.get(path)
+        if char is None:
+            raise HTTPRequestError(400, f"Could not load character: {os.path.relpath(path, self.characters_dir)}")
+        session_dir = self._session_dir(session_id)
+        history = ChatHistoryLog(session_dir) if session_dir else None
+        agent = chat_agent(char, chat_historic=history, provider=self.provider, user_name=user_name,
+                           pick_greeting=pick_greeting, consolidator=self.consolidator, session=session_id)
+        session = ChatSession(session_id, agent, path, self.max_pending, self.stream_buffer)
+        self.sessions[session_id] = session
+        return session
+
+    def get_session(self, session_id: str) -> ChatSession:
+        """Returns a live session, restoring an evicted one from its history directory."""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            return session
+        session_dir = self._session_dir(session_id) if _SESSION_ID.match(session_id) else None
+        if not session_dir or not os.path.isfile(os.path.join(session_dir, _SESSION_META)):
+            raise HTTPRequestError(404, f"Unknown session: {session_id}")
+        if self._closing:
+            raise HTTPRequestError(503, "Server is shutting down")
+        with open(os.path.join(session_dir, _SESSION_META), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if len(self.sessions) >= self.max_sessions:
+            self._evict_idle(force=True)
+        session = self._open_session(session_id, self._resolve_character(meta["character"]),
+                                     meta.get("user_name", "User"), meta.get("pick_greeting", False))
+        self.stats.sessions_restored += 1
+        return session
+
+    async def close_session(self, session_id: str) -> bool:
+        session = self.sessions.get(session_id)
+        if session is None:
+            return False
+        # Kept in `sessions` while closing, so a request cannot restore a second copy that writes the same history.
+        await session.close()
+        self.sessions.pop(session_id, None)
+        return True
+
+    def _evict_idle(self, force: bool = False):
+        """Closes sessions idle for `idle_timeout` (with `force`, any idle one). Only with history on disk."""
+        if not self.history_dir:
+            return
+        now = time.monotonic()
+        idle = sorted((s for s in self.sessions.values() if not s.busy), key=lambda s: s.last_active)
+        for session in idle:
+            if not force and now - session.last_active < self.idle_timeout:
+                break
+            # Idle: no turn can still write to the history.
+            del self.sessions[session.id]
+            session.agent.close()
+            self.stats.sessions_evicted += 1
+            if force:
+                break
+
+    async def _reap_idle(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 4))
+            self._evict_idle()
+
+    # --- lifecycle ---
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> Tuple[str, int]:
+        self._server = await asyncio.start_server(self._handle_connection, host, port, limit=_MAX_HEADER_LINE,
+                                                  backlog=1024)
+        self._reaper = asyncio.create_task(self._reap_idle())
+        address = self._server.sockets[0].getsockname()[:2]
+        logger.info(f"memchat server listening on http://{address[0]}:{address[1]}")
+        return address
+
+    async def shutdown(self, drain_timeout: float = 10.0):
+        """
+        Stops accepting connections, lets running turns finish for up to
+        `drain_timeout` seconds, cancels the rest (their partial replies are
+        kept), then closes every session, which flushes its history.
+        """
+        if self._closing:
+            return
+        self._closing = True
+        if self._server is not None:
+            self._server.close()
+        if self._reaper is not None:
+            self._reaper.cancel()
+        busy = [s.wait_idle() for s in self.sessions.values() if s.busy]
+        if busy:
+            logger.info(f"Waiting for {len(busy)} sessions to finish their replies")
+            done, pending = await asyncio.wait([asyncio.ensure_future(b) for b in busy], timeout=drain_timeout)
+            for session in self.sessions.values():
+                session.cancel()
+            if pending:
+                await asyncio.wait(pending, timeout=1.0)
+        for session_id in list(self.sessions):
+            await self.close_session(session_id)
+        for task in list(self._connections):
+            task.cancel()
+        if self._connections:
+            await asyncio.wait(list(self._connections), timeout=1.0)
+        if self._server is not None:
+            await self._server.wait_closed()
+        await self.provider.aclose()
+        logger.info("memchat server stopped")
+
+    # --- HTTP ---
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        try:
+            line = await reader.readuntil(b"\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise HTTPRequestError(400, "Request line too long")
+        parts = line.decode("latin-1").rstrip("\r\n").split(" ")
+        if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+            raise HTTPRequestError(400, "Malformed request line")
+        method, target, version = parts
+        headers: Dict[str, str] = {}
+        while True:
+            try:
+                line = await reader.readuntil(b"\r\n")
+            except asyncio.LimitOverrunError:
+                raise HTTPRequestError(400, "Header line too long")
+            if line == b"\r\n":
+                break
+            if len(headers) >= _MAX_HEADERS:
+                raise HTTPRequestError(400, "Too many headers")
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if version == "HTTP/1.0" and headers.get("connection", "").lower() != "keep-alive":
+            headers["connection"] = "close"
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HTTPRequestError(411, "Chunked request bodies are not supported")
+        length = int(headers.get("content-length") or 0)
+        if length > self.max_body:
+            raise HTTPRequestError(413, f"Request body larger than {self.max_body} bytes")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        return Request(method.upper(), url.path, dict(parse_qsl(url.query)), headers, body)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        self.stats.connections += 1
+        try:
+            while not self._closing:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPRequestError as e:
+                    await _send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                self.stats.requests += 1
+                try:
+                    keep_alive = await self._route(request, reader, writer)
+                except HTTPRequestError as e:
+                    await _send_json(writer, e.status, {"error": e.message}, request.keep_alive)
+                    keep_alive = request.keep_alive
+                metrics.inc("server_requests", method=request.method)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Unhandled error on connection: {e}")
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _route(self, request: Request, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """Handles one request; returns whether the connection can be reused."""
+        parts = [p for p in request.path.split("/") if p]
+        method = request.method
+        if parts == ["health"] and method == "GET":
+            await _send_json(writer, 200, {"status": "ok", "sessions": len(self.sessions),
+                                           "active": sum(s.busy for s in self.sessions.values())},
+                             request.keep_alive)
+        elif parts == ["metrics"] and method == "GET":
+            await _send(writer, 200, metrics.prometheus_text().encode("utf-8"), "text/plain; version=0.0.4",
+                        request.keep_alive)
+        elif parts == ["sessions"] and method == "POST":
+            data = request.json()
+            if not isinstance(data.get("character"), str):
+                raise HTTPRequestError(400, "'character' is required")
+            session = self.create_session(data["character"], str(data.get("user_name") or "User"),
+                                          data.get("pick_greeting", False), data.get("session_id"))
+            await _send_json(writer, 201, {**session.info(), "first_message": session.agent.messages[0]["content"]},
+                             request.keep_alive)
+        elif len(parts) == 2 and parts[0] == "sessions":
+            if method == "GET":
+                await _send_json(writer, 200, self.get_session(parts[1]).info(), request.keep_alive)
+            elif method == "DELETE":
+                if not await self.close_session(parts[1]):
+                    raise HTTPRequestError(404, f"Unknown session: {parts[1]}")
+                await _send(writer, 204, b"", None, request.keep_alive)
+            else:
+                raise HTTPRequestError(405, f"{method} not allowed")
+        elif len(parts) == 3 and parts[0] == "sessions" and parts[2] == "messages":
+            if method != "POST":
+                raise HTTPRequestError(405, f"{method} not allowed")
+            session = self.get_session(parts[1])
+            data = request.json()
+            content = data.get("content")
+            if not isinstance(content, str) or not content.strip():
+                raise HTTPRequestError(400, "'content' must be a non-empty string")
+            stream = data.get("stream") or "text/event-stream" in request.headers.get("accept", "")
+            turn = session.submit(content)
+            self.stats.turns += 1
+            metrics.inc("server_turns")
+            if stream:
+                return await self._stream_turn(turn, writer, request.keep_alive)
+            interrupted = False
+            try:
+                async for _ in turn.chunks():
+                    pass
+            except TurnCancelledError:
+                interrupted = True
+            except Exception as e:
+                raise HTTPRequestError(500, f"Reply failed: {e}")
+            await _send_json(writer, 200, {"reply": turn.text, "interrupted": interrupted}, request.keep_alive)
+        elif len(parts) == 3 and parts[0] == "sessions" and parts[2] == "ws":
+            session = self.get_session(parts[1])
+            await self._websocket(session, request, reader, writer)
+            return False
+        else:
+            raise HTTPRequestError(404, f"No route for {method} {request.path}")
+        return request.keep_alive
+
+    async def _stream_turn(self, turn: Turn, writer: asyncio.StreamWriter, keep_alive: bool) -> bool:
+        head = ["HTTP/1.1 200 OK", "Content-Type: text/event-stream", "Cache-Control: no-cache",
+                "Transfer-Encoding: chunked", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        try:
+            try:
+                async for chunk in turn.chunks():
+                    writer.write(_http_chunk(_sse({"text": chunk})))
+                    await writer.drain()
+                event = _sse({"text": turn.text}, "done")
+            except TurnCancelledError:
+                event = _sse({"text": turn.text}, "interrupted")
+            except Exception as e:
+                event = _sse({"error": str(e)}, "error")
+            writer.write(_http_chunk(event) + b"0\r\n\r\n")
+            await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            # The client went away: stop generating, keep what was produced.
+            turn.cancel()
+            raise
+        return keep_alive
+
+    # --- WebSocket ---
+
+    async def _websocket(self, session: ChatSession, request: Request, reader: asyncio.StreamReader,
+                         writer: asyncio.StreamWriter):
+        key = request.headers.get("sec-websocket-key")
+        if request.headers.get("upgrade", "").lower() != "websocket" or not key:
+            raise HTTPRequestError(426, "WebSocket upgrade required")
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode("latin-1")).digest()).decode("latin-1")
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        # Turns submitted on this socket and not yet fully sent, oldest first.
+        open_turns: Deque[Turn] = deque()
+        submitted = asyncio.Event()
+        sender = asyncio.create_task(self._ws_send_turns(open_turns, submitted, writer))
+        try:
+            while True:
+                opcode, payload = await _ws_read_message(reader, self.max_body)
+                if opcode == 0x8:
+                    writer.write(_ws_frame(0x8, payload[:2]))
+                    break
+                if opcode == 0x9:
+                    writer.write(_ws_frame(0xA, payload))
+                    continue
+                if opcode != 0x1:
+                    continue
+                try:
+                    data = json.loads(payload)
+                    if data.get("type") == "interrupt":
+                        for turn in open_turns:
+                            turn.cancel()
+                        continue
+                    content = data.get("content")
+                    if not isinstance(content, str) or not content.strip():
+                        raise HTTPRequestError(400, "'content' must be a non-empty string")
+                    open_turns.append(session.submit(content))
+                    self.stats.turns += 1
+                    submitted.set()
+                except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
+                    writer.write(_ws_text({"type": "error", "error": "invalid message"}))
+                except HTTPRequestError as e:
+                    writer.write(_ws_text({"type": "error", "status": e.status, "error": e.message}))
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            sender.cancel()
+            await asyncio.wait([sender])
+            for turn in open_turns:
+                turn.cancel()
+
+    async def _ws_send_turns(self, open_turns: Deque[Turn], submitted: asyncio.Event, writer: asyncio.StreamWriter):
+        while True:
+            if not open_turns:
+                submitted.clear()
+                await submitted.wait()
+                continue
+            turn = open_turns[0]
+            try:
+                async for chunk in turn.chunks():
+                    writer.write(_ws_text({"type": "chunk", "text": chunk}))
+                    await writer.drain()
+                writer.write(_ws_text({"type": "done", "text": turn.text}))
+            except TurnCancelledError:
+                writer.write(_ws_text({"type": "interrupted", "text": turn.text}))
+            except asyncio.CancelledError:
+                raise
+            except ConnectionError:
+                return
+            except Exception as e:
+                writer.write(_ws_text({"type": "error", "error": str(e)}))
+            open_turns.popleft()
+            await writer.drain()
+
+
+def _head(status: int, content_type: Optional[str], length: int, keep_alive: bool) -> bytes:
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"Content-Length: {length}",
+             f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    if content_type:
+        lines.append(f"Content-Type: {content_type}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _send(writer: asyncio.StreamWriter, status: int, body: bytes, content_type: Optional[str],
+                keep_alive: bool):
+    writer.write(_head(status, content_type, len(body), keep_alive) + body)
+    await writer.drain()
+
+
+async def _send_json(writer: asyncio.StreamWriter, status: int, data: Any, keep_alive: bool = True):
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    await _send(writer, status, body, "application/json", keep_alive)
+
+
+def _http_chunk(data: bytes) -> bytes:
+    return b"%x\r\n%s\r\n" % (len(data), data)
+
+
+def _sse(data: Any, event: Optional[str] = None) -> bytes:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def _ws_frame(opcode: int, payload: bytes) -> bytes:
+    n = len(payload)
+    if n < 126:
+        header = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return header + payload
+
+
+def _ws_text(data: Any) -> bytes:
+    return _ws_frame(0x1, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+def _ws_unmask(payload: bytes, mask: bytes) -> bytes:
+    n = len(payload)
+    key = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, "little") ^ int.from_bytes(key, "little")).to_bytes(n, "little")
+
+
+async def _ws_read_message(reader: asyncio.StreamReader, max_size: int) -> Tuple[int, bytes]:
+    """Reads one message (reassembling fragments); control frames are returned as they arrive."""
+    opcode, parts, size = None, [], 0
+    while True:
+        b1, b2 = await reader.readexactly(2)
+        fin, frame_opcode, length = b1 & 0x80, b1 & 0x0F, b2 & 0x7F
+        if not b2 & 0x80:
+            raise ValueError("client frames must be masked")
+        if length == 126:
+            length = struct.unpack("!H", await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await reader.readexactly(8))[0]
+        size += length
+        if size > max_size:
+            raise ValueError("message too large")
+        mask = await reader.readexactly(4)
+        payload = _ws_unmask(await reader.readexactly(length), mask) if length else b""
+        if frame_opcode >= 0x8:
+            return frame_opcode, payload
+        if frame_opcode:
+            opcode = frame_opcode
+        parts.append(payload)
+        if fin:
+            return opcode or 0x1, b"".join(parts)
+
+
+def serve(characters_dir: str, host: str = "127.0.0.1", port: int = 8080, history_dir: Optional[str] = None,
+          **kwargs: Any):
+    """Runs a ChatServer until SIGINT/SIGTERM, then shuts it down gracefully."""
+    async def main():
+        # Aux. agents (summaries, fact extraction) run in the background on their own provider.
+        consolidator = ConsolidationWorker(create_provider())
+        server = ChatServer(characters_dir, history_dir=history_dir, consolidator=consolidator, **kwargs)
+        await server.start(host, port)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        await stop.wait()
+        logger.info("Shutting down")
+        await server.shutdown()
+        consolidator.close(wait=False)
+
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+import base64
+import os
+
+import pytest
+
+from memchat.avatars import AvatarCache
+from memchat.png_card import image_digest, write_card_to_png
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _cache(tmp_path):
+    return AvatarCache(str(tmp_path / "cache"), sizes=(16, 32), formats=("png",), max_workers=1)
+
+
+def _avatar(path, color=(255, 0, 0)):
+    Image.new("RGB", (64, 48), color).save(path)
+    return str(path)
+
+
+def test_cards_sharing_an_image_are_rendered_once(tmp_path):
+    base = _avatar(tmp_path / "base.png")
+    cards = []
+    for name in ("alice", "bob"):
+        cards.append(str(tmp_path / f"{name}.png"))
+        write_card_to_png(base, cards[-1], base64.b64encode(name.encode("utf-8")).decode("ascii"))
+    other = _avatar(tmp_path / "other.png", color=(0, 0, 255))
+    assert image_digest(cards[0]) == image_digest(cards[1]) != image_digest(other)
+
+    cache = _cache(tmp_path)
+    assert cache.gallery(cards + [other, None], 16, "png", schedule=False) == [None, None, None, None]
+    assert cache.warm(cards + [other]) == 2
+    assert cache.rendered == 4
+    thumbs = cache.gallery(cards + [other], 32, "png")
+    assert thumbs[0] == thumbs[1] != thumbs[2]
+    with Image.open(thumbs[0]) as img:
+        assert img.size == (32, 24)
+    assert cache.submit(cards[0]) is None  # everything cached
+    cache.close()
+
+    reopened = _cache(tmp_path)
+    assert reopened.lookup(cards[1], 16, "png") == cache.lookup(cards[1], 16, "png")
+    assert reopened.stats()["hits"] == 1
+
+
+def test_changed_avatar_gets_new_thumbnails(tmp_path):
+    path = _avatar(tmp_path / "a.png")
+    cache = _cache(tmp_path)
+    cache.warm([path])
+    before = cache.lookup(path, 16, "png")
+    _avatar(tmp_path / "a.png", color=(0, 255, 0))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))  # same size; make the change visible
+    assert cache.lookup(path, 16, "png") is None
+    cache.warm([path])
+    assert cache.lookup(path, 16, "png") not in (None, before)
+    cache.close()
+
+
+def test_placeholder_is_drawn_once(tmp_path, monkeypatch):
+    import memchat.avatars as avatars
+
+    cache = _cache(tmp_path)
+    first = cache.placeholder("Alice", font=None)
+    drawn = []
+    monkeypatch.setattr(avatars, "render_placeholder", lambda *args: drawn.append(args) or b"")
+    assert cache.placeholder("Alice", font=None) == first
+    assert _cache(tmp_path).placeholder("Alice", font=None) == first
+    assert drawn == []
+    assert cache.placeholder("Bob", font=None) != first and len(drawn) == 1
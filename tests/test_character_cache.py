@@ -0,0 +1,61 @@
+import json
+import os
+
+from memchat.character_cache import CharacterCache
+
+
+def _write_card(path, name, greetings=("Hi.",)):
+    path.write_text(json.dumps({"name": name, "description": "text " * 50,
+                                "data": {"alternate_greetings": list(greetings)}}), encoding="utf-8")
+    return str(path)
+
+
+def test_hits_and_misses(tmp_path):
+    cache = CharacterCache()
+    path = _write_card(tmp_path / "a.json", "Alice")
+    assert cache.get(path).name == "Alice"
+    assert cache.get(path).name == "Alice"
+    assert cache.get(str(tmp_path / "missing.json")) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert path in cache and len(cache) == 1
+
+
+def test_changed_file_is_reloaded(tmp_path):
+    cache = CharacterCache()
+    path = _write_card(tmp_path / "a.json", "Alice")
+    cache.get(path)
+    _write_card(tmp_path / "a.json", "Alicia, renamed")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert cache.get(path).name == "Alicia, renamed"
+    assert cache.invalidations == 1 and cache.misses == 2
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = CharacterCache(max_entries=2)
+    paths = [_write_card(tmp_path / f"{name}.json", name) for name in ("a", "b", "c")]
+    cache.get(paths[0])
+    cache.get(paths[1])
+    cache.get(paths[0])
+    cache.get(paths[2])
+    assert paths[1] not in cache and paths[0] in cache and paths[2] in cache
+    assert cache.evictions == 1
+
+    small = CharacterCache(max_bytes=1)
+    small.get(paths[0])
+    assert len(small) == 0 and small.bytes == 0
+
+
+def test_callers_get_isolated_copies(tmp_path):
+    cache = CharacterCache()
+    path = _write_card(tmp_path / "a.json", "Alice", greetings=("Hi.", "Hello."))
+    first = cache.get(path)
+    first.name = "Changed"
+    first.data_alternate_greetings.append("Yo.")
+    second = cache.get(path)
+    assert second.name == "Alice" and second.data_alternate_greetings == ["Hi.", "Hello."]
+    assert second.description is first.description
+    assert cache.get(path, copy=False) is cache.get(path, copy=False)
+
+    with_avatar = cache.get(path, avatar_path="avatar.png")
+    assert with_avatar.avatar_path == "avatar.png" and cache.get(path).avatar_path is None
@@ -0,0 +1,123 @@
+import hashlib
+
+import pytest
+
+from memchat.character_system import AICharacter
+from memchat.png_card import read_card_json
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def test_save_to_png_keeps_base_pixels(tmp_path):
+    base = tmp_path / "base.png"
+    Image.new("RGB", (40, 30), (255, 0, 0)).save(base)
+    character = AICharacter()
+    character.name = "Alice"
+
+    out = tmp_path / "out.png"
+    character.save_to_png(str(out), base_image_path=str(base))
+
+    assert read_card_json(str(out))["name"] == "Alice"
+    with Image.open(out) as img:
+        assert img.size == (40, 30)
+
+
+def test_save_to_png_prefers_non_png_base_over_avatar(tmp_path):
+    base = tmp_path / "base.jpg"
+    avatar = tmp_path / "avatar.png"
+    Image.new("RGB", (40, 40), (255, 0, 0)).save(base, "JPEG")
+    Image.new("RGB", (20, 20), (0, 255, 0)).save(avatar)
+    avatar_digest = _sha256(avatar)
+    character = AICharacter()
+    character.name = "Bob"
+    character.avatar_path = str(avatar)
+
+    out = tmp_path / "out.png"
+    character.save_to_png(str(out), base_image_path=str(base))
+
+    with Image.open(out) as img:
+        assert img.size == (40, 40)
+    assert read_card_json(str(out))["name"] == "Bob"
+    assert _sha256(avatar) == avatar_digest
+
+
+def test_save_to_png_falls_back_to_avatar(tmp_path):
+    avatar = tmp_path / "avatar.png"
+    Image.new("RGB", (20, 20), (0, 255, 0)).save(avatar)
+    character = AICharacter()
+    character.name = "Carol"
+    character.avatar_path = str(avatar)
+
+    out = tmp_path / "out.png"
+    character.save_to_png(str(out))
+
+    with Image.open(out) as img:
+        assert img.size == (20, 20)
+    loaded = AICharacter.load_from_file(str(out))
+    assert loaded.name == "Carol"
+
+
+def _full_card():
+    return {
+        "name": "Dana", "description": "A ranger.", "first_mes": "Hi.", "spec": "chara_card_v2",
+        "data": {"name": "Dana", "description": "A ranger.", "first_mes": "Hi.", "creator": "anon",
+                 "alternate_greetings": ["Hey.", "Yo."], "tags": ["forest", "bow"],
+                 "system_prompt": "Stay in character.",
+                 "extensions": {"depth_prompt": {"prompt": "Be terse.", "depth": 4}},
+                 "character_book": {"entries": [{"keys": ["elf"], "content": "Elves."}]}},
+    }
+
+
+def _public_fields(character):
+    return {attr: getattr(character, attr) for attr in AICharacter.__slots__
+            if not attr.startswith("_") and not attr.startswith("metadata_")}
+
+
+def test_characters_use_slots_and_share_duplicated_strings():
+    character = AICharacter.from_dict(_full_card())
+    assert not hasattr(character, "__dict__")
+    with pytest.raises(AttributeError):
+        character.nickname = "D"
+    assert character.data_description is character.description
+    # Tags built at runtime are distinct objects until interned.
+    tagged = [AICharacter.from_dict({"data": {"tags": ["".join(["for", "est"])]}}) for _ in range(2)]
+    assert tagged[0].data_tags[0] is tagged[1].data_tags[0]
+
+
+@pytest.mark.parametrize("suffix", [".json", ".png"])
+def test_lazy_card_materializes_like_an_eager_load(tmp_path, suffix):
+    path = tmp_path / f"dana{suffix}"
+    card = AICharacter.from_dict(_full_card())
+    if suffix == ".png":
+        Image.new("RGB", (4, 4)).save(tmp_path / "base.png")
+        card.save_to_png(str(path), base_image_path=str(tmp_path / "base.png"))
+    else:
+        card.save_to_json(str(path))
+
+    eager = AICharacter.load_from_file(str(path))
+    lazy = AICharacter.load_from_file(str(path), lazy=True)
+    assert lazy.is_lazy and lazy.name == "Dana" and lazy.data_tags == ["forest", "bow"]
+    with pytest.raises(AttributeError):
+        object.__getattribute__(lazy, "data_description")
+
+    assert lazy.data_alternate_greetings == ["Hey.", "Yo."]  # first access loads every text field
+    assert not lazy.is_lazy
+    assert _public_fields(lazy) == _public_fields(eager)
+    assert _public_fields(AICharacter.load_from_file(str(path), lazy=True).materialize()) == _public_fields(eager)
+
+
+def test_fields_assigned_before_materializing_are_kept(tmp_path):
+    path = tmp_path / "dana.json"
+    AICharacter.from_dict(_full_card()).save_to_json(str(path))
+    lazy = AICharacter.load_from_file(str(path), lazy=True)
+    lazy.description = "Edited."
+    lazy.materialize()
+    assert lazy.description == "Edited." and lazy.data_system_prompt == "Stay in character."
+
+    copy = AICharacter.load_from_file(str(path), lazy=True).copy()
+    assert copy.is_lazy and copy.first_mes == "Hi."
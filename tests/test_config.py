@@ -0,0 +1,23 @@
+import subprocess
+import sys
+
+from memchat.config import Config
+
+
+def test_importing_memchat_loads_no_heavy_dependencies():
+    code = ("import sys, memchat, memchat.main, memchat.character_system, memchat.config\n"
+            "print(sorted(m for m in ('PIL', 'numpy', 'dotenv') if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+
+def test_settings_resolve_on_first_access(monkeypatch, tmp_path):
+    monkeypatch.delenv("DEBUG_MODE", raising=False)
+    monkeypatch.setenv("METRICS_PORT", "9100")
+    config = Config(env_file=str(tmp_path / "missing.env"))
+    assert config.DEBUG_MODE is False and config.METRICS_PORT == 9100
+
+    monkeypatch.setenv("DEBUG_MODE", "yes")
+    assert config.DEBUG_MODE is False  # cached until reload()
+    config.reload()
+    assert config.DEBUG_MODE is True
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+from memchat.consolidation import ConsolidationWorker
+from memchat.providers import StubProvider
+
+
+def _window(n=4):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"line {i}"} for i in range(n)]
+
+
+def _worker(**kwargs):
+    provider = StubProvider(first_token_latency=0.0, token_latency=0.0, reply_fn=lambda m, s: "They talked.", **kwargs)
+    return ConsolidationWorker(provider)
+
+
+def test_summary_is_kept_until_forgotten():
+    worker = _worker()
+    try:
+        worker.submit(_window(), session="a", first_id=0)
+        worker.submit(_window(), session="b", first_id=0)
+        assert worker.join(5)
+        assert worker.summary("a") == "They talked."
+        assert worker.summary_end("a") == 4
+
+        worker.forget("a")
+        assert worker.summary("a") == "" and worker.summary_end("a") == 0
+        assert worker.summary("b") == "They talked."
+    finally:
+        worker.close()
+
+
+def test_forget_waits_for_queued_windows():
+    release = threading.Event()
+
+    class SlowProvider(StubProvider):
+        async def _stream_chunks(self, messages, system_prompt, params):
+            await asyncio.to_thread(release.wait, 5)
+            async for chunk in super()._stream_chunks(messages, system_prompt, params):
+                yield chunk
+
+    worker = ConsolidationWorker(SlowProvider(first_token_latency=0.0, token_latency=0.0,
+                                              reply_fn=lambda m, s: "Summary."))
+    try:
+        worker.submit(_window(), session="a", first_id=0)
+        worker.forget("a")
+        release.set()
+        assert worker.join(5)
+        assert worker.metrics.processed == 1
+        assert worker.summary("a") == ""
+        assert not worker._summaries and not worker._queued and not worker._forget
+    finally:
+        worker.close()
@@ -0,0 +1,58 @@
+from memchat.context_window import CallableTokenizer, ContextAssembler
+
+
+def _assembler(max_tokens, **kwargs):
+    # One token per word keeps the budget arithmetic readable.
+    return ContextAssembler(max_tokens, tokenizer=CallableTokenizer(str.split), reserve_for_reply=0,
+                            message_overhead=0, **kwargs)
+
+
+def _history(n, words=5):
+    return [{"role": "user" if i % 2 else "assistant", "content": f"m{i} " + "w " * (words - 1)} for i in range(n)]
+
+
+def test_history_is_trimmed_oldest_first():
+    history = _history(10)
+    context = _assembler(23).build(system_prompt="one two three", messages=history)
+    assert context.messages == history[6:]
+    assert context.report.history_messages == 4 and context.report.dropped == {"history": 6}
+    assert context.report.used == 23
+
+
+def test_sections_fill_after_recent_history_and_before_older_history():
+    history = _history(10)
+    assembler = _assembler(40, min_recent_messages=2)
+    memories = ["alpha beta gamma", "delta epsilon zeta eta theta iota kappa lambda", "mu nu"]
+    context = assembler.build(system_prompt="sys", extra_sections=[("memories", memories, 0.25)], messages=history)
+    # 10 tokens for memories: the header and the first text fit, the long one is dropped, the last fits.
+    assert context.system_prompt == "sys\n\n[Memories]\nalpha beta gamma\nmu nu"
+    assert context.report.dropped["memories"] == 1
+    assert context.report.sections["memories"] == 8
+    # The two newest messages were reserved first; older ones fill what is left.
+    assert context.messages == history[4:]
+
+
+def test_fixed_sections_come_first_and_depth_prompt_is_inserted():
+    history = _history(6)
+    context = _assembler(30).build(system_prompt="sys", post_history_instructions="stay in character",
+                                   depth_prompt="be terse", depth=2, messages=history)
+    roles = [(m["role"], m["content"].split()[0]) for m in context.messages]
+    assert roles[-1] == ("system", "stay")
+    assert roles[-4] == ("system", "be") and context.messages[-3] is history[-2]
+    assert context.report.sections["post_history"] == 3 and context.report.sections["depth_prompt"] == 2
+
+
+def test_history_is_counted_incrementally():
+    calls = []
+
+    def encode(text):
+        calls.append(text)
+        return text.split()
+
+    assembler = ContextAssembler(1000, tokenizer=CallableTokenizer(encode))
+    history = _history(5)
+    assembler.build(messages=history)
+    history.append({"role": "user", "content": "new"})
+    calls.clear()
+    assembler.build(messages=history)
+    assert calls == ["new"]
@@ -0,0 +1,66 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from memchat.embeddings import CachedEmbedder, HashingEmbedder, OpenAIEmbedder
+
+
+class _EmbeddingsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        data = [{"index": i, "embedding": [float(len(text)), 1.0, 0.0, 0.0]} for i, text in enumerate(request["input"])]
+        body = json.dumps({"data": data}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def embeddings_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _EmbeddingsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_remote_embed_sync_calls_close_idle_connections(embeddings_server):
+    # Each sync call runs its own event loop, so keep-alive connections cannot outlive it.
+    embedder = OpenAIEmbedder(None, model="test", dim=4, base_url=embeddings_server, batch_size=2)
+    first = embedder.embed(["a", "bb", "ccc"])
+    opened = embedder.pool.connections_opened
+    assert not embedder.pool._idle
+    second = embedder.embed(["dddd"])
+    assert not embedder.pool._idle and embedder.pool.connections_opened == opened + 1
+
+    assert first.shape == (3, 4) and second.shape == (1, 4)
+    np.testing.assert_allclose(np.linalg.norm(first, axis=1), 1.0, rtol=1e-6)
+    assert embedder.stats.batches == 3
+
+
+def test_hashing_embedder_is_deterministic():
+    embedder = HashingEmbedder(dim=64)
+    a = embedder.embed(["the quick brown fox", "lorem ipsum"])
+    b = embedder.embed(["the quick brown fox"])
+    np.testing.assert_array_equal(a[0], b[0])
+
+
+def test_cached_embedder_hits(tmp_path):
+    embedder = CachedEmbedder(HashingEmbedder(dim=64), path=str(tmp_path / "cache.npz"))
+    embedder.embed(["x", "y", "x"])
+    embedder.embed(["y"])
+    assert (embedder.stats.cache_hits, embedder.stats.cache_misses) == (1, 2)
+    embedder.save()
+
+    reloaded = CachedEmbedder(HashingEmbedder(dim=64), path=str(tmp_path / "cache.npz"))
+    assert len(reloaded) == 2
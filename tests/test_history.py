@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+from memchat import history
+from memchat.history import ChatHistoryLog
+
+
+def _fill(directory, n, segment_max_bytes=200):
+    log = ChatHistoryLog(str(directory), segment_max_bytes=segment_max_bytes)
+    for i in range(n):
+        log.append({"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "x" * (i % 7)})
+    log.flush()
+    return log
+
+
+def _contents(log):
+    return [record["content"] for record in log]
+
+
+def test_reopen_keeps_records(tmp_path):
+    log = _fill(tmp_path, 50)
+    expected = _contents(log)
+    log.close()
+
+    reopened = ChatHistoryLog(str(tmp_path))
+    assert _contents(reopened) == expected
+    assert [r["id"] for r in reopened.tail(3)] == [47, 48, 49]
+    assert reopened.append({"role": "user", "content": "again"}) == 50
+
+
+def test_torn_final_line_is_truncated(tmp_path):
+    log = _fill(tmp_path, 10, segment_max_bytes=1 << 20)
+    log.close()
+    with open(os.path.join(tmp_path, f"{0:012d}.jsonl"), "ab") as f:
+        f.write(b'{"role":"user","content":"half')
+
+    reopened = ChatHistoryLog(str(tmp_path))
+    assert len(reopened) == 10
+    assert reopened.append({"role": "user", "content": "next"}) == 10
+    assert reopened.read(10)[0]["content"] == "next"
+
+
+def test_compact_drops_old_records(tmp_path):
+    log = _fill(tmp_path, 60)
+    expected = _contents(log)
+    log.segment_max_bytes = 1 << 20
+    assert log.compact(drop_before=20) == 20
+    assert _contents(log) == expected[20:]
+    log.close()
+
+    reopened = ChatHistoryLog(str(tmp_path))
+    assert _contents(reopened) == expected[20:]
+    assert reopened.read(0, 21)[0]["id"] == 20
+
+
+@pytest.mark.parametrize("crash_after_replaces", [1, 2, 3, 5])
+def test_interrupted_compaction_is_finished_on_open(tmp_path, monkeypatch, crash_after_replaces):
+    log = _fill(tmp_path, 60)
+    expected = _contents(log)
+    # Larger output segments overlap several old ones only partially.
+    log.segment_max_bytes = 700
+
+    real_replace = os.replace
+    calls = []
+
+    def crashing_replace(src, dst):
+        if len(calls) == crash_after_replaces:
+            raise RuntimeError("simulated crash")
+        calls.append(dst)
+        real_replace(src, dst)
+
+    monkeypatch.setattr(history.os, "replace", crashing_replace)
+    with pytest.raises(RuntimeError):
+        log.compact()
+    monkeypatch.setattr(history.os, "replace", real_replace)
+
+    reopened = ChatHistoryLog(str(tmp_path))
+    assert _contents(reopened) == expected
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp") or name == "compaction.json"]
+
+
+def test_compaction_crash_after_install_is_finished_on_open(tmp_path, monkeypatch):
+    log = _fill(tmp_path, 60)
+    expected = _contents(log)
+    log.segment_max_bytes = 700
+
+    def crash(self, segment):
+        raise RuntimeError("simulated crash")
+
+    monkeypatch.setattr(ChatHistoryLog, "_remove_segment", crash)
+    with pytest.raises(RuntimeError):
+        log.compact()
+    monkeypatch.undo()
+
+    reopened = ChatHistoryLog(str(tmp_path))
+    assert _contents(reopened) == expected
+    assert reopened.append({"role": "user", "content": "after"}) == 60
@@ -0,0 +1,199 @@
+import base64
+import json
+import os
+import sqlite3
+import struct
+import zlib
+
+from memchat.character_system import _LAZY_FIELDS, AICharacter, strip_lazy_fields
+from memchat.library import MANIFEST_NAME, CharacterLibrary
+from memchat.library_index import INDEX_NAME, JOURNAL_NAME
+from memchat.png_card import write_card_to_png
+
+
+def _chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def _base_png(path):
+    ihdr = struct.pack(">IIBBBBB", 1, 1, 8, 6, 0, 0, 0)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n" + _chunk(b"IHDR", ihdr) + _chunk(b"IDAT", zlib.compress(b"\x00\x00\x00\x00\x00"))
+                + _chunk(b"IEND", b""))
+
+
+def _card(i, text="long text"):
+    return {"name": f"Card {i}", "description": f"{text} {i}", "first_mes": "Hello!",
+            "data": {"name": f"Card {i}", "description": f"{text} {i}", "creator": "anon", "tags": ["fantasy"],
+                     "alternate_greetings": ["Hi there"], "character_version": "1.0"}}
+
+
+def _library(tmp_path, count=6):
+    root = tmp_path / "cards"
+    root.mkdir()
+    base = tmp_path / "base.png"
+    _base_png(base)
+    for i in range(count):
+        card = _card(i)
+        if i % 2:
+            payload = base64.b64encode(json.dumps(card).encode("utf-8")).decode("ascii")
+            write_card_to_png(str(base), str(root / f"c{i}.png"), payload)
+        else:
+            (root / f"c{i}.json").write_text(json.dumps(card), encoding="utf-8")
+    (root / "broken.json").write_text("{not json", encoding="utf-8")
+    return root
+
+
+def test_strip_lazy_fields_round_trips_through_a_lazy_character(tmp_path):
+    character = AICharacter()
+    character.name = "Alice"
+    character.data_tags = ["tag"]
+    for attr in _LAZY_FIELDS:
+        value = getattr(character, attr)
+        setattr(character, attr, [f"{attr} text"] if isinstance(value, list) else
+                {"entries": [f"{attr} text"]} if isinstance(value, dict) else f"{attr} text")
+    card = character.to_dict()
+    encoded = json.dumps(card)
+    light = strip_lazy_fields(card)
+    assert json.dumps(card) == encoded
+    assert not [attr for attr in _LAZY_FIELDS if f"{attr} text" in json.dumps(light)]
+
+    path = tmp_path / "alice.json"
+    path.write_text(encoded, encoding="utf-8")
+    lazy = AICharacter.from_dict(light, lazy=True, source_path=str(path))
+    full = AICharacter.from_dict(card)
+    for attr in AICharacter.__slots__:
+        if not attr.startswith("_"):
+            assert getattr(lazy, attr) == getattr(full, attr), attr
+
+
+def test_manifest_keeps_light_fields_only(tmp_path):
+    root = _library(tmp_path)
+    library = CharacterLibrary(str(root), max_workers=1)
+    report = library.scan()
+    assert (report.parsed, report.reused, len(report.failed)) == (7, 0, 1)
+    assert report.failed[0].error_type == "JSONDecodeError"
+    ok = {os.path.basename(r.path): r.data for r in report.results if r.ok}
+    assert ok["c1.png"]["name"] == "Card 1" and ok["c1.png"]["data"]["tags"] == ["fantasy"]
+    assert "description" not in ok["c1.png"] and "alternate_greetings" not in ok["c1.png"]["data"]
+    library.close()
+
+    with sqlite3.connect(root / MANIFEST_NAME) as db:
+        stored = db.execute("SELECT card, chunk_type FROM cards WHERE key = 'c1.png'").fetchone()
+    assert "long text" not in stored[0] and stored[1] == "tEXt"
+
+
+def test_warm_scan_reuses_manifest_and_loads_text_lazily(tmp_path):
+    root = _library(tmp_path)
+    library = CharacterLibrary(str(root), max_workers=1)
+    library.scan()
+    library.close()
+
+    library = CharacterLibrary(str(root), max_workers=1)
+    report = library.scan()
+    assert (report.parsed, report.reused) == (0, 7)
+    lazy = library.get(str(root / "c3.png"), lazy=True)
+    assert lazy.is_lazy and lazy.name == "Card 3"
+    assert lazy.description == "long text 3" and lazy.data_alternate_greetings == ["Hi there"]
+    full = library.get(str(root / "c2.json"))
+    assert not full.is_lazy and full.data_description == "long text 2"
+    assert sorted(c.name for c in library.characters(lazy=True)) == [f"Card {i}" for i in range(6)]
+    assert [hit.name for hit in library.search("text 5")] == ["Card 5"]
+    library.close()
+
+
+def test_changed_and_removed_files(tmp_path):
+    root = _library(tmp_path)
+    library = CharacterLibrary(str(root), max_workers=1)
+    library.scan()
+
+    base = tmp_path / "base.png"
+    payload = base64.b64encode(json.dumps(_card(1, text="rewritten")).encode("utf-8")).decode("ascii")
+    write_card_to_png(str(base), str(root / "c1.png"), payload)
+    os.unlink(root / "c4.json")
+    # A touched but identical file is detected by its hash and not re-parsed.
+    st = os.stat(root / "c2.json")
+    os.utime(root / "c2.json", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    report = library.scan()
+    assert (report.parsed, report.reused, report.removed) == (1, 5, 1)
+    assert library.get(str(root / "c1.png")).description == "rewritten 1"
+    assert library.get(str(root / "c4.json")) is None
+    assert [hit.name for hit in library.search("rewritten")] == ["Card 1"]
+    library.close()
+
+    library = CharacterLibrary(str(root), max_workers=1)
+    assert library.scan().parsed == 0
+    assert library.get(str(root / "c1.png"), lazy=True).description == "rewritten 1"
+    library.close()
+
+
+def test_index_is_rebuilt_from_card_files(tmp_path):
+    root = _library(tmp_path)
+    library = CharacterLibrary(str(root), max_workers=1)
+    library.scan()
+    library.close()
+    for name in (INDEX_NAME, JOURNAL_NAME):
+        if os.path.exists(root / name):
+            os.unlink(root / name)
+
+    library = CharacterLibrary(str(root), max_workers=1)
+    assert library.scan().parsed == 0
+    assert [hit.name for hit in library.search("text 4")] == ["Card 4"]
+    library.close()
+
+
+def test_legacy_manifest_is_left_and_unreadable_one_replaced(tmp_path):
+    root = _library(tmp_path)
+    (root / ".memchat_manifest.json").write_text(json.dumps({"version": 1, "entries": {}}), encoding="utf-8")
+    (root / MANIFEST_NAME).write_bytes(b"not a database")
+
+    library = CharacterLibrary(str(root), max_workers=1)
+    report = library.scan()
+    assert report.parsed == 7
+    assert (root / ".memchat_manifest.json").exists()
+    library.close()
+    library = CharacterLibrary(str(root), max_workers=1)
+    assert library.scan().reused == 7
+    library.close()
+
+
+def test_file_vanishing_during_a_scan_is_reported_not_stored(tmp_path, monkeypatch):
+    import memchat.library as library_module
+
+    root = _library(tmp_path)
+    library = CharacterLibrary(str(root), max_workers=1)
+    library.scan()
+    os.utime(root / "c3.png", ns=(0, 10**9))
+    parse = library_module._parse_card_file
+
+    def delete_then_parse(job):
+        os.unlink(job[0])
+        return parse(job)
+
+    monkeypatch.setattr(library_module, "_parse_card_file", delete_then_parse)
+    report = library.scan()
+    assert [(os.path.basename(r.path), r.error_type) for r in report.failed] == [
+        ("broken.json", "JSONDecodeError"), ("c3.png", "FileNotFoundError")]
+    assert library.get(str(root / "c3.png")) is None
+    library.close()
+
+    with sqlite3.connect(root / MANIFEST_NAME) as db:
+        assert db.execute("SELECT COUNT(*) FROM cards WHERE key = 'c3.png'").fetchone() == (0,)
+
+
+def test_cards_saved_through_the_hook_are_not_reindexed_by_the_next_scan(tmp_path):
+    root = _library(tmp_path)
+    library = CharacterLibrary(str(root), max_workers=1).watch_saves()
+    library.scan()
+    character = AICharacter()
+    character.name = "Hooked"
+    character.save_to_json(str(root / "hooked.json"))
+    assert [hit.name for hit in library.search("hooked")] == ["Hooked"]
+
+    logged = []
+    log = library.index._log
+    library.index._log = lambda op: (logged.append(op), log(op))
+    assert library.scan().parsed == 1
+    assert logged == []
+    library.close()
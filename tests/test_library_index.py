@@ -0,0 +1,66 @@
+from memchat.library_index import LibraryIndex
+
+
+def _card(i, tags=("fantasy",)):
+    return {"name": f"Card {i}", "data": {"name": f"Card {i}", "tags": list(tags), "creator": "anon",
+                                          "description": f"number {i}"}}
+
+
+def test_reload_then_grow_past_capacity(tmp_path):
+    index = LibraryIndex(str(tmp_path))
+    for i in range(1001):
+        index.put(f"c{i}.png", _card(i))
+    index.flush()
+    index.close()
+
+    index = LibraryIndex(str(tmp_path))
+    for i in range(1001, 2600):
+        index.put(f"c{i}.png", _card(i))
+
+    assert len(index) == 2600
+    assert index.tags()["fantasy"] == 2600
+    assert len(index.search(tags=["fantasy"], limit=None)) == 2600
+
+
+def test_compact_keeps_tags_and_names(tmp_path):
+    index = LibraryIndex(str(tmp_path))
+    for i in range(1500):
+        index.put(f"c{i}.png", _card(i, tags=("even",) if i % 2 == 0 else ("odd",)))
+    for i in range(0, 1500, 3):
+        index.remove(f"c{i}.png")
+    index.flush()
+    index.close()
+
+    index = LibraryIndex(str(tmp_path))
+    assert len(index) == 1000
+    assert index.tags() == {"even": 500, "odd": 500}
+    assert [hit.key for hit in index.autocomplete("card 14", limit=3)] == ["c14.png", "c140.png", "c1400.png"]
+    index.put("c3000.png", _card(3000, tags=("odd",)))
+    assert index.tags()["odd"] == 501
+
+
+def test_autocomplete_and_search_see_unflushed_puts(tmp_path):
+    index = LibraryIndex(str(tmp_path))
+    for name in ("Zed", "Alice Liddell", "alfred"):
+        index.put(f"{name}.png", {"name": name})
+
+    assert [hit.name for hit in index.autocomplete("al")] == ["alfred", "Alice Liddell"]
+    assert [hit.name for hit in index.autocomplete("lid")] == ["Alice Liddell"]
+    index.put("Albert.png", {"name": "Albert"})
+    assert sorted(hit.name for hit in index.search("al")) == ["Albert", "Alice Liddell", "alfred"]
+
+
+def test_updates_after_a_torn_journal_line_survive_reload(tmp_path):
+    index = LibraryIndex(str(tmp_path))
+    index.put("c1.png", _card(1))
+    index.close()
+    with open(index.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"op":"put","key":"c2.png","fie')  # crash mid-write
+
+    index = LibraryIndex(str(tmp_path))
+    assert len(index) == 1
+    index.put("c3.png", _card(3))
+    index.close()
+
+    index = LibraryIndex(str(tmp_path))
+    assert sorted(hit.key for hit in index.search(limit=None)) == ["c1.png", "c3.png"]
@@ -0,0 +1,66 @@
+from memchat.character_system import AICharacter
+from memchat.lorebook import Lorebook, lorebook_from_card_cached
+from memchat.main import chat_agent
+from memchat.providers.stub import StubProvider
+
+
+def _book(*entries, **options):
+    return {"entries": [dict(entry, id=i, content=entry.get("content", f"entry {i}"))
+                        for i, entry in enumerate(entries)], **options}
+
+
+def _active(lorebook, text):
+    return [e.id for e in lorebook.activate([{"role": "user", "content": text}]).entries]
+
+
+def test_keyword_activation_matches_whole_words_case_insensitively():
+    lorebook = Lorebook.from_card(_book({"keys": ["Dragon", "wyrm"]}, {"keys": ["castle"]},
+                                        {"keys": ["x"], "constant": True}))
+    assert _active(lorebook, "A DRAGON appears") == [0, 2]
+    assert _active(lorebook, "the wyrms and the Castle") == [1, 2]
+    assert _active(lorebook, "dragonfly") == [2]
+
+
+def test_selective_entries_need_a_secondary_key():
+    lorebook = Lorebook.from_card(_book({"keys": ["sword"], "secondary_keys": ["forge", "smith"], "selective": True},
+                                        {"keys": ["smith"]}))
+    assert _active(lorebook, "a sword") == []
+    assert _active(lorebook, "the smith's sword") == [0, 1]
+    # Secondary keys alone do not activate an entry.
+    assert _active(lorebook, "the forge") == []
+
+
+def test_case_sensitive_keys():
+    lorebook = Lorebook.from_card(_book({"keys": ["May"], "case_sensitive": True}, {"keys": ["june"]}))
+    assert _active(lorebook, "May said hi in June") == [0, 1]
+    assert _active(lorebook, "you may go") == []
+
+
+def test_recursion_and_budget():
+    lorebook = Lorebook.from_card(_book({"keys": ["elf"], "content": "Elves live in the forest.", "priority": 1},
+                                        {"keys": ["forest"], "content": "The forest is dark.", "priority": 5},
+                                        recursive_scanning=True, token_budget=6))
+    activation = lorebook.activate([{"role": "user", "content": "an elf"}])
+    assert [e.id for e in activation.entries] == [1] and activation.dropped == 1
+
+
+def test_compiled_books_are_shared_by_content():
+    book = _book({"keys": ["dragon"]})
+    first = lorebook_from_card_cached(book)
+    assert lorebook_from_card_cached(_book({"keys": ["dragon"]})) is first
+    assert lorebook_from_card_cached(_book({"keys": ["wyrm"]})) is not first
+    assert lorebook_from_card_cached(None) is None and lorebook_from_card_cached({"entries": []}) is None
+
+
+def test_entries_are_placed_by_position():
+    character = AICharacter()
+    character.name = "Alice"
+    character.data_description = "A knight."
+    character.data_character_book = _book({"keys": ["dragon"], "content": "Dragons breathe fire."},
+                                          {"keys": ["dragon"], "content": "{{char}} fears dragons.",
+                                           "position": "after_char"})
+    agent = chat_agent(character, provider=StubProvider())
+    agent.messages.append({"role": "user", "content": "Look, a dragon!"})
+    prompt = agent.build_context().system_prompt
+    assert prompt.index("Dragons breathe fire.") < prompt.index("A knight.") < prompt.index("Alice fears dragons.")
+    assert agent.lorebook is chat_agent(character.copy(), provider=StubProvider()).lorebook
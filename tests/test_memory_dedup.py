@@ -0,0 +1,51 @@
+import numpy as np
+
+from memchat.memory_dedup import MemoryDeduper
+from memchat.memory_store import VectorMemoryStore
+
+TEXT = "Alice told me her favourite colour is green and she keeps a cat named Pepper."
+NEAR = "Alice told me her favourite colour is green and she keeps a cat named Pepper!"
+OTHER = "The weather in the mountains turned cold and the road to the pass was closed."
+
+
+def _vectors(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, 16)).astype(np.float32)
+
+
+def _deduper(tmp_path):
+    return MemoryDeduper(VectorMemoryStore(str(tmp_path), dim=16))
+
+
+def test_near_duplicates_merge_within_a_session(tmp_path):
+    deduper = _deduper(tmp_path)
+    first = deduper.add(_vectors(2), [TEXT, OTHER], session="A", timestamps=[1.0, 1.0])
+    again = deduper.add(_vectors(2, seed=1), [NEAR, NEAR], session="A", timestamps=[5.0, 6.0])
+    assert again.tolist() == [first[0], first[0]]
+    assert len(deduper) == 2
+    assert deduper.store.counts[first[0]] == 3 and deduper.store.timestamps[first[0]] == 6.0
+    assert (deduper.stats.inserted, deduper.stats.merged) == (2, 2)
+
+
+def test_same_text_in_another_session_is_kept(tmp_path):
+    deduper = _deduper(tmp_path)
+    vectors = _vectors(1)
+    a = deduper.add(vectors, [TEXT], session="A")
+    b = deduper.add(vectors, [TEXT], session="B")
+    none = deduper.add(vectors, [TEXT])
+    assert len({int(a[0]), int(b[0]), int(none[0])}) == 3
+    assert [h.record["text"] for h in deduper.search(vectors[0], k=1, session="B")[0]] == [TEXT]
+    assert deduper.store.counts[a[0]] == 1
+    assert deduper.add(vectors, [NEAR], session="B").tolist() == b.tolist()
+
+
+def test_dedup_existing_stays_within_sessions(tmp_path):
+    store = VectorMemoryStore(str(tmp_path), dim=16)
+    store.add(_vectors(3), [TEXT, NEAR, OTHER], session="A")
+    store.add(_vectors(1), [TEXT], session="B")
+    deduper = MemoryDeduper(store)
+    assert deduper.dedup_existing() == 1
+    assert store.counts[:4].tolist() == [2, 0, 1, 1]
+
+    store.close()
+    reopened = MemoryDeduper(VectorMemoryStore(str(tmp_path)))
+    assert reopened.add(_vectors(1), [NEAR], session="B").tolist() == [3]
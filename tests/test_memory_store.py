@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import pytest
+
+from memchat.memory_store import VectorMemoryStore
+
+
+def _clustered(n, dim=32, topics=100, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dim))
+    return (centers[rng.integers(0, topics, n)] + 0.5 * rng.standard_normal((n, dim))).astype(np.float32)
+
+
+def _store(path, vectors, sessions=("a",)):
+    store = VectorMemoryStore(str(path), dim=vectors.shape[1])
+    store.min_index_rows = 1000
+    store.max_unindexed_rows = 1000
+    for i in range(0, len(vectors), 500):
+        stop = min(i + 500, len(vectors))
+        store.add(vectors[i:stop], [f"m{j}" for j in range(i, stop)],
+                  session=sessions[(i // 500) % len(sessions)], timestamps=[float(j) for j in range(i, stop)])
+    return store
+
+
+def _indices(hits):
+    return [hit.index for hit in hits]
+
+
+def test_small_store_is_not_indexed(tmp_path):
+    store = _store(tmp_path, _clustered(800))
+    store.flush()
+    assert store._ivf is None
+    assert not [name for name in os.listdir(tmp_path) if name.startswith("ivf-")]
+
+
+def test_indexed_search_matches_exact(tmp_path):
+    vectors = _clustered(6000)
+    store = _store(tmp_path, vectors)
+    assert store._ivf is not None and store._ivf.count >= 5000
+    queries = vectors[::600] + 0.01
+    nlist = len(store._ivf.centroids)
+    probed_all = store.search(queries, k=5, with_records=False, nprobe=nlist)
+    exact = store.search(queries, k=5, with_records=False, exact=True)
+    assert [_indices(h) for h in probed_all] == [_indices(h) for h in exact]
+    assert [h[0].score for h in probed_all] == pytest.approx([h[0].score for h in exact], abs=1e-5)
+
+    default = store.search(queries, k=5, with_records=False)
+    recall = np.mean([len(set(_indices(a)) & set(_indices(b))) / 5 for a, b in zip(default, exact)])
+    assert recall >= 0.9
+
+
+def test_unindexed_tail_is_searched(tmp_path):
+    vectors = _clustered(5000)
+    store = _store(tmp_path, vectors)
+    indexed = store._ivf.count
+    extra = np.eye(32, dtype=np.float32)[:3]
+    rows = store.add(extra, ["x", "y", "z"])
+    assert store._ivf.count == indexed
+    hits = store.search(extra[1], k=1)[0]
+    assert hits[0].index == rows[1] and hits[0].record["text"] == "y"
+
+
+def test_filters_and_merged_rows(tmp_path):
+    vectors = _clustered(6000)
+    store = _store(tmp_path, vectors, sessions=("a", "b", "c"))
+    query = vectors[4321]
+    for filters in ({"session": "b"}, {"since": 1000.0, "until": 2500.0}, {"session": ["a", "c"], "since": 3000.0}):
+        approx = store.search(query, k=5, with_records=False, **filters)[0]
+        exact = store.search(query, k=5, with_records=False, exact=True, **filters)[0]
+        assert approx[0].index == exact[0].index
+        assert all(store.search(q, 1, with_records=False, exact=True, **filters)[0]
+                   for q in [vectors[h.index] for h in approx])
+
+    # Filters matching fewer rows than the probed lists hold fall back to the exact scan.
+    narrow = store.search(query, k=5, with_records=False, since=10.0, until=13.0)[0]
+    assert sorted(_indices(narrow)) == [10, 11, 12]
+
+    store.merge([0], [4321])
+    assert 4321 not in _indices(store.search(query, k=5, with_records=False)[0])
+
+
+def test_index_survives_reopen(tmp_path):
+    vectors = _clustered(6000)
+    store = _store(tmp_path, vectors)
+    generation = store._index_generation
+    store.close()
+
+    store = VectorMemoryStore(str(tmp_path))
+    assert store._index_generation == generation
+    assert store._ivf is not None and store._ivf.count == 6000
+    assert _indices(store.search(vectors[17], k=1, with_records=False)[0]) == [17]
+    store.build_index()
+    assert store._index_generation == generation + 1
+    assert sorted(name for name in os.listdir(tmp_path) if name.startswith("ivf-")) == [
+        f"ivf-{generation + 1}-codes.npy", f"ivf-{generation + 1}.npz"]
+
+
+def test_uncommitted_index_generation_is_ignored(tmp_path):
+    vectors = _clustered(3000)
+    store = _store(tmp_path, vectors)
+    generation = store._index_generation
+    store.close()
+    # A build interrupted before meta.json named it.
+    for suffix in (".npz", "-codes.npy"):
+        with open(os.path.join(tmp_path, f"ivf-{generation + 1}{suffix}"), "wb") as f:
+            f.write(b"partial")
+
+    store = VectorMemoryStore(str(tmp_path))
+    assert store._index_generation == generation
+    assert not os.path.exists(os.path.join(tmp_path, f"ivf-{generation + 1}.npz"))
+    assert _indices(store.search(vectors[5], k=1, with_records=False)[0]) == [5]
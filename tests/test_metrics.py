@@ -0,0 +1,86 @@
+import json
+import urllib.request
+
+import pytest
+
+from memchat.metrics import Metrics
+
+
+def _metrics():
+    return Metrics(enabled=True, buckets=(0.01, 0.1))
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics()
+    metrics.inc("requests")
+    with metrics.span("work_seconds"):
+        pass
+    assert metrics.snapshot()["counters"] == [] and metrics.snapshot()["histograms"] == []
+
+
+def test_counters_and_spans_in_snapshot():
+    metrics = _metrics()
+    metrics.inc("requests", provider="stub")
+    metrics.inc("requests", 2, provider="stub")
+    metrics.observe("load_seconds", 0.005, format="png")
+    metrics.observe("load_seconds", 0.05, format="png")
+    metrics.observe("load_seconds", 1.0, format="png")
+    with pytest.raises(ValueError):
+        with metrics.span("parse_seconds"):
+            raise ValueError("bad card")
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == [
+        {"name": "parse_errors", "labels": {}, "value": 1},
+        {"name": "requests", "labels": {"provider": "stub"}, "value": 3},
+    ]
+    load = next(h for h in snapshot["histograms"] if h["name"] == "load_seconds")
+    assert load["labels"] == {"format": "png"} and load["count"] == 3 and load["sum"] == pytest.approx(1.055)
+    assert load["buckets"] == {"0.01": 1, "0.1": 2, "+Inf": 3}
+    assert [h["count"] for h in snapshot["histograms"] if h["name"] == "parse_seconds"] == [1]
+
+
+def test_timed_decorator_checks_enabled_per_call():
+    metrics = Metrics()
+
+    @metrics.timed("step_seconds", stage="a")
+    def step():
+        return 42
+
+    assert step() == 42 and metrics.snapshot()["histograms"] == []
+    metrics.enable()
+    step()
+    assert [(h["name"], h["labels"], h["count"]) for h in metrics.snapshot()["histograms"]] == [
+        ("step_seconds", {"stage": "a"}, 1)]
+
+
+def test_prometheus_export():
+    metrics = _metrics()
+    metrics.inc("requests", provider='st"ub')
+    metrics.observe("load_seconds", 0.05)
+    text = metrics.prometheus_text()
+    assert "# TYPE memchat_requests_total counter\n" in text
+    assert 'memchat_requests_total{provider="st\\"ub"} 1\n' in text
+    assert "# TYPE memchat_load_seconds histogram\n" in text
+    assert 'memchat_load_seconds_bucket{le="0.01"} 0\n' in text
+    assert 'memchat_load_seconds_bucket{le="+Inf"} 1\n' in text
+    assert "memchat_load_seconds_count 1\n" in text
+
+
+def test_http_and_file_export(tmp_path):
+    metrics = _metrics()
+    metrics.inc("requests")
+    server = metrics.serve(port=0)
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(base + "/metrics") as response:
+            assert b"memchat_requests_total 1" in response.read()
+        with urllib.request.urlopen(base + "/metrics.json") as response:
+            assert json.load(response)["counters"][0]["name"] == "requests"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    path = tmp_path / "metrics.json"
+    metrics.write_snapshot(str(path))
+    assert json.loads(path.read_text())["counters"][0]["value"] == 1
@@ -0,0 +1,79 @@
+import base64
+import json
+import struct
+import zlib
+
+import pytest
+
+from memchat.character_system import AICharacter
+from memchat.png_card import _make_chunk, iter_card_text_chunks, locate_card_json, read_card_json, write_card_to_png
+
+
+def _png(path, before=(), after=()):
+    ihdr = struct.pack(">IIBBBBB", 1, 1, 8, 6, 0, 0, 0)
+    idat = zlib.compress(b"\x00\x00\x00\x00\x00")
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n" + _make_chunk(b"IHDR", ihdr) + b"".join(before)
+                + _make_chunk(b"IDAT", idat[:4]) + _make_chunk(b"IDAT", idat[4:]) + b"".join(after)
+                + _make_chunk(b"IEND", b""))
+    return str(path)
+
+
+def _payload(name):
+    return base64.b64encode(json.dumps({"name": name, "description": "text"}).encode("utf-8"))
+
+
+def _text(keyword, text):
+    return _make_chunk(b"tEXt", keyword + b"\x00" + text)
+
+
+def _ztxt(keyword, text):
+    return _make_chunk(b"zTXt", keyword + b"\x00\x00" + zlib.compress(text))
+
+
+def _itxt(keyword, text, compressed=False):
+    body = zlib.compress(text) if compressed else text
+    return _make_chunk(b"iTXt", keyword + b"\x00" + bytes([int(compressed), 0]) + b"en\x00\x00" + body)
+
+
+@pytest.mark.parametrize("chunk", [
+    _text(b"chara", _payload("Plain")),
+    _ztxt(b"chara", _payload("Plain")),
+    _itxt(b"chara", _payload("Plain")),
+    _itxt(b"chara", _payload("Plain"), compressed=True),
+])
+def test_card_is_read_from_each_text_chunk_type(tmp_path, chunk):
+    path = _png(tmp_path / "card.png", before=[chunk])
+    assert read_card_json(path)["name"] == "Plain"
+
+
+def test_ccv3_wins_over_chara(tmp_path):
+    path = _png(tmp_path / "card.png", before=[_text(b"chara", _payload("V2")), _itxt(b"ccv3", _payload("V3"))])
+    chunk, data = locate_card_json(path)
+    assert data["name"] == "V3" and chunk.keyword == "ccv3" and chunk.chunk_type == b"iTXt"
+
+
+def test_card_after_image_data_is_found(tmp_path):
+    path = _png(tmp_path / "card.png", before=[_text(b"Software", b"paint")],
+                after=[_text(b"chara", _payload("Late"))])
+    with open(path, "rb") as f:
+        assert [c.keyword for c in iter_card_text_chunks(f)] == ["Software", "chara"]
+    assert read_card_json(path)["name"] == "Late"
+    assert AICharacter.load_from_file(path).name == "Late"
+    assert AICharacter.load_from_file(path, lazy=True).description == "text"
+
+
+def test_card_before_image_data_wins_over_a_later_one(tmp_path):
+    path = _png(tmp_path / "card.png", before=[_text(b"chara", _payload("Early"))],
+                after=[_text(b"ccv3", _payload("Late"))])
+    assert read_card_json(path)["name"] == "Early"
+
+
+def test_write_replaces_ccv3_with_a_v2_chara_chunk(tmp_path):
+    base = _png(tmp_path / "base.png", before=[_itxt(b"ccv3", _payload("V3")), _text(b"chara", _payload("V2"))],
+                after=[_text(b"Comment", b"kept")])
+    out = str(tmp_path / "out.png")
+    write_card_to_png(base, out, _payload("Saved").decode("ascii"))
+    with open(out, "rb") as f:
+        assert [c.keyword for c in iter_card_text_chunks(f)] == ["chara", "Comment"]
+    assert read_card_json(out)["name"] == "Saved"
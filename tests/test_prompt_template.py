@@ -0,0 +1,88 @@
+import copy
+import pickle
+
+from memchat.character_system import AICharacter
+from memchat.prompt_template import compile_template, render_cache
+
+
+def _character():
+    character = AICharacter.from_dict({
+        "name": "Ada",
+        "data": {
+            "name": "Ada",
+            "description": "{{char}} is an engineer.",
+            "first_mes": "Hi {{user}}, I am {{char}}.",
+            "alternate_greetings": ["Welcome back, {{user}}."],
+            "system_prompt": "Be {{char}}. {{original}}",
+        },
+    })
+    return character
+
+
+def test_compile_template_renders_macros():
+    template = compile_template("{{char}} meets {{ USER }}{{unknown}} [{{original}}]")
+    assert template.render({"char": "A", "user": "B", "original": "o"}) == "A meets B{{unknown}} [o]"
+    assert template.is_static
+    assert not compile_template("It is {{time}}").is_static
+
+
+def test_initial_message_renders_and_is_cached():
+    character = _character()
+    context, first = character.get_initial_llm_message("Bob")
+    assert first == "Hi Bob, I am Ada."
+    assert "Ada is an engineer." in context
+    hits = render_cache.hits
+    assert character.get_initial_llm_message("Bob") == (context, first)
+    assert render_cache.hits == hits + 2
+    assert character.get_initial_llm_message("Bob", 1)[1] == "Welcome back, Bob."
+
+
+def test_assignment_invalidates_cache():
+    character = _character()
+    character.get_initial_llm_message("Bob")
+    character.data_first_mes = "Yo {{user}}."
+    assert character.get_initial_llm_message("Bob")[1] == "Yo Bob."
+
+
+def test_in_place_list_edit_invalidates_cache():
+    character = _character()
+    character.get_initial_llm_message("Bob", 1)
+    character.data_alternate_greetings[0] = "Changed, {{user}}."
+    assert character.get_initial_llm_message("Bob", 1)[1] == "Changed, Bob."
+
+
+def test_copies_share_render_cache_entries():
+    original = _character()
+    original.get_initial_llm_message("Bob")
+    session_copy = original.copy()
+    hits = render_cache.hits
+    session_copy.get_initial_llm_message("Bob")
+    assert render_cache.hits == hits + 2
+    session_copy.data_description = "Different."
+    assert "Different." in session_copy.get_initial_llm_message("Bob")[0]
+    assert "Different." not in original.get_initial_llm_message("Bob")[0]
+
+
+def test_original_macro():
+    character = _character()
+    assert character.parse_names("Bob", character.get_system_prompt(), "Default prompt.") == "Be Ada. Default prompt."
+    assert character.parse_names("Bob", character.get_system_prompt()) == "Be Ada. "
+
+
+def test_pickle_and_copy_roundtrip():
+    character = _character()
+    character.get_initial_llm_message("Bob")
+    for clone in (pickle.loads(pickle.dumps(character)), copy.copy(character), copy.deepcopy(character)):
+        assert clone.name == "Ada"
+        assert clone.data_alternate_greetings == ["Welcome back, {{user}}."]
+        assert clone.get_initial_llm_message("Bob") == character.get_initial_llm_message("Bob")
+
+
+def test_pickle_lazy_card(tmp_path):
+    path = tmp_path / "ada.json"
+    _character().save_to_json(str(path))
+    lazy = AICharacter.load_from_file(str(path), lazy=True)
+    assert lazy.is_lazy
+    clone = pickle.loads(pickle.dumps(lazy))
+    assert clone.is_lazy
+    assert clone.data_description == "{{char}} is an engineer."
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+
+import pytest
+
+from memchat.providers import CacheMissError, CachingProvider, ResponseCache
+from memchat.providers.stub import StubProvider
+
+MESSAGES = [{"role": "user", "content": "hello there"}]
+
+
+def test_provider_is_usable_from_several_event_loops():
+    provider = StubProvider(first_token_latency=0.01, token_latency=0.0, max_concurrency=1)
+
+    async def contended():
+        # The second reply waits for the slot, which ties a semaphore to this loop.
+        return await asyncio.gather(provider.complete(MESSAGES), provider.complete(MESSAGES))
+
+    assert all("hello there" in reply for reply in asyncio.run(contended()))
+    assert all("hello there" in reply for reply in asyncio.run(contended()))
+
+    errors = []
+
+    def other_thread():
+        try:
+            asyncio.run(contended())
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    thread.join()
+    assert not errors and provider.requests == 6
+
+
+def test_in_flight_counts_held_slots():
+    provider = StubProvider(first_token_latency=0.05, token_latency=0.0, max_concurrency=2)
+
+    async def run():
+        tasks = [asyncio.create_task(provider.complete(MESSAGES)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        during = provider.in_flight
+        await asyncio.gather(*tasks)
+        return during
+
+    assert asyncio.run(run()) == 2
+    assert provider.in_flight == 0
+
+
+def _replies(*texts):
+    replies = iter(texts)
+    return StubProvider(first_token_latency=0.0, token_latency=0.0, reply_fn=lambda messages, system: next(replies))
+
+
+def _chunks(provider, messages=MESSAGES, system_prompt="sys"):
+    async def run():
+        return [chunk async for chunk in provider.stream(messages, system_prompt)]
+    return asyncio.run(run())
+
+
+def test_cached_reply_is_replayed_chunk_by_chunk(tmp_path):
+    inner = _replies("one two three", "other reply")
+    provider = CachingProvider(inner, ResponseCache(str(tmp_path / "cache.sqlite")))
+    first = _chunks(provider)
+    assert first == ["one ", "two ", "three"]
+    # Extra message fields and key order do not change the request key.
+    assert _chunks(provider, [{"content": "hello there", "role": "user", "id": 7}]) == first
+    assert inner.requests == 1 and provider.cache.stats()["hits"] == 1
+    provider.cache.close()
+
+    reopened = CachingProvider(_replies(), ResponseCache(str(tmp_path / "cache.sqlite")), mode="offline")
+    assert _chunks(reopened) == first
+    with pytest.raises(CacheMissError):
+        _chunks(reopened, system_prompt="another system prompt")
+    reopened.cache.close()
+
+
+def test_offline_mode_raises_on_a_miss(tmp_path):
+    inner = _replies("never sent")
+    provider = CachingProvider(inner, ResponseCache(str(tmp_path / "cache.sqlite")), mode="offline")
+    with pytest.raises(CacheMissError):
+        _chunks(provider)
+    assert inner.requests == 0
+    provider.cache.close()
+
+
+def test_refresh_mode_overwrites_the_recording(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    _chunks(CachingProvider(_replies("old reply"), cache))
+    inner = _replies("new reply")
+    assert _chunks(CachingProvider(inner, cache, mode="refresh")) == ["new ", "reply"]
+    assert inner.requests == 1
+    assert _chunks(CachingProvider(_replies(), cache)) == ["new ", "reply"]
+    assert len(cache) == 1
+    cache.close()
@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+import pytest
+
+from memchat.character_cache import CharacterCache
+from memchat.character_system import AICharacter
+from memchat.history import ChatHistoryLog
+from memchat.providers import StubProvider
+from memchat.providers.http import HTTPConnectionPool
+from memchat.server import ChatServer, HTTPRequestError, SessionBusyError, TurnCancelledError
+
+
+@pytest.fixture
+def characters_dir(tmp_path):
+    directory = tmp_path / "characters"
+    directory.mkdir()
+    character = AICharacter()
+    character.name = "Ada"
+    character.first_mes = "Hello, {{user}}."
+    character.save_to_json(str(directory / "ada.json"))
+    return directory
+
+
+def _server(characters_dir, history_dir=None, **kwargs):
+    provider = StubProvider(first_token_latency=0.0, token_latency=0.01)
+    return ChatServer(str(characters_dir), provider=provider, history_dir=history_dir and str(history_dir),
+                      cache=CharacterCache(), **kwargs)
+
+
+async def _reply(turn):
+    return "".join([chunk async for chunk in turn.chunks()])
+
+
+def test_close_session_records_partial_reply(characters_dir, tmp_path):
+    history_dir = tmp_path / "history"
+
+    async def main():
+        server = _server(characters_dir, history_dir)
+        session = server.create_session("ada.json", "Bob")
+        turn = session.submit("one two three four five six seven eight nine ten")
+        chunks = turn.chunks()
+        await chunks.__anext__()
+        assert await server.close_session(session.id)
+        with pytest.raises(TurnCancelledError, match="interrupted"):
+            async for _ in chunks:
+                pass
+        assert session.id not in server.sessions
+        await server.provider.aclose()
+        return session.id, turn.text
+
+    session_id, partial = asyncio.run(main())
+    records = list(ChatHistoryLog(str(history_dir / session_id)))
+    assert [r["role"] for r in records] == ["assistant", "user", "assistant"]
+    assert records[-1]["content"] == partial and partial
+
+
+def test_closing_session_rejects_new_turns(characters_dir):
+    async def main():
+        server = _server(characters_dir)
+        session = server.create_session("ada.json")
+        session.submit("hi")
+        closing = asyncio.create_task(server.close_session(session.id))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPRequestError) as excinfo:
+            session.submit("again")
+        assert excinfo.value.status == 409
+        await closing
+        await server.provider.aclose()
+
+    asyncio.run(main())
+
+
+def test_queue_limit(characters_dir):
+    async def main():
+        server = _server(characters_dir, max_pending=2)
+        session = server.create_session("ada.json")
+        first, second = session.submit("a"), session.submit("b")
+        with pytest.raises(SessionBusyError):
+            session.submit("c")
+        assert "a" in await _reply(first) and "b" in await _reply(second)
+        await server.shutdown(drain_timeout=1.0)
+
+    asyncio.run(main())
+
+
+def test_evicted_session_is_restored(characters_dir, tmp_path):
+    async def main():
+        server = _server(characters_dir, tmp_path / "history")
+        session = server.create_session("ada.json", "Bob")
+        await _reply(session.submit("remember the lighthouse"))
+        await session.wait_idle()
+        server._evict_idle(force=True)
+        assert session.id not in server.sessions
+
+        restored = server.get_session(session.id)
+        assert restored is not session
+        assert restored.agent.user_name == "Bob"
+        assert [m["role"] for m in restored.agent.messages] == ["assistant", "user", "assistant"]
+        assert restored.agent.messages[1]["content"] == "remember the lighthouse"
+        assert server.stats.sessions_restored == 1
+        await server.shutdown(drain_timeout=1.0)
+
+    asyncio.run(main())
+
+
+def test_http_session_lifecycle(characters_dir):
+    async def main():
+        server = _server(characters_dir)
+        host, port = await server.start("127.0.0.1", 0)
+        pool = HTTPConnectionPool(f"http://{host}:{port}")
+        headers = {"Content-Type": "application/json"}
+        try:
+            response = await pool.request("POST", "/sessions", headers,
+                                          json.dumps({"character": "ada.json", "user_name": "Bob"}).encode())
+            created = json.loads(await response.read())
+            assert response.status == 201
+            assert created["first_message"] == "Hello, Bob."
+            session_id = created["session_id"]
+
+            response = await pool.request("POST", f"/sessions/{session_id}/messages", headers,
+                                          json.dumps({"content": "ping"}).encode())
+            reply = json.loads(await response.read())
+            assert response.status == 200 and "ping" in reply["reply"] and not reply["interrupted"]
+
+            response = await pool.request("DELETE", f"/sessions/{session_id}")
+            await response.read()
+            assert response.status == 204
+            response = await pool.request("GET", f"/sessions/{session_id}")
+            await response.read()
+            assert response.status == 404
+        finally:
+            await pool.aclose()
+            await server.shutdown(drain_timeout=1.0)
+
+    asyncio.run(main())